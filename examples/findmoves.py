@@ -4,18 +4,16 @@ from scrabbler.board import Board
 from scrabbler.move import Move
 from scrabbler.lexicon import Lexicon
 
-# Load a lexicon
-# Let's use /usr/share/dict/words on this system
-l = Lexicon()
-with open('/usr/share/dict/words') as words:
-    for word in words:
-        l.add(word.rstrip().upper())
-
 # Let's use the official variant, "scrabble".
 # Variants are different board layouts and letter distributions, stored
 # as JSON files in the variants/ directory
 b = Board(variant='scrabble')
 
+# Load a lexicon
+# Let's use /usr/share/dict/words on this system
+# Passing the board skips words that can't be played on it
+l = Lexicon.from_file('/usr/share/dict/words', board=b)
+
 # Play a few words
 b.play(Move(row=6, col=7, kind=Move.MOVE_DOWN, word="DoGGED"))
 b.play(Move(row=7, col=6, kind=Move.MOVE_ACROSS, word="BoSS", tmask=[True,False,True,True]))
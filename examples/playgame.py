@@ -24,20 +24,18 @@ class MyPlayer(player.Player):
 # Let's play a game!
 
 # First load a lexicon. Let's use /usr/share/dict/words on this system
-l = Lexicon()
-with open('/usr/share/dict/words') as words:
-    for word in words:
-        l.add(word.rstrip().upper())
+# Passing a board skips words that can't be played in its variant
+l = Lexicon.from_file('/usr/share/dict/words', board=Board())
 
 # Set up the players.
-# They can share a lexicon (since they won't change it) but each needs
-# their own board
-player1 = player.MaxScorePlayer(lexicon=l, board=Board())
-player2 = MyPlayer(lexicon=l, board=Board())
+# They can share a lexicon (since they won't change it)
+player1 = player.MaxScorePlayer(lexicon=l)
+player2 = MyPlayer(lexicon=l)
 
 # Set up a referee.
-# It needs its own board too
-referee = Referee(player1=player1, player2=player2, lexicon=l, board=Board())
+# It owns the board, and with share_board the players look at it through
+# read-only views instead of keeping boards of their own
+referee = Referee(player1=player1, player2=player2, lexicon=l, board=Board(), share_board=True)
 
 # Run the game
 game = referee.run()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+# Measure how move generation on a single board scales with the size of
+# the board and the number of worker processes.
+
+import argparse
+import random
+import time
+
+from scrabbler.board import Board
+from scrabbler.lexicon import Lexicon
+from scrabbler.parallel import MovePool
+
+parser = argparse.ArgumentParser(description='Benchmark parallel move generation.')
+parser.add_argument('--words', metavar="word-list", default='/usr/share/dict/words', help="load word list from this file")
+parser.add_argument('--variants', metavar="variant", nargs='+', default=['scrabble', 'super'], help="variants to benchmark")
+parser.add_argument('--workers', metavar="n", type=int, nargs='+', default=[1, 2, 4], help="worker counts to benchmark")
+parser.add_argument('--moves', metavar="n", type=int, default=10, help="moves to play before measuring")
+parser.add_argument('--rack', default='AEINST?', help="rack to find moves for")
+parser.add_argument('--repeat', metavar="n", type=int, default=3, help="take the best of this many runs")
+parser.add_argument('--seed', type=int, default=0, help="random seed for setting up the board")
+args = parser.parse_args()
+
+print "{0:10s} {1:>4s} {2:>8s} {3:>8s} {4:>10s} {5:>8s}".format("variant", "dim", "workers", "moves", "time (ms)", "speedup")
+
+for variant in args.variants:
+    board = Board(variant=variant)
+    lexicon = Lexicon.from_file(args.words, board=board)
+
+    # Get a typical mid-game position by playing the highest scoring move
+    # for a few random racks
+    random.seed(args.seed)
+    bag = board.alltiles
+    random.shuffle(bag)
+    for i in range(args.moves):
+        rack, bag = bag[:board.rack_size], bag[board.rack_size:]
+        moves = board.valid_moves(rack, lexicon)
+        if moves:
+            board.play(max(moves, key = lambda x: x.score))
+
+    baseline = None
+    for workers in args.workers:
+        pool = MovePool(lexicon, workers, variant=board.variant) if workers > 1 else None
+        best = None
+        for i in range(args.repeat):
+            t_start = time.time()
+            moves = board.valid_moves(args.rack, lexicon, pool=pool)
+            t_elapsed = time.time() - t_start
+            best = t_elapsed if best is None else min(best, t_elapsed)
+        if pool:
+            pool.close()
+
+        if baseline is None:
+            baseline = best
+
+        print "{0:10s} {1:4d} {2:8d} {3:8d} {4:10.1f} {5:8.2f}".format(variant, board.dim, workers, len(moves), best * 1000, baseline / best)
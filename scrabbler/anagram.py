@@ -0,0 +1,120 @@
+import itertools
+
+class AnagramIndex:
+    """Secondary index over the words of a lexicon, for queries that only
+    depend on a set of tiles rather than a position on the board.
+
+    Words are grouped by their sorted letters, so finding every word made of
+    exactly some tiles is a single lookup. Blanks (?) in the tiles can stand
+    for any letter of the alphabet.
+
+    >>> from anagram import AnagramIndex
+    >>> i = AnagramIndex(['ACT', 'CAT', 'TAC', 'CATS', 'SCAT', 'AT', 'TA', 'ZA', 'DOG'])
+    >>> i.anagrams('TCA')
+    ['ACT', 'CAT', 'TAC']
+    >>> i.anagrams('TC?')
+    ['ACT', 'CAT', 'TAC']
+    >>> i.anagrams('TAXC')
+    []
+    >>> i.subanagrams('CAT')
+    ['ACT', 'AT', 'CAT', 'TA', 'TAC']
+    >>> i.subanagrams('AT?', minlength=3)
+    ['ACT', 'CAT', 'TAC']
+    >>> i.pattern('?A??')
+    ['CATS']
+    >>> i.pattern('?A')
+    ['TA', 'ZA']
+    >>> i.pattern('?A', tiles='AT')
+    ['TA']
+    >>> i.pattern('?A', tiles='A?')
+    ['TA', 'ZA']
+    """
+
+    def __init__(self, words):
+        # Sorted letters -> words made of exactly those letters
+        self.by_letters = {}
+
+        # Length -> words of that length
+        self.by_length = {}
+
+        # (length, position, letter) -> set of words with that letter there
+        self.by_position = {}
+
+        letters = set()
+        for word in words:
+            self.by_letters.setdefault(''.join(sorted(word)), []).append(word)
+            self.by_length.setdefault(len(word), []).append(word)
+            for i, letter in enumerate(word):
+                self.by_position.setdefault((len(word), i, letter), set()).add(word)
+            letters.update(word)
+
+        # Letters a blank may stand for
+        self.alphabet = sorted(letters)
+
+    def anagrams(self, tiles):
+        """Sorted list of words using exactly these tiles."""
+
+        letters = [tile for tile in tiles if tile != '?']
+        blanks = len(tiles) - len(letters)
+
+        words = set()
+        for fill in itertools.combinations_with_replacement(self.alphabet, blanks):
+            words.update(self.by_letters.get(''.join(sorted(letters + list(fill))), []))
+        return sorted(words)
+
+    def subanagrams(self, tiles, minlength=1):
+        """Sorted list of words using some or all of these tiles."""
+
+        letters = sorted(tile for tile in tiles if tile != '?')
+        blanks = len(tiles) - len(letters)
+
+        # Distinct sub-multisets of the regular tiles
+        counts = [(letter, len(list(group))) for letter, group in itertools.groupby(letters)]
+        subsets = ['']
+        for letter, count in counts:
+            subsets = [subset + letter * n for subset in subsets for n in range(count + 1)]
+
+        words = set()
+        for nblanks in range(blanks + 1):
+            for fill in itertools.combinations_with_replacement(self.alphabet, nblanks):
+                for subset in subsets:
+                    if len(subset) + nblanks < minlength:
+                        continue
+                    words.update(self.by_letters.get(''.join(sorted(subset + ''.join(fill))), []))
+        return sorted(words)
+
+    def pattern(self, pattern, tiles=None):
+        """Sorted list of words matching a pattern like "?A??S", where ?
+        matches any letter. If tiles are provided, only words that could be
+        made from those tiles are returned."""
+
+        # Intersect the smallest sets first
+        constraints = [self.by_position.get((len(pattern), i, letter), set())
+                       for i, letter in enumerate(pattern) if letter != '?']
+        constraints.sort(key=len)
+
+        if constraints:
+            words = set(constraints[0])
+            for constraint in constraints[1:]:
+                words &= constraint
+        else:
+            words = set(self.by_length.get(len(pattern), []))
+
+        if tiles is not None:
+            words = [word for word in words if self._formable(word, tiles)]
+
+        return sorted(words)
+
+    @staticmethod
+    def _formable(word, tiles):
+        """Check if a word can be made from some of these tiles."""
+
+        rack = list(tiles)
+        for letter in word:
+            if letter in rack:
+                rack.remove(letter)
+            elif '?' in rack:
+                rack.remove('?')
+            else:
+                return False
+        return True
@@ -0,0 +1,102 @@
+import multiprocessing
+
+from board import Board
+from move import Move
+
+def generate_many(positions, racks, lexicon, workers=1, variant='scrabble'):
+    """Find valid moves for many (position, rack) queries at once.
+
+    Each position is a move history: a list of moves (Move objects, or
+    strings like the "move" entries recorded by Referee.run) played in order
+    onto an empty board. Returns a list with the valid moves for each
+    position and rack, in input order. Raises ValueError unless there are
+    as many racks as positions.
+
+    Queries are processed in sorted order of their histories, so positions
+    that share a prefix of moves also share the boards built for it. If
+    workers is more than 1, queries are split among a pool of that many
+    processes.
+
+    >>> import lexicon
+    >>> from batch import generate_many
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> positions = [['ABBA 8G'], [], ['ABBA 8G', 'C(A)B J7'], ['ABBA 8G']]
+    >>> racks = ['AD', 'AB', 'AAD', 'C']
+    >>> results = generate_many(positions, racks, t, variant='test')
+    >>> [len(moves) for moves in results]
+    [10, 8, 16, 0]
+    >>> sorted(str(move) for move in results[0])
+    ['(A)A G8', '(A)A J8', '(B)A H8', '(B)A I8', 'A(A) G7', 'A(A) J7', 'A(B) H7', 'A(B) I7', 'DA(B) H6', 'DA(B) I6']
+    >>> generate_many(positions, racks, t, workers=2, variant='test') == results
+    True
+    >>> generate_many(positions, racks[:3], t, variant='test')
+    Traceback (most recent call last):
+    ValueError: 4 positions but 3 racks
+    """
+
+    positions, racks = list(positions), list(racks)
+    if len(positions) != len(racks):
+        raise ValueError(str(len(positions)) + " positions but " + str(len(racks)) + " racks")
+
+    queries = []
+    for index, (position, rack) in enumerate(zip(positions, racks)):
+        queries.append((tuple(str(move) for move in position), index, list(rack)))
+    queries.sort()
+
+    if workers <= 1:
+        results = _generate(queries, lexicon, variant)
+    else:
+        # Split sorted queries into contiguous chunks, so that positions with
+        # shared prefixes mostly end up in the same process
+        nchunks = min(len(queries), 4 * workers) or 1
+        chunks = [queries[len(queries) * i // nchunks:len(queries) * (i + 1) // nchunks] for i in range(nchunks)]
+
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(lexicon, variant))
+        try:
+            results = [result for chunk in pool.map(_generate_chunk, chunks, chunksize=1) for result in chunk]
+        finally:
+            pool.close()
+            pool.join()
+
+    # Back to input order
+    moves = [None] * len(results)
+    for index, result in results:
+        moves[index] = result
+    return moves
+
+def _generate(queries, lexicon, variant):
+    """Answer queries, which must be sorted by position. Returns a list of
+    (index, moves)."""
+
+    # boards[i] is the board after the first i moves of history
+    boards = [Board(variant=variant)]
+    history = ()
+
+    results = []
+    for position, index, rack in queries:
+        # Reuse boards for the moves shared with the previous position
+        common = 0
+        while common < len(history) and common < len(position) and history[common] == position[common]:
+            common += 1
+        del boards[common + 1:]
+
+        for move in position[common:]:
+            board = boards[-1].copy()
+            board.play(Move.from_str(move))
+            boards.append(board)
+        history = position
+
+        results.append((index, boards[-1].valid_moves(rack, lexicon)))
+    return results
+
+# Set in each worker process by _init_worker
+_worker_lexicon = None
+_worker_variant = None
+
+def _init_worker(lexicon, variant):
+    global _worker_lexicon, _worker_variant
+    _worker_lexicon = lexicon
+    _worker_variant = variant
+
+def _generate_chunk(queries):
+    return _generate(queries, _worker_lexicon, _worker_variant)
@@ -1,31 +1,47 @@
-from move import Move, InvalidMoveError
-import json
+from move import Move, MoveList, InvalidMoveError
+from variant import Variant, load_variant
+import collections
+import copy
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class Board:
     """Scrabble board"""
 
+    # Whether this is a BoardView, which can't be played on
+    readonly = False
+
     def __init__(self, variant='scrabble'):
-        self.empty = True
+        """Create an empty board. variant is either the name of a variant
+        (see load_variant) or a Variant object.
+
+        >>> import board
+        >>> Board(variant='test').variant is Board(variant='test').variant
+        True
+        """
 
-        with open("variants/" + variant) as f:
-            vdat = json.loads(f.read())
+        self.empty = True
 
-        self.dim = vdat["dim"]
-        self.bingo_bonus = vdat["bingo_bonus"]
-        self.rack_size = vdat["rack_size"]
+        # Variants are shared by every board, so only the squares need to be created here
+        if not isinstance(variant, Variant):
+            variant = load_variant(variant)
+        self.variant = variant
 
-        self.letter_distribution = {}
-        for letter in vdat["letter_distribution"]:
-            self.letter_distribution[str(letter)] = vdat["letter_distribution"][letter]
+        self.dim = variant.dim
+        self.bingo_bonus = variant.bingo_bonus
+        self.rack_size = variant.rack_size
+        self.letter_distribution = variant.letter_distribution
+        self.letter_values = variant.letter_values
 
-        self.letter_values = {}
-        for letter in vdat["letter_values"]:
-            self.letter_values[str(letter)] = vdat["letter_values"][letter]
+        self.squares = [[Square(multiplier, bonus_type) for multiplier, bonus_type in row] for row in variant.bonus]
 
-        self.squares = [[Square() for i in range(self.dim)] for j in range(self.dim)]
-        for bonus in vdat["bonus"]:
-            self.squares[bonus["row"]][bonus["col"]].bonus_type = bonus["type"]
-            self.squares[bonus["row"]][bonus["col"]].bonus_multiplier = bonus["multiplier"]
+        # Things worked out from the current position (cross-checks, frozen
+        # squares for views), cleared whenever it changes
+        self._derived = {}
 
     def play(self, move):
         """Play a move onto the board. Raises InvalidMoveError if the provided
@@ -68,12 +84,74 @@ class Board:
 
         # If the board was empty, it isn't anymore.
         self.empty = False
+        self._derived = {}
+
+    def copy(self):
+        """Return a copy of this board that can be played on independently.
+
+        >>> import board
+        >>> b = Board()
+        >>> b.play(Move.from_str("FOO 8G"))
+        >>> c = b.copy()
+        >>> c.play(Move.from_str("(F)AR G8"))
+        >>> b.squares[8][6].letter is None, c.squares[8][6].letter
+        (True, 'A')
+        """
+
+        board = copy.copy(self)
+        board.squares = [[Square(square.bonus_multiplier, square.bonus_type, square.letter) for square in row] for row in self.squares]
+        board._derived = {}
+        return board
+
+    def __getstate__(self):
+        # What was worked out from the position stays behind when a board
+        # is pickled (for a MovePool), since it refers to lexicons
+        state = self.__dict__.copy()
+        if "_derived" in state:
+            state["_derived"] = {}
+        return state
+
+    def view(self):
+        """Return a read-only BoardView of this board, which follows it as
+        moves are played.
+
+        >>> import board, lexicon
+        >>> t = lexicon.Lexicon.from_iterable(['FOO', 'FAR'])
+        >>> b = Board()
+        >>> v = b.view()
+        >>> v.empty
+        True
+        >>> b.play(Move.from_str("FOO 8G"))
+        >>> v.empty, v.squares[7][6].letter
+        (False, 'F')
+        >>> v.valid_moves("AR", t) == b.valid_moves("AR", t)
+        True
+        >>> v.all_cross_checks(t) is b.all_cross_checks(t)
+        True
+        >>> v.play(Move.from_str("(F)AR G8"))
+        Traceback (most recent call last):
+        TypeError: a board view can't be played on
+        >>> v.squares[8][6].letter = 'A'
+        Traceback (most recent call last):
+        TypeError: a board view can't be changed
+        >>> import pickle
+        >>> pickle.loads(pickle.dumps(b, 2))._derived
+        {}
+        >>> c = v.copy()
+        >>> c.play(Move.from_str("(F)AR G8"))
+        >>> b.squares[8][6].letter is None, v.squares[8][6].letter is None
+        (True, True)
+        """
+        return BoardView(self)
 
     def flip(self):
-        """Flip this board along the diagonal (swaps rows with columns)."""
+        """Flip this board along the diagonal (swaps rows with columns). Move
+        generation doesn't need this any more: it searches the flipped
+        squares from lines() instead."""
         for row in range(self.dim):
             for col in range(row + 1, self.dim):
                 self.squares[col][row], self.squares[row][col] = self.squares[row][col], self.squares[col][row]
+        self._derived = {}
 
     def walk_move(self, move):
         """Return a list of squares that a particular move would pass through.
@@ -91,8 +169,35 @@ class Board:
         elif move.kind == Move.MOVE_DOWN:
             return [ self.squares[move.row + i][move.col] for i in range(len(move.word)) ]
 
-    def valid_moves(self, rack, lexicon):
-        """Find valid moves on this board.
+    def valid_moves(self, rack, lexicon, profiler=None, pool=None, deadline=None, squares=None, rows=None, cols=None, columnar=False, collapse_blanks=False, cache=None, stop=None):
+        """Find valid moves on this board. If a Profiler is provided, counters
+        and per-phase timings for the search are recorded in it. If a MovePool
+        is provided, the search is split among its worker processes.
+
+        If a deadline (a time.time() value) is given, anchors are searched in
+        the order of ranked_anchors and the search stops when the deadline
+        passes, returning the moves found so far. Every move returned is
+        valid, but some may be missing. Likewise, if stop (a threading.Event)
+        is given, the search stops as soon as it is set, from another thread.
+
+        The search can be limited to part of the board: if rows or cols are
+        given, only across moves on those rows and down moves in those columns
+        are found, and if squares (a list of (row, col)) are given, only moves
+        covering at least one of them are found. Only the lines and anchors
+        that can lead to such moves are searched.
+
+        Moves are returned as a list of Move objects, or as a MoveList if
+        columnar is True.
+
+        If collapse_blanks is True, only the highest scoring way of playing
+        each word in each position is found: blanks are only used for letters
+        the rack has run out of, and are put where they cost the fewest
+        points. This is all a player maximizing score needs, and is much
+        faster with blanks in the rack.
+
+        If a LineCache is given, the moves along each line are looked up in
+        it, and lines that aren't there are searched and added. It is only
+        used when searching the whole board without a pool or deadline.
 
         >>> import board, lexicon
         >>> t = lexicon.Lexicon()
@@ -119,54 +224,330 @@ class Board:
         >>> b.play(Move(3, 0, Move.MOVE_DOWN, "SUBWAY"))
         >>> sorted([str(move) + " " + str(move.score) for move in b.valid_moves("SUBWAYZ", t)])
         ['(S)UBWAY 4A 28', '(S)UBWAYS 4A 30', '(SUBWAY)S A4 15', 'SUBWAY 10A 39']
+        >>> import profiler
+        >>> p = profiler.Profiler()
+        >>> len(b.copy().valid_moves("SUBWAYZ", t, profiler=p))
+        4
+        >>> p.current["moves"], p.current["cross_checks"]
+        (4, 8)
+        >>> sorted(p.current.keys())
+        ['allocate_ns', 'anchors_ns', 'cross_checks', 'cross_checks_ns', 'moves', 'nodes', 'score_ns', 'search_ns']
+        >>> import time
+        >>> b.valid_moves("SUBWAYZ", t, deadline=time.time() - 1)
+        []
+        >>> sorted(str(move) for move in b.valid_moves("SUBWAYZ", t, deadline=time.time() + 60))
+        ['(S)UBWAY 4A', '(S)UBWAYS 4A', '(SUBWAY)S A4', 'SUBWAY 10A']
+        >>> import threading
+        >>> stop = threading.Event()
+        >>> len(b.valid_moves("SUBWAYZ", t, stop=stop))
+        4
+        >>> stop.set()
+        >>> b.valid_moves("SUBWAYZ", t, stop=stop)
+        []
+        >>> b = board.Board()
+        >>> b.play(Move(6, 7, Move.MOVE_DOWN,   "DoGGED"))
+        >>> b.play(Move(7, 6, Move.MOVE_ACROSS, "BoSS", tmask=[True,False,True,True]))
+        >>> b.play(Move(9, 7, Move.MOVE_ACROSS, "GOB", tmask=[False,True,True]))
+        >>> sorted(str(move) for move in b.valid_moves("UVWXYZ?", t, squares=[(10, 7)]))
+        ['(DoGGED)lY H7', 'ZVi(E)X 11E']
+        >>> [str(move) for move in b.valid_moves("UVWXYZ?", t, rows=[10])]
+        ['ZVi(E)X 11E']
+        >>> [str(move) for move in b.valid_moves("UVWXYZ?", t, cols=[9])]
+        ['(S)U(B)WaY J8']
+        >>> [str(move) for move in b.valid_moves("UVWXYZ?", t, squares=[(10, 7)], cols=[7])]
+        ['(DoGGED)lY H7']
+        >>> moves = b.valid_moves("UVWXYZ?", t, columnar=True)
+        >>> [str(move) + " " + str(move.score) for move in moves.top(2)]
+        ['ZVi(E)X 11E 55', '(DoGGED)lY H7 13']
+        >>> [str(move) for move in b.valid_moves("UVWXYZ?", t, rows=[10], columnar=True)]
+        ['ZVi(E)X 11E']
+        >>> b = board.Board()
+        >>> sorted([str(move) + " " + str(move.score) for move in b.valid_moves("SSUBWA?", t, collapse_blanks=True) if move.col == 1])
+        ['SUBWAyS 8B 78']
+        >>> len(b.valid_moves("SSUBWA?", t)), len(b.valid_moves("SSUBWA?", t, collapse_blanks=True))
+        (34, 34)
+        >>> [str(move) + " " + str(move.score) for move in b.valid_moves("BOSS??", t, collapse_blanks=True, rows=[7]) if move.col == 4]
+        ['BOSS 8E 12']
+        >>> sorted(str(move) + " " + str(move.score) for move in b.valid_moves("SUBWAY?", t, collapse_blanks=True, rows=[7]) if move.col in (1, 3))
+        ['SUBWAY 8D 30', 'SUBWAYs 8D 80', 'sUBWAYS 8B 84']
         """
-        # Start with valid across moves
-        moves = self.valid_moves_across(rack, lexicon)
+        moves = MoveList() if columnar else []
+
+        if squares is not None or rows is not None or cols is not None:
+            if pool is not None:
+                raise ValueError("a pool cannot be used to search part of the board")
+            return self._targeted_moves(rack, lexicon, squares, rows, cols, profiler, deadline, moves, collapse_blanks, stop)
+
+        # Find cross-checks for both orientations at once
+        if profiler:
+            t_start = profiler.clock()
+
+        checks, scores = self.all_cross_checks(lexicon, profiler)
+
+        if profiler:
+            profiler.add_time("cross_checks", profiler.clock() - t_start)
+
+        if pool is not None:
+            if deadline is not None or stop is not None:
+                raise ValueError("deadline and stop are not supported with a pool")
+            moves.extend(pool.valid_moves(self, rack, checks, scores, collapse_blanks, profiler))
+            return moves
+
+        if deadline is not None:
+            # Most promising anchors first, until we run out of time
+            lines = self.lines()
+            for orientation, row, anchor in self.ranked_anchors():
+                if time.time() >= deadline:
+                    break
+                self.line_moves(lines[orientation], row, rack, lexicon, checks[orientation][row], scores[orientation][row], profiler, anchors=[anchor], deadline=deadline, moves=moves, collapse_blanks=collapse_blanks, stop=stop)
+            return moves
+
+        for orientation, squares in enumerate(self.lines()):
+            for row in range(self.dim):
+                if cache is not None:
+                    cache.line_moves(self, squares, orientation, row, rack, lexicon, checks[orientation][row], scores[orientation][row], profiler, moves, collapse_blanks, stop)
+                else:
+                    self.line_moves(squares, row, rack, lexicon, checks[orientation][row], scores[orientation][row], profiler, moves=moves, collapse_blanks=collapse_blanks, stop=stop)
 
-        # Flip the board
-        self.flip()
+        return moves
 
-        # Add down moves
-        try:
-            for move in self.valid_moves_across(rack, lexicon):
-                # Flip this move from across to down
-                move.row, move.col = move.col, move.row
-                move.kind = Move.MOVE_DOWN
-                moves.append(move)
-        finally:
-            # Flip the board back
-            self.flip()
+    def _targeted_moves(self, rack, lexicon, squares, rows, cols, profiler, deadline, moves, collapse_blanks, stop):
+        """Find valid moves on part of the board, for valid_moves. Moves are
+        added to moves."""
+
+        # Lines to search, as (orientation, row) like lines(), each with the
+        # columns along the line that moves must cover (None for any)
+        targets = {}
+        if rows is not None or cols is not None:
+            for row in rows or []:
+                targets[(0, row)] = None
+            for col in cols or []:
+                targets[(1, col)] = None
+
+        if squares is not None:
+            covered = {}
+            for row, col in squares:
+                if not (0 <= row < self.dim and 0 <= col < self.dim):
+                    continue
+                covered.setdefault((0, row), set()).add(col)
+                covered.setdefault((1, col), set()).add(row)
+
+            if rows is None and cols is None:
+                targets = covered
+            else:
+                targets = dict((line, covered[line]) for line in targets if line in covered)
+
+        lines = self.lines()
+        for orientation, row in sorted(targets):
+            if not 0 <= row < self.dim:
+                continue
+            line = lines[orientation]
+            targetcols = targets[(orientation, row)]
+
+            # Anchors whose moves can cover a target column: those at or
+            # before it, within reach of the rack, and the first one after it,
+            # whose left part may stretch back over it
+            anchors = self.line_anchors(line, row)
+            if targetcols is not None:
+                wanted = set()
+                for target in targetcols:
+                    for anchor in anchors:
+                        lo, hi = min(anchor, target), max(anchor, target)
+                        if sum(1 for col in range(lo, hi + 1) if not line[row][col].letter) <= len(rack):
+                            wanted.add(anchor)
+                        if anchor > target:
+                            break
+                anchors = [ anchor for anchor in anchors if anchor in wanted ]
+
+            if not anchors:
+                continue
+
+            if profiler:
+                t_start = profiler.clock()
+
+            # Use the whole board's cross-checks if someone has found them
+            # already (a player searching the board we validate on)
+            found = self._derived.get(("cross_checks", lexicon, lexicon.mask))
+            if found is not None:
+                rowcross, rowscore = found[0][orientation][row], found[1][orientation][row]
+            else:
+                rowcross, rowscore = self.line_cross_checks(line, row, lexicon)
 
-        return moves
+            if profiler:
+                profiler.add_time("cross_checks", profiler.clock() - t_start)
 
-    def valid_moves_across(self, rack, lexicon):
-        moves = []
+            self.line_moves(line, row, rack, lexicon, rowcross, rowscore, profiler, anchors=anchors, deadline=deadline, cover=targetcols, moves=moves, collapse_blanks=collapse_blanks, stop=stop)
 
-        # Copy rack since we will edit it
-        rack = list(rack)
+        return moves
 
-        # Search for valid moves row by row.
-        for row in range(self.dim):
-            # Find anchors for this row
-            if self.empty:
-                # Special case for an empty board
-                # There is one anchor square: the center
-                if row == int(self.dim/2):
-                    rowanchors = [ int(self.dim/2) ]
-                else:
-                    rowanchors = []
+    def lines(self):
+        """Return the squares of this board as seen by across moves and by
+        down moves: (squares, squares flipped along the diagonal). Both share
+        the same Square objects."""
+        return self.squares, zip(*self.squares)
+
+    def line_anchors(self, squares, row):
+        """Return the anchor columns along one row of squares, which is either
+        self.squares or the flipped squares from lines()."""
+
+        if self.empty:
+            # Special case for an empty board
+            # There is one anchor square: the center
+            if row == int(self.dim/2):
+                return [ int(self.dim/2) ]
             else:
-                rowanchors = [ col for col in range(self.dim) if self.is_anchor(row, col) ]
+                return []
+        else:
+            return [ col for col in range(self.dim) if self.is_anchor(row, col, squares) ]
+
+    def ranked_anchors(self):
+        """Return (orientation, row, col) for every anchor, where orientation
+        indexes lines(), with the most promising anchors first.
+
+        Anchors are ranked by the premium squares that moves through them
+        can reach: the best word multiplier times the total letter
+        multiplier of the empty squares within a rack's length.
+
+        >>> import board
+        >>> b = board.Board()
+        >>> b.ranked_anchors()
+        [(0, 7, 7), (1, 7, 7)]
+        >>> b.play(Move.from_str("FOO 8G"))
+        >>> b.ranked_anchors()[:3]
+        [(1, 7, 6), (1, 7, 8), (0, 7, 5)]
+        """
+
+        ranked = []
+        for orientation, squares in enumerate(self.lines()):
+            for row in range(self.dim):
+                for anchor in self.line_anchors(squares, row):
+                    word_mult = 1
+                    letter_mult = 0
+                    for col in range(max(0, anchor - self.rack_size + 1), min(self.dim, anchor + self.rack_size)):
+                        square = squares[row][col]
+                        if square.letter:
+                            continue
+                        if square.bonus_type == Square.BONUS_WORD:
+                            word_mult = max(word_mult, square.bonus_multiplier)
+                        if square.bonus_type == Square.BONUS_LETTER:
+                            letter_mult += square.bonus_multiplier
+                        else:
+                            letter_mult += 1
+                    ranked.append((-word_mult * letter_mult, orientation, row, anchor))
+
+        return [ (orientation, row, anchor) for priority, orientation, row, anchor in sorted(ranked) ]
+
+    def valid_moves_across(self, rack, lexicon, profiler=None, checks=None, scores=None):
+        """Find valid across moves on this board. Cross-checks and cross-scores
+        for every square may be provided (the across ones from
+        all_cross_checks); otherwise they are found here. valid_moves finds
+        moves in both directions at once.
 
-            # Find cross-checks for this row
-            rowcross = [ self.cross_checks( row, col, lexicon ) for col in range(self.dim) ]
+        >>> import board, lexicon
+        >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+        >>> b = Board(variant='test')
+        >>> b.play(Move.from_str('ABBA 8G'))
+        >>> across = sorted(str(move) for move in b.valid_moves('ADC', t) if move.kind == Move.MOVE_ACROSS)
+        >>> sorted(str(move) for move in b.valid_moves_across('ADC', t)) == across
+        True
+        >>> b.flip()
+        >>> b.squares[8][7].letter, b.squares[7][8].letter
+        ('B', None)
+        >>> b.flip()
+        >>> sorted(str(move) for move in b.valid_moves_across('ADC', t)) == across
+        True
+        """
 
-            # Find score of adjacent up/down fragments for this row
-            rowscore = [ self.cross_score( row, col ) for col in range(self.dim) ]
+        if checks is None:
+            checks, scores = self.all_cross_checks(lexicon, profiler)
+            checks, scores = checks[0], scores[0]
 
-            # For each anchor, find hookable words
-            prevanchor = -1
+        moves = []
+        for row in range(self.dim):
+            self.line_moves(self.squares, row, rack, lexicon, checks[row], scores[row], profiler, moves=moves)
+        return moves
+
+    def line_moves(self, squares, row, rack, lexicon, rowcross, rowscore, profiler=None, anchors=None, deadline=None, cover=None, moves=None, collapse_blanks=False, stop=None):
+        """Find valid moves along one row of squares, which is either
+        self.squares or the flipped squares from lines(). Moves found on
+        flipped squares are returned as down moves.
+
+        rowcross and rowscore are the cross-checks and cross-scores for each
+        square in the row, as returned by all_cross_checks. If anchors is
+        given, only moves through those anchor columns are searched, and if
+        cover is given, only moves covering one of those columns are kept. If
+        a deadline (a time.time() value) is given, the search stops when it
+        passes and the moves found so far are returned, and likewise when
+        stop (a threading.Event) is set.
+
+        Moves are added to moves, a list or a MoveList, if given, and
+        otherwise to a new list. Returns the moves. See valid_moves for
+        collapse_blanks."""
+
+        if moves is None:
+            moves = []
+        columnar = isinstance(moves, MoveList)
+        flipped = squares is not self.squares
+        nmoves = len(moves)
+
+        # Letters are handled as codes from the variant's Alphabet: words
+        # are built up in a list of codes, and only turned into strings for
+        # the moves found
+        alphabet = self.variant.alphabet
+        BLANK = alphabet.BLANK
+        values = alphabet.values
+        line = [alphabet.codes[square.letter] if square.letter else 0 for square in squares[row]]
+
+        # Count of each letter in the rack, by code; have[0] counts blanks.
+        # We edit this as tiles are used.
+        have = [0] * BLANK
+        for code in alphabet.encode(rack):
+            have[code if code != BLANK else 0] += 1
+
+        # When collapsing blanks, words are searched with every new tile as
+        # a letter, using a blank only once the rack has run out of that
+        # letter, and assign_blanks decides which tiles are the blanks
+        tiles = list(have)
+
+        # Cross-checks as sets of codes
+        coded = {}
+        allowed = []
+        for letters in rowcross:
+            if letters not in coded:
+                coded[letters] = frozenset(alphabet.codes[letter] for letter in letters)
+            allowed.append(coded[letters])
+
+        # Lexicon cursor
+        edges, children, final = lexicon.coded_cursor(alphabet)
+
+        # Nodes visited and time spent scoring and creating Moves, only
+        # tracked when profiling (these are part of the search phase)
+        visited = [0]
+        score_ns = [0]
+        allocate_ns = [0]
+
+        if profiler:
+            t_phase = profiler.clock()
+
+        # Find anchors for this row
+        rowanchors = self.line_anchors(squares, row)
+
+        if profiler:
+            t_now = profiler.clock()
+            profiler.add_time("anchors", t_now - t_phase)
+            t_phase = t_now
+
+        # The word being built, as codes
+        word = []
+
+        # For each anchor, find hookable words
+        prevanchor = -1
+        try:
             for anchor in rowanchors:
+                if anchors is not None and anchor not in anchors:
+                    prevanchor = anchor
+                    continue
+
                 # Hookable word will be something like:
                 # D   O   G   G   E   D
                 # |  1  | 2 |    3    |
@@ -175,31 +556,30 @@ class Board:
                 # 2 - Anchor (must be filled)
                 # 2 + 3 - Right part (must be at least the anchor)
 
-                def score_word(word, col):
+                def score_word(placed, col):
                     base_score = 0
                     base_mult = 1
                     extra_score = 0
                     played_tiles = 0
 
-                    for i in range(col - len(word), col):
-                        letter = word[i - col + len(word)]
-                        letter_value = self.letter_value(letter)
+                    for i in range(col - len(placed), col):
+                        letter_value = values[placed[i - col + len(placed)]]
 
-                        if not self.squares[row][i].letter:
+                        if not line[i]:
                             # This is a newly placed tile
                             played_tiles += 1
 
                             # Letter value increases if there is a letter bonus on this square
-                            if self.squares[row][i].bonus_type == Square.BONUS_LETTER:
-                                letter_value *= self.squares[row][i].bonus_multiplier
+                            if squares[row][i].bonus_type == Square.BONUS_LETTER:
+                                letter_value *= squares[row][i].bonus_multiplier
 
                             # Letter value is added to extra_score if there is a word down this column
                             if rowscore[i] is not None:
                                 extra_score += rowscore[i] + letter_value
 
                             # Base multiplier is increased if there is a word bonus on this square
-                            if self.squares[row][i].bonus_type == Square.BONUS_WORD:
-                                base_mult *= self.squares[row][i].bonus_multiplier
+                            if squares[row][i].bonus_type == Square.BONUS_WORD:
+                                base_mult *= squares[row][i].bonus_multiplier
 
                         # Letter value is added to base score even if not newly placed
                         base_score += letter_value
@@ -210,79 +590,165 @@ class Board:
 
                     return base_score * base_mult + extra_score
 
-                def extend_right(word, tree, col):
-                    if not tree:
+                def assign_blanks(col):
+                    # Returns a copy of word with blanks for the letters we
+                    # don't have enough tiles for. word itself is left alone,
+                    # since longer words are built from it and may want the
+                    # blanks elsewhere.
+
+                    # Points each newly placed tile is worth per point of
+                    # letter value, as in score_word
+                    start = col - len(word)
+                    base_mult = 1
+                    for i in range(start, col):
+                        if not line[i] and squares[row][i].bonus_type == Square.BONUS_WORD:
+                            base_mult *= squares[row][i].bonus_multiplier
+
+                    places = {}
+                    for i in range(start, col):
+                        if not line[i]:
+                            weight = base_mult + (1 if rowscore[i] is not None else 0)
+                            if squares[row][i].bonus_type == Square.BONUS_LETTER:
+                                weight *= squares[row][i].bonus_multiplier
+                            places.setdefault(word[i - start], []).append((weight, i - start))
+
+                    # Letters we don't have enough tiles for are blanks where
+                    # they are worth the least
+                    placed = list(word)
+                    for code, found in places.iteritems():
+                        nblanks = len(found) - tiles[code]
+                        if nblanks > 0:
+                            for weight, i in sorted(found)[:nblanks]:
+                                placed[i] |= BLANK
+                    return placed
+
+                def extend_right(node, col):
+                    if profiler:
+                        visited[0] += 1
+
+                    if deadline is not None and time.time() >= deadline:
+                        raise _SearchTimeout()
+                    if stop is not None and stop.is_set():
+                        raise _SearchTimeout()
+
+                    if node < 0:
                         # No lexicon means no words.
                         return
-                    elif col < self.dim and self.squares[row][col].letter:
+                    elif col < self.dim and line[col]:
                         # This column is occupied, we have to use the existing letter
-                        subtree = tree.subtree(self.squares[row][col].letter.upper())
-                        if subtree:
-                            extend_right(
-                                word + self.squares[row][col].letter,
-                                subtree,
-                                col + 1)
+                        word.append(line[col])
+                        extend_right(children[node].get(line[col] & ~BLANK, -1), col + 1)
+                        word.pop()
                     else:
                         # This column is not occupied
-                        if col > anchor and tree.final:
+                        if col > anchor and final[node] and (cover is None or any(col - len(word) <= c < col for c in cover)):
                             # 'word' represents a valid move.
-                            moves.append(Move(
-                                row       = row,
-                                col       = col - len(word),
-                                kind      = Move.MOVE_ACROSS,
-                                word      = word,
-                                score     = score_word(word, col),
-                                tmask     = [self.squares[row][i].letter is None for i in range(col-len(word), col)]))
+                            if profiler:
+                                t_score = profiler.clock()
+
+                            placed = assign_blanks(col) if collapse_blanks else word
+                            score = score_word(placed, col)
+
+                            if profiler:
+                                t_move = profiler.clock()
+                                score_ns[0] += t_move - t_score
+
+                            start = col - len(word)
+                            if flipped:
+                                # Flip this move from across to down
+                                position = (start, row, Move.MOVE_DOWN)
+                            else:
+                                position = (row, start, Move.MOVE_ACROSS)
+
+                            if columnar:
+                                tmask = 0
+                                for i in range(len(word)):
+                                    if not line[start + i]:
+                                        tmask |= 1 << i
+                                moves.add(position[0], position[1], position[2], alphabet.decode(placed), score, tmask)
+                            else:
+                                moves.append(Move(
+                                    row       = position[0],
+                                    col       = position[1],
+                                    kind      = position[2],
+                                    word      = alphabet.decode(placed),
+                                    score     = score,
+                                    tmask     = [not line[i] for i in range(start, col)]))
+
+                            if profiler:
+                                allocate_ns[0] += profiler.clock() - t_move
 
                         # Try to extend rightwards using a letter from the rack
                         if col < self.dim:
-                            for letter in tree.next():
-                                if letter in rowcross[col]:
+                            cross = allowed[col]
+                            for code, next_node in edges[node]:
+                                if code in cross:
                                     # Do we have this letter on a tile?
-                                    if letter in rack:
-                                        rack.remove(letter)
-                                        extend_right(
-                                            word + letter,
-                                            tree.subtree(letter),
-                                            col + 1)
-                                        rack.append(letter)
+                                    if have[code]:
+                                        have[code] -= 1
+                                        word.append(code)
+                                        extend_right(next_node, col + 1)
+                                        word.pop()
+                                        have[code] += 1
 
                                     # Do we have a blank we can use?
-                                    if '?' in rack:
-                                        rack.remove('?')
-                                        extend_right(
-                                            word + letter.lower(),
-                                            tree.subtree(letter),
-                                            col + 1)
-                                        rack.append('?')
+                                    if have[0] and not (collapse_blanks and have[code]):
+                                        have[0] -= 1
+                                        word.append(code if collapse_blanks else code | BLANK)
+                                        extend_right(next_node, col + 1)
+                                        word.pop()
+                                        have[0] += 1
 
                 # Find all candidate left parts and try to extend them
-                if anchor == 0 or self.squares[row][anchor - 1].letter:
+                if anchor == 0 or line[anchor - 1]:
                     # We're at the left edge of the board *or* there are tiles already
                     # on the board. Either way the left part is fixed
-                    word = ''.join([self.squares[row][i].letter for i in range(prevanchor + 1, anchor)])
-                    extend_right(word, lexicon.subtree(word.upper()), anchor)
+                    node = lexicon.ROOT
+                    for i in range(prevanchor + 1, anchor):
+                        word.append(line[i])
+                        if node >= 0:
+                            node = children[node].get(line[i] & ~BLANK, -1)
+                    extend_right(node, anchor)
+                    del word[:]
                 else:
                     # No tiles already on the board, find candidate left parts based on the lexicon
-                    def search(tree, word='', limit=self.dim):
-                        extend_right(word, tree, anchor)
+                    def search(node, limit=self.dim):
+                        if profiler:
+                            visited[0] += 1
+
+                        extend_right(node, anchor)
                         if limit > 0:
-                            for letter in tree.next():
+                            for code, next_node in edges[node]:
                                 # Do we have this letter on a tile?
-                                if letter in rack:
-                                    rack.remove(letter)
-                                    search(tree.subtree(letter), word + letter, limit - 1)
-                                    rack.append(letter)
+                                if have[code]:
+                                    have[code] -= 1
+                                    word.append(code)
+                                    search(next_node, limit - 1)
+                                    word.pop()
+                                    have[code] += 1
 
                                 # Do we have a blank we can use?
-                                if '?' in rack:
-                                    rack.remove('?')
-                                    search(tree.subtree(letter), word + letter.lower(), limit - 1)
-                                    rack.append('?')
-                    search(lexicon, limit = anchor - prevanchor - 1)
+                                if have[0] and not (collapse_blanks and have[code]):
+                                    have[0] -= 1
+                                    word.append(code if collapse_blanks else code | BLANK)
+                                    search(next_node, limit - 1)
+                                    word.pop()
+                                    have[0] += 1
+                    search(lexicon.ROOT, limit = anchor - prevanchor - 1)
 
                 # Update prevanchor for the next loop
                 prevanchor = anchor
+        except _SearchTimeout:
+            # Out of time, keep the moves found so far
+            pass
+
+        if profiler:
+            profiler.add_time("search", profiler.clock() - t_phase)
+            profiler.count("moves", len(moves) - nmoves)
+            profiler.count("nodes", visited[0])
+            profiler.add_time("score", score_ns[0])
+            profiler.add_time("allocate", allocate_ns[0])
+
         return moves
 
     def updown_fragments(self, row, col):
@@ -344,7 +810,7 @@ class Board:
             return []
 
         up, down = self.updown_fragments(row, col)
-        letters = sorted(self.letter_values.keys())
+        letters = self.variant.letters
 
         # If there are no neighboring word fragments, return a list of all letters
         if not up and not down:
@@ -400,8 +866,275 @@ class Board:
 
         return score
 
-    def is_anchor(self, row, col):
+    def all_cross_checks(self, lexicon, profiler=None):
+        """Compute cross-checks and cross-scores for every square and both
+        orientations in one pass. Returns a tuple (checks, scores).
+
+        checks[0][row][col] is the set of letters that can be placed in
+        (row, col) by an across move, like cross_checks, and scores[0][row][col]
+        is its cross_score. checks[1] and scores[1] are the same for down moves,
+        but are indexed [col][row], like the flipped squares from lines().
+
+        >>> import lexicon, board
+        >>> t = lexicon.Lexicon()
+        >>> for word in ['SO', 'GI', 'DOGGEDS', 'AD']: t.add(word)
+        >>> b = board.Board()
+        >>> b.play(Move(6,7,Move.MOVE_DOWN,   "DoGGED"))
+        >>> b.play(Move(7,6,Move.MOVE_ACROSS, "BoSS", tmask=[True,False,True,True]))
+        >>> checks, scores = b.all_cross_checks(t)
+        >>> all(sorted(checks[0][row][col]) == b.cross_checks(row, col, t) for row in range(15) for col in range(15))
+        True
+        >>> all(scores[0][row][col] == b.cross_score(row, col) for row in range(15) for col in range(15) if not b.squares[row][col].letter)
+        True
+        >>> sorted(checks[0][5][7]), sorted(checks[0][12][7]), sorted(checks[1][6][11]), sorted(checks[1][10][7])
+        ([], ['S'], ['A'], [])
+        >>> scores[0][12][7], scores[1][6][11], scores[1][11][6]
+        (9, 2, None)
+
+        The result is kept until the board changes, and must not be modified.
+
+        >>> b.all_cross_checks(t) is b.all_cross_checks(t)
+        True
+        """
+
+        key = ("cross_checks", lexicon, lexicon.mask)
+        if key not in self._derived:
+            checks, scores = [], []
+            for index, table, score in self._cross_tables(lexicon, profiler):
+                checks.append([[table[i] for i in row] for row in index])
+                scores.append(score)
+            self._derived[key] = (checks, scores)
+        return self._derived[key]
+
+    def cross_check_matrix(self, lexicon):
+        """Return cross-checks for the whole board as a NumPy boolean array
+        of shape (2, dim, dim, len(letters)), where letters is the sorted list
+        of letters in this variant. [0, row, col, i] is True if letters[i] can
+        be placed in (row, col) by an across move, and [1, row, col, i] is the
+        same for down moves. Requires NumPy.
+
+        >>> import lexicon, board
+        >>> t = lexicon.Lexicon()
+        >>> for word in ['SO', 'GI', 'DOGGEDS', 'AD']: t.add(word)
+        >>> b = board.Board()
+        >>> b.play(Move(6,7,Move.MOVE_DOWN,   "DoGGED"))
+        >>> b.play(Move(7,6,Move.MOVE_ACROSS, "BoSS", tmask=[True,False,True,True]))
+        >>> m = b.cross_check_matrix(t) if numpy else None
+        >>> numpy is None or m.shape == (2, 15, 15, 26)
+        True
+        >>> letters = sorted(b.letter_values.keys())
+        >>> numpy is None or [letters[i] for i in m[0, 8, 8].nonzero()[0]] == ['O']
+        True
+        >>> numpy is None or [letters[i] for i in m[1, 11, 6].nonzero()[0]] == ['A']
+        True
+        >>> numpy is None or sorted(b._numpy_fragments(b._numpy_grid())) == sorted(b._python_fragments(b.squares))
+        True
+        """
+
+        letters = self.variant.letters
+        matrix = numpy.empty((2, self.dim, self.dim, len(letters)), dtype=bool)
+        for orientation, (index, table, score) in enumerate(self._cross_tables(lexicon)):
+            table = numpy.array([[letter in checks for letter in letters] for checks in table], dtype=bool)
+            matrix[orientation] = table[numpy.asarray(index)]
+
+        # Down moves were computed on the flipped board
+        matrix[1] = matrix[1].transpose(1, 0, 2)
+        return matrix
+
+    def _cross_tables(self, lexicon, profiler=None):
+        """Compute cross-checks and cross-scores for both orientations. For
+        each orientation, returns a tuple (index, table, scores), where
+        table[index[row][col]] is the set of letters allowed in (row, col).
+        The down orientation is indexed like the flipped squares from lines().
+
+        Squares are grouped by their (up, down) fragments, so the lexicon is
+        only searched once per distinct pair."""
+
+        letters = frozenset(self.variant.letters)
+
+        # table[0] is for occupied squares, and table[1] for squares with no
+        # neighboring fragments
+        table = [frozenset(), letters]
+        hooks = {}
+
+        if numpy is not None:
+            grid = self._numpy_grid()
+
+        ret = []
+        for orientation, squares in enumerate((self.squares, zip(*self.squares))):
+            index = [[0 if square.letter else 1 for square in row] for row in squares]
+            scores = [[None] * self.dim for row in squares]
+
+            if numpy is not None:
+                fragments = self._numpy_fragments(grid.T if orientation else grid)
+            else:
+                fragments = self._python_fragments(squares)
+
+            for row, col, up, down, value in fragments:
+                key = (up, down)
+                if key not in hooks:
+                    hooks[key] = len(table)
+                    table.append(self._hook_letters(lexicon, up, down, letters))
+                index[row][col] = hooks[key]
+
+                # Possible multiplier
+                if squares[row][col].bonus_type == Square.BONUS_WORD:
+                    value *= squares[row][col].bonus_multiplier
+                scores[row][col] = value
+
+            ret.append((index, table, scores))
+
+        if profiler:
+            profiler.count("cross_checks", len(hooks))
+
+        return ret
+
+    def _hook_letters(self, lexicon, up, down, letters):
+        """Return the frozenset of letters that can go between the uppercase
+        fragments up and down to make a word."""
+
+        allowed = []
+        node = lexicon.walk(up)
+        if node >= 0:
+            for letter, child in lexicon.edges(node):
+                if letter in letters:
+                    end = lexicon.walk(down, child)
+                    if end >= 0 and lexicon.is_final(end):
+                        allowed.append(letter)
+        return frozenset(allowed)
+
+    def line_cross_checks(self, squares, row, lexicon):
+        """Compute cross-checks and cross-scores for one row of squares, which
+        is either self.squares or the flipped squares from lines(). Returns a
+        tuple (rowcross, rowscore), the same as one row of all_cross_checks.
+
+        >>> import lexicon, board
+        >>> t = lexicon.Lexicon()
+        >>> for word in ['SO', 'GI', 'DOGGEDS', 'AD']: t.add(word)
+        >>> b = board.Board()
+        >>> b.play(Move(6,7,Move.MOVE_DOWN,   "DoGGED"))
+        >>> b.play(Move(7,6,Move.MOVE_ACROSS, "BoSS", tmask=[True,False,True,True]))
+        >>> checks, scores = b.all_cross_checks(t)
+        >>> all(b.line_cross_checks(squares, row, t) == (checks[o][row], scores[o][row]) for o, squares in enumerate(b.lines()) for row in range(15))
+        True
+        """
+
+        letters = frozenset(self.variant.letters)
+
+        rowcross, rowscore = [], []
+        for col in range(self.dim):
+            if squares[row][col].letter:
+                rowcross.append(frozenset())
+                rowscore.append(None)
+                continue
+
+            up, down, value = '', '', 0
+            i = row - 1
+            while i >= 0 and squares[i][col].letter:
+                up = squares[i][col].letter.upper() + up
+                value += self.letter_value(squares[i][col].letter)
+                i -= 1
+            i = row + 1
+            while i < self.dim and squares[i][col].letter:
+                down += squares[i][col].letter.upper()
+                value += self.letter_value(squares[i][col].letter)
+                i += 1
+
+            if not up and not down:
+                rowcross.append(letters)
+                rowscore.append(None)
+                continue
+
+            rowcross.append(self._hook_letters(lexicon, up, down, letters))
+
+            # Possible multiplier
+            if squares[row][col].bonus_type == Square.BONUS_WORD:
+                value *= squares[row][col].bonus_multiplier
+            rowscore.append(value)
+
+        return rowcross, rowscore
+
+    def _python_fragments(self, squares):
+        """Find the fragments above and below every empty square that has any.
+        Returns a list of (row, col, up, down, value) where up and down are
+        uppercase and value is the total value of their letters."""
+
+        fragments = []
+        for col in range(self.dim):
+            up, value = '', 0
+            for row in range(self.dim):
+                if squares[row][col].letter:
+                    up += squares[row][col].letter.upper()
+                    value += self.letter_value(squares[row][col].letter)
+                    continue
+
+                down, down_value = '', 0
+                for i in range(row + 1, self.dim):
+                    if not squares[i][col].letter:
+                        break
+                    down += squares[i][col].letter.upper()
+                    down_value += self.letter_value(squares[i][col].letter)
+
+                if up or down:
+                    fragments.append((row, col, up, down, value + down_value))
+                up, value = '', 0
+        return fragments
+
+    def _numpy_grid(self):
+        """Return the board as an integer array. Empty squares are 0, regular
+        tiles are 1 to len(letters) and blanks are len(letters) + 1 and up, in
+        order of the sorted letters of this variant."""
+
+        letters = self.variant.letters
+        codes = {}
+        for i, letter in enumerate(letters):
+            codes[letter] = i + 1
+            codes[letter.lower()] = i + 1 + len(letters)
+
+        return numpy.array([[codes[square.letter] if square.letter else 0 for square in row] for row in self.squares])
+
+    def _numpy_fragments(self, grid):
+        """Same as _python_fragments, but finds fragments with array
+        operations on a grid from _numpy_grid."""
+
+        letters = self.variant.letters
+
+        # Value of each code; blanks are worth nothing
+        value_table = numpy.zeros(2 * len(letters) + 1, dtype=int)
+        value_table[1:len(letters) + 1] = [self.letter_values[letter] for letter in letters]
+
+        values = value_table[grid]
+        filled = grid > 0
+
+        # Number each vertical run of letters, column by column so that every
+        # run is contiguous in column-major order
+        starts = filled.copy()
+        starts[1:] &= ~filled[:-1]
+        runs = (numpy.cumsum(starts.T.ravel()).reshape(self.dim, self.dim).T) * filled
+        nruns = runs.max()
+
+        run_values = numpy.bincount(runs.ravel(), weights=values.ravel(), minlength=nruns + 1).astype(int)
+        run_letters = [''] * (nruns + 1)
+        order = filled.T.ravel()
+        for run, code in zip(runs.T.ravel()[order].tolist(), grid.T.ravel()[order].tolist()):
+            run_letters[run] += letters[(code - 1) % len(letters)]
+
+        # Runs directly above and below each square (0 if there are none)
+        up = numpy.zeros_like(runs)
+        up[1:] = runs[:-1]
+        down = numpy.zeros_like(runs)
+        down[:-1] = runs[1:]
+
+        rows, cols = numpy.nonzero(~filled & ((up > 0) | (down > 0)))
+        ups, downs = up[rows, cols], down[rows, cols]
+        fragment_values = run_values[ups] + run_values[downs]
+
+        return [(row, col, run_letters[u], run_letters[d], value)
+                for row, col, u, d, value in zip(rows.tolist(), cols.tolist(), ups.tolist(), downs.tolist(), fragment_values.tolist())]
+
+    def is_anchor(self, row, col, squares=None):
         """Check if a square is an anchor square (empty square adjacent to a filled square).
+        squares may be given to check the flipped squares from lines() instead.
 
         >>> import board
         >>> b = board.Board()
@@ -419,8 +1152,11 @@ class Board:
         False
         """
 
+        if squares is None:
+            squares = self.squares
+
         # Anchor squares must be empty
-        if self.squares[row][col].letter:
+        if squares[row][col].letter:
             return False
 
         # Check adjacent squares for letters
@@ -429,11 +1165,47 @@ class Board:
                 and row + offset[0] < self.dim
                 and col + offset[1] >= 0
                 and col + offset[1] < self.dim
-                and self.squares[row+offset[0]][col+offset[1]].letter
+                and squares[row+offset[0]][col+offset[1]].letter
             ):
                 return True
         return False
 
+    def disturbed_squares(self, move):
+        """Return the set of empty squares, as (row, col), where the valid
+        moves may have changed because move was played. move must already be
+        on the board. These are the first empty squares in each direction
+        from each tile the move placed, skipping over other tiles: any move
+        whose words include one of the new tiles must place a tile on one of
+        them, so moves placing no tile on them are as valid, and score the
+        same, as before.
+
+        >>> import board
+        >>> b = Board()
+        >>> b.play(Move.from_str("CAT 8G"))
+        >>> b.play(Move.from_str("S(CAT) 8F"))
+        >>> sorted(b.disturbed_squares(Move.from_str("S(CAT) 8F")))
+        [(6, 5), (7, 4), (7, 9), (8, 5)]
+        >>> b.disturbed_squares(Move.from_str("ABC --"))
+        set([])
+        """
+
+        disturbed = set()
+        if move.kind == Move.MOVE_TRADE:
+            return disturbed
+
+        drow, dcol = (0, 1) if move.kind == Move.MOVE_ACROSS else (1, 0)
+        for i, placed in enumerate(move.tmask):
+            if not placed:
+                continue
+            row, col = move.row + i * drow, move.col + i * dcol
+            for up, across in (-1, 0), (1, 0), (0, -1), (0, 1):
+                r, c = row + up, col + across
+                while 0 <= r < self.dim and 0 <= c < self.dim and self.squares[r][c].letter:
+                    r, c = r + up, c + across
+                if 0 <= r < self.dim and 0 <= c < self.dim:
+                    disturbed.add((r, c))
+        return disturbed
+
     def letter_value(self, letter):
         if letter.isupper():
             return self.letter_values[letter]
@@ -453,10 +1225,7 @@ class Board:
         >>> b.alltiles
         ['?', '?', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'A', 'B', 'B', 'B', 'B', 'C', 'C', 'C', 'C', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'D', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'E', 'F', 'F', 'F', 'F']
         """
-        tiles = []
-        for c in sorted(self.letter_distribution.keys()):
-            tiles += list(c * self.letter_distribution[c])
-        return tiles
+        return list(self.variant.tiles)
 
     def __str__(self):
         r"""Human-readable string representation of a board.
@@ -468,19 +1237,13 @@ class Board:
         '        A     B     C     D     E     F     G     H     I     J     K     L     M     N     O \n  1 [  3W][    ][    ][  2L][    ][    ][    ][  3W][    ][    ][    ][  2L][    ][    ][  3W]\n  2 [    ][  2W][    ][    ][    ][  3L][    ][    ][    ][  3L][    ][    ][    ][  2W][    ]\n  3 [    ][    ][  2W][    ][    ][    ][  2L][    ][  2L][    ][    ][    ][  2W][    ][    ]\n  4 [  2L][    ][    ][  2W][    ][    ][    ][  2L][    ][    ][    ][  2W][    ][    ][  2L]\n  5 [    ][    ][    ][    ][  2W][    ][    ][    ][    ][    ][  2W][    ][    ][    ][    ]\n  6 [    ][  3L][    ][    ][    ][  3L][    ][    ][    ][  3L][    ][    ][    ][  3L][    ]\n  7 [    ][    ][  2L][    ][    ][    ][  2L][    ][  2L][    ][    ][    ][  2L][    ][    ]\n  8 [  3W][    ][    ][  2L][    ][    ][F   ][O 2W][O   ][    ][    ][  2L][    ][    ][  3W]\n  9 [    ][    ][  2L][    ][    ][    ][  2L][    ][  2L][    ][    ][    ][  2L][    ][    ]\n 10 [    ][  3L][    ][    ][    ][  3L][    ][    ][    ][  3L][    ][    ][    ][  3L][    ]\n 11 [    ][    ][    ][    ][  2W][    ][    ][    ][    ][    ][  2W][    ][    ][    ][    ]\n 12 [  2L][    ][    ][  2W][    ][    ][    ][  2L][    ][    ][    ][  2W][    ][    ][  2L]\n 13 [    ][    ][  2W][    ][    ][    ][  2L][    ][  2L][    ][    ][    ][  2W][    ][    ]\n 14 [    ][  2W][    ][    ][    ][  3L][    ][    ][    ][  3L][    ][    ][    ][  2W][    ]\n 15 [  3W][    ][    ][  2L][    ][    ][    ][  3W][    ][    ][    ][  2L][    ][    ][  3W]'
         """
         # Header
-        mystr = '    '
-        for i in range(0, self.dim):
-            mystr += "{0:>5s} ".format(chr(ord("A")+i))
-        mystr += "\n"
+        lines = ['    ' + ''.join("{0:>5s} ".format(chr(ord("A")+i)) for i in range(self.dim))]
 
         # Body
         for rownum, row in enumerate(self.squares):
-            mystr += "{0:3d} ".format(rownum+1)
-            for square in row:
-                mystr += str(square)
-            mystr += "\n"
+            lines.append("{0:3d} ".format(rownum+1) + ''.join(str(square) for square in row))
 
-        return mystr.rstrip("\n")
+        return "\n".join(lines)
 
 class Square:
     """Square on a Scrabble board
@@ -522,3 +1285,141 @@ class Square:
             return str(self.bonus_multiplier) + 'L'
         else:
             return ''
+
+class BoardView(Board):
+    """Read-only view of a Board (see Board.view), for in-process players
+    sharing the referee's board instead of keeping their own.
+
+    A view always shows the board's current position, and shares what is
+    worked out from it, like cross-checks, so they are found once per move
+    however many players and sinks search it. Its squares are frozen copies,
+    made once per position, so a player can't change the board through them.
+    """
+
+    readonly = True
+
+    def __init__(self, board):
+        d = self.__dict__
+        d["_board"] = board
+        for name in "variant", "dim", "bingo_bonus", "rack_size", "letter_distribution", "letter_values":
+            d[name] = getattr(board, name)
+
+    @property
+    def empty(self):
+        return self._board.empty
+
+    @property
+    def squares(self):
+        derived = self._board._derived
+        if "squares" not in derived:
+            derived["squares"] = tuple(tuple(FrozenSquare(square) for square in row) for row in self._board.squares)
+        return derived["squares"]
+
+    @property
+    def _derived(self):
+        return self._board._derived
+
+    def __setattr__(self, name, value):
+        raise TypeError("a board view can't be changed")
+
+    def play(self, move):
+        raise TypeError("a board view can't be played on")
+
+    def flip(self):
+        raise TypeError("a board view can't be changed")
+
+    def copy(self):
+        return self._board.copy()
+
+    def view(self):
+        return BoardView(self._board)
+
+class FrozenSquare(Square):
+    """Copy of a Square that can't be changed, for BoardView."""
+
+    def __init__(self, square):
+        self.__dict__.update(square.__dict__)
+
+    def __setattr__(self, name, value):
+        raise TypeError("a board view can't be changed")
+
+class LineCache:
+    """Moves found along single lines of boards, for Board.valid_moves. A
+    line's moves only depend on its letters, cross-checks and cross-scores,
+    and the rack, so a later search with the same rack can reuse them for
+    the lines that haven't changed: searching a position again (say, for
+    analysis), or searching again with a rack kept over a pass or while the
+    opponent moved. The exact rack is part of the key, so there are hardly
+    any hits across turns otherwise. At most size lines are kept; the least
+    recently used are dropped first.
+
+    Cached moves are only right for the lexicon as it was when they were
+    found, so don't use a cache across changes to a lexicon.
+
+    >>> import board, lexicon
+    >>> from board import LineCache
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> cache = LineCache(size=100)
+    >>> b = Board(variant='test')
+    >>> b.play(Move.from_str('ABBA 8G'))
+    >>> moves = b.valid_moves('ADC', t, cache=cache)
+    >>> cache.hits, cache.misses
+    (0, 30)
+    >>> [str(move) for move in b.valid_moves('DCA', t, cache=cache)] == [str(move) for move in moves]
+    True
+    >>> cache.hits, cache.misses
+    (30, 30)
+    >>> b.play(Move.from_str('C(A)B J7'))
+    >>> sorted(str(move) for move in b.valid_moves('ADC', t, columnar=True, cache=cache)) == sorted(str(move) for move in b.valid_moves('ADC', t))
+    True
+    >>> cache.hits, cache.misses, len(cache.lines)
+    (53, 37, 37)
+
+    An empty line in the middle of an empty board has the centre anchor,
+    but not on a board with tiles elsewhere:
+
+    >>> moves = Board(variant='test').valid_moves('AB', t, cache=cache)
+    >>> b = Board(variant='test')
+    >>> b.play(Move.from_str('ABBA A1'))
+    >>> sorted(str(move) for move in b.valid_moves('AB', t, cache=cache)) == sorted(str(move) for move in b.valid_moves('AB', t))
+    True
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.lines = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def line_moves(self, board, squares, orientation, row, rack, lexicon, rowcross, rowscore, profiler, moves, collapse_blanks, stop=None):
+        """Add the moves along one line of board to moves (a list or a
+        MoveList), like Board.line_moves; squares is board.lines()[orientation].
+        Moves of a search cut short by stop aren't kept."""
+
+        # The line's position on the board goes in the key too, since that
+        # decides its bonus squares and the positions of its moves, and so
+        # does whether the board is empty, which decides its anchors
+        key = (board.variant, orientation, row, board.empty, tuple(square.letter for square in squares[row]), tuple(rowcross), tuple(rowscore),
+               tuple(sorted(rack)), lexicon, lexicon.mask, collapse_blanks)
+
+        found = self.lines.pop(key, None)
+        if found is not None:
+            self.hits += 1
+            if profiler:
+                profiler.count("line_cache_hits")
+        else:
+            self.misses += 1
+            found = board.line_moves(squares, row, rack, lexicon, rowcross, rowscore, profiler, moves=MoveList(), collapse_blanks=collapse_blanks, stop=stop)
+            if stop is not None and stop.is_set():
+                moves.extend(found)
+                return
+            while len(self.lines) >= self.size:
+                self.lines.popitem(last=False)
+        self.lines[key] = found
+
+        moves.extend(found)
+
+class _SearchTimeout(Exception):
+    """Raised inside Board.line_moves when its deadline passes or it is
+    told to stop."""
+    pass
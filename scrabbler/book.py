@@ -0,0 +1,223 @@
+import mmap
+import multiprocessing
+import struct
+
+from board import Board
+from move import Move
+from variant import load_variant
+
+class OpeningBook:
+    """Precomputed best opening moves for every full rack of a variant,
+    stored in a file that is memory-mapped for lookups.
+
+    On an empty board the valid moves only depend on the rack, so they can
+    be found once for every distinct rack (see build). Each rack is mapped
+    to its position in the file by rank, which is computed from the rack's
+    letter counts, so a lookup reads one fixed-size record.
+
+    >>> import lexicon, os, tempfile
+    >>> from book import OpeningBook
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB', 'FACED'])
+    >>> path = os.path.join(tempfile.mkdtemp(), 'test.book')
+    >>> OpeningBook.build(path, t, variant='test', keep=3)
+    >>> book = OpeningBook(path)
+    >>> book.variant.name, book.keep, book.nracks
+    ('test', 3, 1422)
+    >>> [str(move) + " " + str(move.score) for move in book.lookup('FEDCABA')]
+    ['FACED 8D 30', 'FACED H4 30', 'FACED 8H 26']
+    >>> [str(move) for move in book.lookup('CB?EEEE')] == [str(move) for move in Board(variant='test').valid_moves('CB?EEEE', t, columnar=True).top(3)]
+    True
+    >>> book.lookup('EEEEEEE')
+    []
+    >>> book.lookup('ABC') is None
+    True
+
+    Players that play the highest scoring move use the book for their
+    first move; other players still search, since the moves they want may
+    not be in it:
+
+    >>> from player import Player, MaxScorePlayer
+    >>> class MinScorePlayer(Player):
+    ...     def best_move(self, moves):
+    ...         return min([move for move in moves if move.word and move.kind != Move.MOVE_TRADE], key=lambda x: x.score)
+    >>> MaxScorePlayer.ranks_by_score, MinScorePlayer.ranks_by_score
+    (True, False)
+    >>> move = MinScorePlayer(t, board=Board(variant='test'), book=book).move(list('ABAFDDE'), None)
+    >>> str(move), move.score
+    ('AA 8H', 4)
+    >>> str(MaxScorePlayer(t, board=Board(variant='test'), book=book).move(list('ABAFDDE'), None))
+    'DAB 8H'
+    >>> book.close()
+    """
+
+    MAGIC = 'SCRBOOK1'
+
+    # Magic, variant name, rack size, moves kept per rack, number of racks
+    HEADER = struct.Struct('<8s32sHHI')
+
+    # Row, column, kind and score of a move; the word follows, padded with
+    # NULs to the rack size. Unused slots have kind 0.
+    ENTRY = struct.Struct('<BBBh')
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, name, rack_size, keep, nracks = self.HEADER.unpack_from(self.map, 0)
+        if magic != self.MAGIC:
+            raise ValueError("not an opening book: " + path)
+
+        self.variant = load_variant(name.rstrip('\0'))
+        self.keep = keep
+        self.nracks = nracks
+        self.ranker = RackRanker(self.variant)
+        self.entry_size = self.ENTRY.size + self.variant.rack_size
+
+    def lookup(self, rack):
+        """List of the best opening Moves for a rack, best first. Returns None
+        if the rack is not a full rack of this variant."""
+
+        rank = self.ranker.rank(rack)
+        if rank is None:
+            return None
+
+        moves = []
+        offset = self.HEADER.size + rank * self.keep * self.entry_size
+        for i in range(self.keep):
+            row, col, kind, score = self.ENTRY.unpack_from(self.map, offset)
+            if not kind:
+                break
+            word = self.map[offset + self.ENTRY.size:offset + self.entry_size].rstrip('\0')
+            moves.append(Move(row=row, col=col, kind=kind, word=word, score=score))
+            offset += self.entry_size
+        return moves
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    @staticmethod
+    def build(path, lexicon, variant='scrabble', keep=1, workers=1):
+        """Find the keep best opening moves for every full rack of a variant
+        and write them to an opening book at path. If workers is more than 1,
+        racks are shared out among that many processes."""
+
+        ranker = RackRanker(load_variant(variant))
+        entry_size = OpeningBook.ENTRY.size + ranker.variant.rack_size
+
+        with open(path, 'wb') as f:
+            f.write(OpeningBook.HEADER.pack(OpeningBook.MAGIC, variant, ranker.variant.rack_size, keep, ranker.count()))
+
+            if workers <= 1:
+                _init_worker(lexicon, variant, keep)
+                records = (_opening_record(rack) for rack in ranker.racks())
+            else:
+                pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(lexicon, variant, keep))
+                records = pool.imap(_opening_record, ranker.racks(), chunksize=64)
+
+            try:
+                for record in records:
+                    assert len(record) == keep * entry_size
+                    f.write(record)
+            finally:
+                if workers > 1:
+                    pool.close()
+                    pool.join()
+
+class RackRanker:
+    """Numbers the distinct full racks of a variant from 0 to count() - 1.
+
+    >>> from book import RackRanker
+    >>> r = RackRanker(load_variant('test'))
+    >>> r.count()
+    1422
+    >>> racks = list(r.racks())
+    >>> racks[:2], racks[-1]
+    (['EEEFFFF', 'EEEEFFF'], '??AAAAA')
+    >>> all(r.rank(rack) == i for i, rack in enumerate(racks))
+    True
+    >>> r.rank('FFFFEEE'), r.rank('BBBBBAA')
+    (0, None)
+    """
+
+    def __init__(self, variant):
+        self.variant = variant
+        self.letters = sorted(variant.letter_distribution.keys())
+        self.limits = [variant.letter_distribution[letter] for letter in self.letters]
+        self.index = dict((letter, i) for i, letter in enumerate(self.letters))
+
+        # counts[i][n] is the number of racks of n tiles using only letters[i:]
+        size = variant.rack_size
+        counts = [[0] * (size + 1) for i in range(len(self.letters) + 1)]
+        counts[len(self.letters)][0] = 1
+        for i in reversed(range(len(self.letters))):
+            for n in range(size + 1):
+                counts[i][n] = sum(counts[i + 1][n - j] for j in range(min(self.limits[i], n) + 1))
+        self.counts = counts
+
+    def count(self):
+        """Number of distinct full racks."""
+        return self.counts[0][self.variant.rack_size]
+
+    def rank(self, rack):
+        """Number of a rack (in any order), or None if it is not a full rack
+        that can be drawn in this variant."""
+
+        if len(rack) != self.variant.rack_size:
+            return None
+
+        have = [0] * len(self.letters)
+        for letter in rack:
+            if letter not in self.index:
+                return None
+            have[self.index[letter]] += 1
+
+        # Racks are numbered in the order racks() produces them: by the count
+        # of the first letter, then the second, and so on
+        rank = 0
+        remaining = len(rack)
+        for i, n in enumerate(have):
+            if n > self.limits[i]:
+                return None
+            for j in range(n):
+                rank += self.counts[i + 1][remaining - j]
+            remaining -= n
+        return rank
+
+    def racks(self):
+        """Generate every full rack as a sorted string, in rank order."""
+
+        def generate(i, remaining, prefix):
+            if i == len(self.letters):
+                if not remaining:
+                    yield prefix
+                return
+            for j in range(min(self.limits[i], remaining) + 1):
+                if self.counts[i + 1][remaining - j]:
+                    for rack in generate(i + 1, remaining - j, prefix + self.letters[i] * j):
+                        yield rack
+
+        return generate(0, self.variant.rack_size, '')
+
+# Set in each worker process (or the building process) by _init_worker
+_worker_lexicon = None
+_worker_board = None
+_worker_keep = None
+
+def _init_worker(lexicon, variant, keep):
+    global _worker_lexicon, _worker_board, _worker_keep
+    _worker_lexicon = lexicon
+    _worker_board = Board(variant=variant)
+    _worker_keep = keep
+
+def _opening_record(rack):
+    """Book record for a rack: its best opening moves, packed."""
+
+    moves = _worker_board.valid_moves(rack, _worker_lexicon, columnar=True)
+    size = _worker_board.rack_size
+
+    record = ''
+    for i in moves.order()[:_worker_keep]:
+        record += OpeningBook.ENTRY.pack(moves.rows[i], moves.cols[i], moves.kinds[i], moves.scores[i])
+        record += moves.word(i).ljust(size, '\0')
+    return record.ljust(_worker_keep * (OpeningBook.ENTRY.size + size), '\0')
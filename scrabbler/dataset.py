@@ -0,0 +1,342 @@
+import array
+import ast
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import zipfile
+
+from board import Board, LineCache
+from move import Move
+from player import MaxScorePlayer
+from referee import Referee, RefereeSink
+
+class DatasetSink(RefereeSink):
+    """Collects a training record for every move of a game: the position,
+    the rack, the highest scoring candidate moves, the move chosen and the
+    final outcome. At the end of each game the records are added to writer
+    (a ShardWriter), if given, and kept in self.records. Candidates are
+    found with cache (a LineCache), if given; sharing it with the players
+    saves searching each position twice.
+
+    Each record is a dict with keys:
+
+        turn, seat      move number in the game, and which player moved
+        board           the letters on the board before the move, row by row,
+                        with NUL for empty squares (blanks are lower case)
+        rack            the player's rack before the move
+        score, opponent both players' scores before the move
+        move            (row, col, kind, score, word) of the move played
+        candidates      list of (row, col, kind, score, word), best first: the
+                        max_candidates highest scoring valid moves (with
+                        blanks collapsed if the player collapses them), plus
+                        the move played if it was not among them
+        chosen          index of the move played in candidates, or -1 for
+                        trades and passes
+        outcome         the player's final score minus the opponent's
+
+    >>> import board, lexicon
+    >>> from dataset import DatasetSink
+    >>> from referee import Referee
+    >>> from player import MaxScorePlayer
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> players = [MaxScorePlayer(t, board=board.Board(variant='test')) for i in range(2)]
+    >>> sink = DatasetSink(t, max_candidates=3)
+    >>> game = Referee(players[0], players[1], t, board=board.Board(variant='test'), random_draw=False, sinks=[sink]).run()
+    >>> len(sink.records) == len(game["moves"])
+    True
+    >>> record = sink.records[1]
+    >>> record["turn"], record["seat"], record["rack"], record["score"], record["opponent"], record["move"]
+    (1, 1, 'AAAAAAA', 0, 4, (6, 7, 1, 8, 'AA'))
+    >>> record["candidates"], record["chosen"]
+    ([(6, 7, 1, 8, 'AA'), (8, 7, 1, 8, 'AA'), (6, 8, 1, 6, 'AA')], 0)
+    >>> record["board"].replace('\\0', '.')[7 * 15:8 * 15]
+    '.......AA......'
+    >>> record["outcome"] == game["players"][1]["score"] - game["players"][0]["score"]
+    True
+    """
+
+    def __init__(self, lexicon, writer=None, max_candidates=64, cache=None):
+        self.lexicon = lexicon
+        self.cache = cache
+        self.writer = writer
+        self.max_candidates = max_candidates
+        self.records = []
+
+    def game_start(self, referee):
+        self.referee = referee
+        self.records = []
+
+    def move_validated(self, player, move, elapsed):
+        board = self.referee.board
+        seat = 0 if player is self.referee.players[0] else 1
+        opponent = self.referee.players[1 - seat]
+
+        # Highest scoring valid moves, searched for like the player does,
+        # and the move played
+        collapse_blanks = getattr(player["obj"], "collapse_blanks", False)
+        moves = board.valid_moves(player["rack"], self.lexicon, columnar=True, collapse_blanks=collapse_blanks, cache=self.cache)
+        indices = moves.order()[:self.max_candidates]
+        chosen = -1
+        if move.kind != Move.MOVE_TRADE:
+            i = moves.index(move)
+            if i not in indices:
+                indices.append(i)
+            chosen = indices.index(i)
+
+        self.records.append({
+            "turn": len(self.records),
+            "seat": seat,
+            "board": ''.join(square.letter or '\0' for row in board.squares for square in row),
+            "rack": ''.join(player["rack"]),
+            "score": player["score"] - move.score,
+            "opponent": opponent["score"],
+            "move": (move.row or 0, move.col or 0, move.kind, move.score, move.word),
+            "candidates": [(moves.rows[i], moves.cols[i], moves.kinds[i], moves.scores[i], moves.word(i)) for i in indices],
+            "chosen": chosen })
+
+    def game_end(self, referee, game):
+        scores = [player["score"] for player in game["players"]]
+        for record in self.records:
+            record["outcome"] = scores[record["seat"]] - scores[1 - record["seat"]]
+
+        if self.writer is not None:
+            self.writer.add_game(self.records)
+
+class ShardWriter:
+    """Writes records from DatasetSink to a directory of shards, each holding
+    the records of whole games in columns. A shard is written (under a
+    temporary name, then renamed) once it has at least shard_size records,
+    so memory use is bounded and a shard on disk is always complete.
+
+    Shards are zip files of .npy arrays, so numpy.load reads them directly
+    (read_shard does the same without numpy). Arrays with one entry per
+    record are:
+
+        game, turn, seat, score, opponent, outcome, chosen
+        board           uint8, (records, dim * dim), ASCII letters or 0
+        rack            uint8, (records, rack_size), ASCII letters or 0
+        move_row, move_col, move_kind, move_score
+        move_word       uint8, (records, dim), ASCII letters or 0
+        cand_offsets    records + 1 offsets; the candidates of record i are
+                        cand_offsets[i] to cand_offsets[i + 1]
+
+    and with one entry per candidate move: cand_row, cand_col, cand_kind,
+    cand_score and cand_word (like move_word). Finally games is
+    [first game, number of games].
+
+    Games are numbered in the order they are added. Opening a writer on a
+    directory that already has shards continues from them: ngames is the
+    number of games already written, and games added since the last shard
+    was written are lost.
+
+    >>> import os, tempfile
+    >>> from dataset import ShardWriter, read_shard
+    >>> path = tempfile.mkdtemp()
+    >>> writer = ShardWriter(path, dim=3, rack_size=2, shard_size=2)
+    >>> record = {"turn": 0, "seat": 0, "board": "\\0\\0\\0AB\\0\\0\\0\\0", "rack": "C?", "score": 0, "opponent": 0,
+    ...           "move": (0, 0, 1, 5, "CAB"), "candidates": [(0, 0, 1, 5, "CAB")], "chosen": 0, "outcome": 3}
+    >>> writer.add_game([record])
+    >>> writer.add_game([record, dict(record, turn=1, seat=1, candidates=[], chosen=-1, outcome=-3)])
+    >>> writer.add_game([record])
+    >>> writer.ngames, sorted(os.listdir(path))
+    (3, ['shard-00000.npz'])
+    >>> shard = read_shard(os.path.join(path, 'shard-00000.npz'))
+    >>> [list(shard[name][1]) for name in "games", "game", "turn", "outcome", "cand_offsets"]
+    [[0, 2], [0, 1, 1], [0, 0, 1], [3, 3, -3], [0, 1, 2, 2]]
+    >>> shard["board"][0], list(shard["board"][1][3:6])
+    ((3, 9), [65, 66, 0])
+    >>> writer = ShardWriter(path, dim=3, rack_size=2, shard_size=2)
+    >>> writer.ngames
+    2
+    >>> writer.close()
+    >>> sorted(os.listdir(path))
+    ['shard-00000.npz']
+    """
+
+    # Name, type code and width (None for one value per entry) of each
+    # column, per record and per candidate move
+    RECORD_COLUMNS = [("game", 'i', None), ("turn", 'h', None), ("seat", 'b', None), ("score", 'h', None),
+                      ("opponent", 'h', None), ("outcome", 'h', None), ("chosen", 'i', None),
+                      ("board", 'B', "area"), ("rack", 'B', "rack_size"),
+                      ("move_row", 'b', None), ("move_col", 'b', None), ("move_kind", 'b', None),
+                      ("move_score", 'h', None), ("move_word", 'B', "dim")]
+    CANDIDATE_COLUMNS = [("cand_row", 'b', None), ("cand_col", 'b', None), ("cand_kind", 'b', None),
+                         ("cand_score", 'h', None), ("cand_word", 'B', "dim")]
+
+    def __init__(self, path, dim=15, rack_size=7, shard_size=65536):
+        self.path = path
+        self.widths = {"dim": dim, "area": dim * dim, "rack_size": rack_size}
+        self.shard_size = shard_size
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # Continue after the shards already written
+        self.nshards = 0
+        self.ngames = 0
+        for name in sorted(os.listdir(path)):
+            if name.startswith('shard-') and name.endswith('.npz'):
+                self.nshards += 1
+                self.ngames += read_shard(os.path.join(path, name), ["games"])["games"][1][1]
+
+        self.reset()
+
+    def reset(self):
+        """Start a new, empty shard."""
+        self.first_game = self.ngames
+        self.nrecords = 0
+        self.columns = dict((name, array.array(code)) for name, code, width in self.RECORD_COLUMNS + self.CANDIDATE_COLUMNS)
+        self.columns["cand_offsets"] = array.array('i', [0])
+
+    def add_game(self, records):
+        """Add the records of one game."""
+
+        columns = self.columns
+        for record in records:
+            row, col, kind, score, word = record["move"]
+            values = {"game": self.ngames, "move_row": row, "move_col": col, "move_kind": kind, "move_score": score}
+            for name, code, width in self.RECORD_COLUMNS:
+                if width is None:
+                    columns[name].append(values[name] if name in values else record[name])
+            columns["board"].fromstring(self.pad(record["board"], "area"))
+            columns["rack"].fromstring(self.pad(record["rack"], "rack_size"))
+            columns["move_word"].fromstring(self.pad(word, "dim"))
+
+            for row, col, kind, score, word in record["candidates"]:
+                columns["cand_row"].append(row)
+                columns["cand_col"].append(col)
+                columns["cand_kind"].append(kind)
+                columns["cand_score"].append(score)
+                columns["cand_word"].fromstring(self.pad(word, "dim"))
+            columns["cand_offsets"].append(len(columns["cand_row"]))
+
+        self.ngames += 1
+        self.nrecords += len(records)
+        if self.nrecords >= self.shard_size:
+            self.flush()
+
+    def pad(self, s, width):
+        return s[:self.widths[width]].ljust(self.widths[width], '\0')
+
+    def flush(self):
+        """Write the games added so far as a shard."""
+
+        if self.ngames == self.first_game:
+            return
+
+        name = os.path.join(self.path, 'shard-%05d.npz' % self.nshards)
+        f = zipfile.ZipFile(name + '.tmp', 'w', zipfile.ZIP_DEFLATED)
+        try:
+            for columns in self.RECORD_COLUMNS, self.CANDIDATE_COLUMNS:
+                for column, code, width in columns:
+                    values = self.columns[column]
+                    shape = (len(values),) if width is None else (len(values) // self.widths[width], self.widths[width])
+                    f.writestr(column + '.npy', _npy(values, shape))
+            f.writestr('cand_offsets.npy', _npy(self.columns["cand_offsets"], (self.nrecords + 1,)))
+            f.writestr('games.npy', _npy(array.array('i', [self.first_game, self.ngames - self.first_game]), (2,)))
+        finally:
+            f.close()
+        os.rename(name + '.tmp', name)
+
+        self.nshards += 1
+        self.reset()
+
+    def close(self):
+        """Write any remaining games."""
+        self.flush()
+
+# numpy dtype for each array type code
+_DTYPES = {'b': 'i1', 'B': 'u1', 'h': 'i2', 'i': 'i4'}
+
+def _npy(values, shape):
+    """Contents of a .npy file holding an array.array with some shape."""
+
+    if sys.byteorder != 'little':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+
+    header = "{'descr': '<%s', 'fortran_order': False, 'shape': %r, }" % (_DTYPES[values.typecode], shape)
+    # Pad so the data starts on a multiple of 64 bytes, as numpy does
+    header = header.ljust(len(header) + (64 - (10 + len(header) + 1) % 64) % 64) + '\n'
+    return '\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header + values.tostring()
+
+def read_shard(path, names=None):
+    """Read the arrays in a shard written by ShardWriter (or only those in
+    names). Returns a dict of name -> (shape, flat array.array)."""
+
+    codes = dict((dtype, code) for code, dtype in _DTYPES.items())
+
+    arrays = {}
+    f = zipfile.ZipFile(path)
+    try:
+        for member in f.namelist():
+            name = member[:-len('.npy')]
+            if names is not None and name not in names:
+                continue
+
+            data = f.read(member)
+            length, = struct.unpack_from('<H', data, 8)
+            header = ast.literal_eval(data[10:10 + length])
+            values = array.array(codes[header['descr'][1:]])
+            values.fromstring(data[10 + length:])
+            if sys.byteorder != 'little':
+                values.byteswap()
+            arrays[name] = (header['shape'], values)
+    finally:
+        f.close()
+    return arrays
+
+def self_play(path, lexicon, games, workers=1, variant='scrabble', player=MaxScorePlayer, seed=0, max_candidates=64, shard_size=65536):
+    """Play games between two players of class player and write a record
+    of every move to shards in the directory path (see ShardWriter). Game
+    i is played with random seed seed + i, so if path already has shards
+    from an earlier run with the same arguments, this carries on where it
+    stopped. If workers is more than 1, games are shared out among that
+    many processes. Returns the number of games in path."""
+
+    board = Board(variant=variant)
+    writer = ShardWriter(path, dim=board.dim, rack_size=board.rack_size, shard_size=shard_size)
+    todo = range(writer.ngames, games)
+
+    if workers <= 1:
+        _init_worker(lexicon, variant, player, max_candidates)
+        results = (_play_game(seed + i) for i in todo)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(lexicon, variant, player, max_candidates))
+        results = pool.imap(_play_game, [seed + i for i in todo])
+
+    try:
+        for records in results:
+            writer.add_game(records)
+    finally:
+        if workers > 1:
+            pool.terminate()
+            pool.join()
+        writer.close()
+
+    return writer.ngames
+
+# Set in each worker process (or the calling process) by _init_worker
+_worker_lexicon = None
+_worker_variant = None
+_worker_player = None
+_worker_max_candidates = None
+
+def _init_worker(lexicon, variant, player, max_candidates):
+    global _worker_lexicon, _worker_variant, _worker_player, _worker_max_candidates
+    _worker_lexicon = lexicon
+    _worker_variant = variant
+    _worker_player = player
+    _worker_max_candidates = max_candidates
+
+def _play_game(seed):
+    """Play one game. Returns its records."""
+
+    random.seed(seed)
+    cache = LineCache()
+    players = [_worker_player(_worker_lexicon, cache=cache) for i in range(2)]
+    sink = DatasetSink(_worker_lexicon, max_candidates=_worker_max_candidates, cache=cache)
+    Referee(players[0], players[1], _worker_lexicon, board=Board(variant=_worker_variant), sinks=[sink], record_moves=False, share_board=True).run()
+    return sink.records
@@ -0,0 +1,146 @@
+import math
+import sqlite3
+
+class GameStore:
+    """SQLite database of game records, as returned by Referee.run.
+
+    Games are buffered and written batch_size at a time, each batch in one
+    transaction. Call flush (or close) to write any remaining games.
+
+    >>> from gamestore import GameStore
+    >>> store = GameStore(':memory:', batch_size=2)
+    >>> store.add({"moves": [{"player": "p1", "rack": "ABCDEFG", "move": "BAD 8G", "score": 12, "time": 300},
+    ...                      {"player": "p2", "rack": "HIJKLMN", "move": "--", "score": 0, "time": 100}],
+    ...            "players": [{"id": "p1", "rack": "CEFG", "score": 12}, {"id": "p2", "rack": "HIJKLMN", "score": 0}]})
+    >>> store.add({"moves": [{"player": "p1", "rack": "ABCDEFG", "move": "FACED 8D", "score": 26, "time": 500}],
+    ...            "players": [{"id": "p1", "rack": "BG", "score": 26}, {"id": "p2", "rack": "ZZZZZZZ", "score": 0, "exception": "no move"}],
+    ...            "game": {"id": "g2"}})
+    >>> store.count()
+    2
+    >>> sorted(store.game_ids())
+    [u'g2']
+    >>> store.player_stats() == [
+    ...     {"player": "p1", "games": 2, "wins": 2, "mean": 19.0, "min": 12, "max": 26},
+    ...     {"player": "p2", "games": 2, "wins": 0, "mean": 0.0, "min": 0, "max": 0}]
+    True
+    >>> store.score_distribution("p1")
+    [(12, 1), (26, 1)]
+    >>> store.move_time_percentiles("p1", [0, 50, 100])
+    [300, 300, 500]
+    >>> store.close()
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            game INTEGER PRIMARY KEY,
+            gameid TEXT,
+            nmoves INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS players (
+            game INTEGER NOT NULL REFERENCES games(game),
+            seat INTEGER NOT NULL,
+            player TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            rack TEXT NOT NULL,
+            exception TEXT,
+            PRIMARY KEY (game, seat)
+        );
+        CREATE TABLE IF NOT EXISTS moves (
+            game INTEGER NOT NULL REFERENCES games(game),
+            seq INTEGER NOT NULL,
+            player TEXT NOT NULL,
+            rack TEXT NOT NULL,
+            move TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            time INTEGER NOT NULL,
+            PRIMARY KEY (game, seq)
+        );
+        CREATE INDEX IF NOT EXISTS players_player ON players (player, score);
+        CREATE INDEX IF NOT EXISTS moves_player ON moves (player, time);
+        CREATE INDEX IF NOT EXISTS moves_move ON moves (move);
+        CREATE INDEX IF NOT EXISTS moves_score ON moves (score);
+    """
+
+    def __init__(self, path, batch_size=1000):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(self.SCHEMA)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def add(self, game):
+        """Add a game record, as returned by Referee.run."""
+        self.pending.append(game)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered games in one transaction."""
+
+        if not self.pending:
+            return
+
+        with self.db:
+            cursor = self.db.cursor()
+            for game in self.pending:
+                gameid = game["game"]["id"] if "game" in game else None
+                cursor.execute("INSERT INTO games (gameid, nmoves) VALUES (?, ?)", (gameid, len(game["moves"])))
+                rowid = cursor.lastrowid
+
+                cursor.executemany("INSERT INTO players VALUES (?, ?, ?, ?, ?, ?)",
+                    [(rowid, seat, player["id"], player["score"], player["rack"], player.get("exception"))
+                     for seat, player in enumerate(game["players"])])
+                cursor.executemany("INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(rowid, seq, move["player"], move["rack"], move["move"], move["score"], move["time"])
+                     for seq, move in enumerate(game["moves"])])
+
+        self.pending = []
+
+    def close(self):
+        """Write buffered games and close the database."""
+        self.flush()
+        self.db.close()
+
+    def count(self):
+        """Number of games stored."""
+        self.flush()
+        return self.db.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def game_ids(self):
+        """Set of the game ids stored (games without one are left out)."""
+        self.flush()
+        return set(row[0] for row in self.db.execute("SELECT gameid FROM games WHERE gameid IS NOT NULL"))
+
+    def player_stats(self):
+        """Final score statistics for each player, as a list of dicts with
+        keys player, games, wins, mean, min and max."""
+
+        self.flush()
+        rows = self.db.execute("""
+            SELECT p.player, COUNT(*), SUM(p.score > o.score), AVG(p.score), MIN(p.score), MAX(p.score)
+            FROM players p JOIN players o ON o.game = p.game AND o.seat != p.seat
+            GROUP BY p.player ORDER BY p.player""")
+        return [{"player": player, "games": games, "wins": wins, "mean": mean, "min": lo, "max": hi}
+                for player, games, wins, mean, lo, hi in rows]
+
+    def score_distribution(self, player):
+        """List of (final score, number of games) for a player."""
+        self.flush()
+        return self.db.execute(
+            "SELECT score, COUNT(*) FROM players WHERE player = ? GROUP BY score ORDER BY score", (player,)).fetchall()
+
+    def move_time_percentiles(self, player, percentiles):
+        """Move times (in microseconds) at the given percentiles (0 to 100) of
+        all moves by a player."""
+
+        self.flush()
+        n = self.db.execute("SELECT COUNT(*) FROM moves WHERE player = ?", (player,)).fetchone()[0]
+        if not n:
+            return [None] * len(percentiles)
+
+        # Nearest rank, read straight off the (player, time) index
+        ret = []
+        for p in percentiles:
+            offset = min(n, max(1, int(math.ceil(p / 100.0 * n)))) - 1
+            ret.append(self.db.execute(
+                "SELECT time FROM moves WHERE player = ? ORDER BY time LIMIT 1 OFFSET ?", (player, offset)).fetchone()[0])
+        return ret
@@ -1,3 +1,9 @@
+import os
+import re
+import weakref
+
+from anagram import AnagramIndex
+
 class Lexicon:
     """Lexicon represented as a trie -- a tree in which each edge is a character and each
     node represents a prefix composed of all edges from the root to that node. Nodes that
@@ -33,11 +39,214 @@ class Lexicon:
     False
     >>> t.subtree('bar').final
     True
+
+    For fast traversal, nodes can also be visited with a cursor: each node
+    has an integer id, starting with ROOT, and child, edges and is_final
+    look them up in tables compiled on first use.
+
+    >>> node = t.child(t.ROOT, 'b')
+    >>> t.edges(node)
+    (('a', 3),)
+    >>> node = t.walk('ba')
+    >>> [letter for letter, child in t.edges(node)], t.is_final(node)
+    (['r', 'z'], False)
+    >>> t.is_final(t.child(node, 'z'))
+    True
+    >>> t.child(node, 'x'), t.walk('xxx')
+    (-1, -1)
+
+    A lexicon can hold several dictionaries at once (see from_iterables).
+    Each final node then has a bitmask of the dictionaries containing its
+    word, and select returns a view of the same trie that only sees some of
+    them.
     """
 
+    # Cursor id of the root node
+    ROOT = 0
+
     def __init__(self, root=None):
         self.root = {} if root is None else root
 
+        # Cursor tables, compiled on first use by _compile: the edges out of
+        # each node as a tuple of (char, node), the same edges as a dict, and
+        # whether each node is final
+        self._edges = None
+        self._children = None
+        self._final = None
+
+        # Cursor tables already compiled, by (root, mask), and every view of
+        # the same trie (from select and subtree), so add can reset them;
+        # both shared with views
+        self._tables = {}
+        self._views = weakref.WeakSet([self])
+
+        # Set for lexicons built by from_iterable, whose nodes may be shared
+        # between several prefixes
+        self.minimized = False
+
+        # Bit for each dictionary name, and the bits of the dictionaries this
+        # lexicon sees (the "_F" value of final nodes is a mask of these bits)
+        self.dictionaries = {}
+        self.mask = 1
+
+        # Built on first use by the anagram_index property
+        self._anagram_index = None
+
+    @staticmethod
+    def from_iterable(words, board=None):
+        """Build a lexicon from an iterable of words in one pass.
+
+        Words are stripped and uppercased. If a board is provided, words that
+        contain letters outside of its alphabet, or that are longer than the
+        board, are dropped since they can never be played.
+
+        Words are inserted in sorted order and equivalent suffixes are merged
+        as they are completed (incremental DAWG minimization), so the result
+        uses far fewer nodes than a plain trie.
+
+        >>> import board
+        >>> b = board.Board(variant='test')
+        >>> t = Lexicon.from_iterable(['cab', 'dab', "dab's", 'Fab', 'caf\\xe9', 'ab', 'zab', 'abbabbabbabbabba'], board=b)
+        >>> t.all()
+        ['AB', 'CAB', 'DAB', 'FAB']
+        >>> t.subtree('C').root is t.subtree('D').root
+        True
+        >>> t.add('CAD')
+        >>> t.all()
+        ['AB', 'CAB', 'CAD', 'DAB', 'FAB']
+        >>> t.exists('DAD')
+        False
+        """
+
+        if board is None:
+            playable = bool
+        else:
+            playable = Lexicon._playable(board)
+
+        return Lexicon._build((word, 1) for word in sorted(set(w for w in (w.strip().upper() for w in words) if playable(w))))
+
+    @staticmethod
+    def from_iterables(lists, board=None):
+        """Build a lexicon holding several dictionaries, from a list of
+        (name, iterable of words) pairs. Words in more than one dictionary
+        are stored once. Use select to pick which dictionaries to use;
+        otherwise all of them are used. See from_iterable for details.
+
+        >>> t = Lexicon.from_iterables([('twl', ['AB', 'BA', 'ABA']), ('sow', ['AB', 'BA', 'ABBA'])])
+        >>> t.all()
+        ['AB', 'ABA', 'ABBA', 'BA']
+        >>> twl, sow = t.select('twl'), t.select('sow')
+        >>> twl.all(), sow.all(), twl.root is sow.root
+        (['AB', 'ABA', 'BA'], ['AB', 'ABBA', 'BA'], True)
+        >>> twl.exists('ABBA'), sow.exists('ABBA'), t.exists('ABBA')
+        (False, True, True)
+        >>> twl.subtree('AB').next(), sow.subtree('AB').next()
+        (['A'], ['B'])
+        >>> [letter for letter, node in twl.edges(twl.walk('AB'))], twl.is_final(twl.walk('ABA')), sow.walk('ABA')
+        (['A'], True, -1)
+        >>> twl.add('ABAB')
+        >>> twl.exists('ABAB'), sow.exists('ABAB')
+        (True, False)
+
+        Views see words added through any of them:
+
+        >>> t.add('BAA')
+        >>> twl.walk('BAA') >= 0, sow.walk('BAA') >= 0, twl.is_final(twl.walk('BAA'))
+        (True, True, True)
+        >>> import pickle
+        >>> pickle.loads(pickle.dumps(sow, 2)).all()
+        ['AB', 'ABBA', 'BA', 'BAA']
+        """
+
+        if board is None:
+            playable = bool
+        else:
+            playable = Lexicon._playable(board)
+
+        dictionaries = {}
+        masks = {}
+        for i, (name, words) in enumerate(lists):
+            bit = dictionaries[name] = 1 << i
+            for word in words:
+                word = word.strip().upper()
+                if playable(word):
+                    masks[word] = masks.get(word, 0) | bit
+
+        lexicon = Lexicon._build(sorted(masks.iteritems()))
+        lexicon.dictionaries = dictionaries
+        lexicon.mask = sum(dictionaries.values())
+        return lexicon
+
+    @staticmethod
+    def _playable(board):
+        """Function matching words that can be played on board."""
+        alphabet = ''.join(sorted(board.letter_values.keys()))
+        return re.compile('[' + re.escape(alphabet) + ']{1,' + str(board.dim) + '}$').match
+
+    @staticmethod
+    def _build(words):
+        """Build a minimized lexicon from sorted, unique (word, mask) pairs."""
+
+        root = {}
+
+        # Nodes that have been fully built and merged, keyed by their signature
+        register = {}
+
+        # Path of (parent, char, child) edges for the most recently added word
+        # whose children may still change
+        unchecked = []
+
+        def minimize(depth):
+            while len(unchecked) > depth:
+                parent, char, child = unchecked.pop()
+                # Final nodes without children are very common, so their
+                # signature is just their mask
+                if len(child) == 1 and '_F' in child:
+                    signature = child['_F']
+                else:
+                    signature = Lexicon._signature(child)
+                if signature in register:
+                    parent[char] = register[signature]
+                else:
+                    register[signature] = child
+
+        previous = ''
+        for word, mask in words:
+            # Length of the prefix shared with the previous word
+            common = len(os.path.commonprefix((word, previous)))
+
+            # Everything past the common prefix is complete now
+            minimize(common)
+
+            node = unchecked[-1][2] if unchecked else root
+            for char in word[common:]:
+                child = {}
+                node[char] = child
+                unchecked.append((node, char, child))
+                node = child
+            node["_F"] = mask
+            previous = word
+
+        minimize(0)
+
+        lexicon = Lexicon(root=root)
+        lexicon.minimized = True
+        return lexicon
+
+    @staticmethod
+    def from_file(path, board=None):
+        """Build a lexicon from a word list file with one word per line.
+        See from_iterable for details."""
+
+        with open(path) as f:
+            return Lexicon.from_iterable(f, board=board)
+
+    @staticmethod
+    def _signature(node):
+        """Key identifying all nodes that accept the same set of suffixes.
+        Children must already be minimized."""
+        return frozenset((char, child if char == '_F' else id(child)) for char, child in node.iteritems())
+
     def add(self, word):
         """Add a word to this trie."""
 
@@ -45,10 +254,36 @@ class Lexicon:
         for char in word:
             if char not in node:
                 node[char] = {}
+            elif self.minimized:
+                # This node may be shared with other prefixes, so copy it
+                # before changing anything beneath it
+                node[char] = dict(node[char])
             node = node[char]
 
-        # We're at the final node -- mark it as such
-        node["_F"] = True
+        # We're at the final node -- mark it as such, for the dictionaries
+        # this lexicon sees
+        node["_F"] = node.get("_F", 0) | self.mask
+
+        # Any index or cursor tables over the old word list are stale now,
+        # in every view
+        for view in self._views:
+            view._anagram_index = None
+            view._edges = view._children = view._final = None
+        self._tables.clear()
+
+    def __getstate__(self):
+        # Compiled tables are rebuilt on demand, and a copy isn't a view of
+        # this lexicon's trie
+        state = self.__dict__.copy()
+        state["_edges"] = state["_children"] = state["_final"] = None
+        state["_tables"] = {}
+        state["_anagram_index"] = None
+        del state["_views"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._views = weakref.WeakSet([self])
 
     def exists(self, word):
         """Check if a word exists in this trie."""
@@ -59,7 +294,7 @@ class Lexicon:
                 return False
             node = node[char]
 
-        return '_F' in node
+        return bool(node.get('_F', 0) & self.mask)
 
     def all(self):
         """Sorted list of all words in this trie."""
@@ -69,10 +304,10 @@ class Lexicon:
         # Search edges in alphabetical order
         # So we return a sorted list of words
         def search(node, word=''):
-            if '_F' in node:
+            if node.get('_F', 0) & self.mask:
                 wordlist.append(word)
             for char in sorted(node.keys()):
-                if char is not '_F':
+                if char != '_F':
                     search(node[char], word + char)
 
         search(self.root)
@@ -89,12 +324,161 @@ class Lexicon:
                 return None
             node = node[char]
 
-        return Lexicon(root=node)
+        return self._view(node, self.mask)
+
+    def select(self, selector):
+        """View of this lexicon that only sees some of its dictionaries. The
+        selector is a dictionary name, a list of names, or a mask. The view
+        shares the trie with this lexicon."""
+
+        if isinstance(selector, (int, long)):
+            mask = selector
+        elif isinstance(selector, basestring):
+            mask = self.dictionaries[selector]
+        else:
+            mask = sum(self.dictionaries[name] for name in selector)
+
+        return self._view(self.root, mask)
+
+    def _view(self, root, mask):
+        view = Lexicon(root=root)
+        view.minimized = self.minimized
+        view.dictionaries = self.dictionaries
+        view.mask = mask
+        view._tables = self._tables
+        view._views = self._views
+        self._views.add(view)
+        return view
 
     def next(self):
         """Returns a list of edges leading out of this node."""
-        return filter(lambda x: x is not '_F', self.root.keys())
+        if len(self.dictionaries) <= 1 or self.mask == sum(self.dictionaries.values()):
+            return filter(lambda x: x != '_F', self.root.keys())
+
+        # Only edges leading to words in the selected dictionaries, which
+        # are the ones the cursor tables keep
+        return [char for char, node in self.edges(self.ROOT)]
+
+    def child(self, node, char):
+        """Cursor id of the node reached from node along the edge char, or -1
+        if there is no such edge."""
+        if self._children is None:
+            self._compile()
+        return self._children[node].get(char, -1)
+
+    def edges(self, node):
+        """Tuple of (char, node) for the edges leading out of node, sorted by char."""
+        if self._edges is None:
+            self._compile()
+        return self._edges[node]
+
+    def is_final(self, node):
+        """Whether node ends a word."""
+        if self._final is None:
+            self._compile()
+        return self._final[node]
+
+    def walk(self, prefix, node=ROOT):
+        """Cursor id of the node reached from node along prefix, or -1 if there
+        is no such node."""
+        for char in prefix:
+            if node < 0:
+                break
+            node = self.child(node, char)
+        return node
+
+    def coded_cursor(self, alphabet):
+        """Cursor tables with letters as codes from a variant's Alphabet:
+        (edges, children, final), where edges[node] is a tuple of (code,
+        node) sorted by code, children[node] maps codes to nodes and
+        final[node] is whether node ends a word. Node ids are the same as
+        for child and edges, and letters not in the alphabet are left out.
+
+        >>> from lexicon import Lexicon
+        >>> from variant import Alphabet
+        >>> t = Lexicon.from_iterable(['CHA', 'CAB', 'AX'])
+        >>> a = Alphabet({'A': 1, 'B': 3, 'C': 3, 'H': 4})
+        >>> edges, children, final = t.coded_cursor(a)
+        >>> [a.decode([code]) for code, node in edges[t.ROOT]]
+        ['A', 'C']
+        >>> children[t.walk('C')][a.codes['H']] == t.walk('CH'), edges[t.walk('A')]
+        (True, ())
+        """
+
+        if self._edges is None:
+            self._compile()
+
+        key = (id(self.root), self.mask, alphabet)
+        if key not in self._tables:
+            codes = alphabet.codes
+            edges = [tuple((codes[char], child) for char, child in out if char in codes) for out in self._edges]
+            self._tables[key] = (edges, [dict(out) for out in edges], self._final)
+
+        return self._tables[key]
+
+    def _compile(self):
+        """Number the nodes of this trie, and build the tables used by the
+        cursor methods. Nodes shared between prefixes get a single id. Edges
+        that lead to no word in the selected dictionaries are left out."""
+
+        key = (id(self.root), self.mask)
+        if key not in self._tables:
+            self._tables[key] = self._compile_tables()
+        self._edges, self._children, self._final = self._tables[key]
+
+    def _compile_tables(self):
+        mask = self.mask
+
+        # Mask of the dictionaries with a word at or below each node
+        below = {}
+        def visit(node):
+            if id(node) not in below:
+                m = node.get('_F', 0)
+                for char, child in node.iteritems():
+                    if char != '_F':
+                        m |= visit(child)
+                below[id(node)] = m
+            return below[id(node)]
+        visit(self.root)
+
+        ids = {id(self.root): self.ROOT}
+        nodes = [self.root]
+        edges = []
+        final = []
+
+        # Breadth first, so ids are assigned in the order nodes are appended
+        for node in nodes:
+            out = []
+            for char in sorted(node.keys()):
+                if char != '_F':
+                    child = node[char]
+                    if not below[id(child)] & mask:
+                        continue
+                    if id(child) not in ids:
+                        ids[id(child)] = len(nodes)
+                        nodes.append(child)
+                    out.append((char, ids[id(child)]))
+            edges.append(tuple(out))
+            final.append(bool(node.get('_F', 0) & mask))
+
+        return edges, [dict(out) for out in edges], final
+
+    @property
+    def anagram_index(self):
+        """AnagramIndex over all words in this trie, built on first use.
+
+        >>> t = Lexicon.from_iterable(['ACT', 'CAT', 'DOG'])
+        >>> t.anagram_index.anagrams('TAC')
+        ['ACT', 'CAT']
+        >>> t.add('TAC')
+        >>> t.anagram_index.anagrams('TAC')
+        ['ACT', 'CAT', 'TAC']
+        """
+
+        if self._anagram_index is None:
+            self._anagram_index = AnagramIndex(self.all())
+        return self._anagram_index
 
     @property
     def final(self):
-        return '_F' in self.root
+        return bool(self.root.get('_F', 0) & self.mask)
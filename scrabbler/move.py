@@ -1,5 +1,13 @@
+import array
+import heapq
+import itertools
 import re
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class Move:
     """Move in a Scrabble game
 
@@ -53,6 +61,12 @@ class Move:
     MOVE_DOWN = 2
     MOVE_TRADE = 3
 
+    # Patterns for from_str, compiled once
+    DOWN_POSITION = re.compile(r"^([A-Z])([0-9]+)$")
+    ACROSS_POSITION = re.compile(r"^([0-9]+)([A-Z])$")
+    TRADE_WORD = re.compile(r"^([A-Za-z\?]*|\**)$")
+    PLACED_WORD = re.compile(r"^([A-Za-z\(\)]+|\*+)$")
+
     def __init__(self, row, col, kind, word, tmask=None, score=0):
         self.row = row
         self.col = col
@@ -178,14 +192,14 @@ class Move:
             row = None
             col = None
         else:
-            m = re.search('^([A-Z])([0-9]+)$', pos)
+            m = Move.DOWN_POSITION.match(pos)
             if m:
                 # DOWN move
                 kind = Move.MOVE_DOWN
                 row = int(m.group(2)) - 1
                 col = ord(m.group(1)) - ord('A')
 
-            m = re.search('^([0-9]+)([A-Z])$', pos)
+            m = Move.ACROSS_POSITION.match(pos)
             if m:
                 # ACROSS move
                 kind = Move.MOVE_ACROSS
@@ -198,11 +212,11 @@ class Move:
 
         if kind is Move.MOVE_TRADE:
             # TRADE
-            if not re.search(r"^([A-Za-z\?]*|\**)$", word):
+            if not Move.TRADE_WORD.match(word):
                 raise InvalidMoveError("invalid word: " + word);
         else:
             # ACROSS or DOWN
-            if not re.search(r"^([A-Za-z\(\)]+|\*+)$", word):
+            if not Move.PLACED_WORD.match(word):
                 raise InvalidMoveError("invalid word: " + word);
 
             # Scan word so we can create tmask
@@ -283,6 +297,228 @@ class Move:
     def __ne__(self, other):
         return not self == other
 
+class MoveList:
+    """Columnar list of across and down moves, as returned by
+    Board.valid_moves(..., columnar=True).
+
+    Moves are stored as parallel arrays: rows, cols, kinds, scores, tmasks
+    (bit i is set if the i-th letter is a newly placed tile) and offsets into
+    one buffer of letters holding every word. Sorting, top-k and filtering
+    work on the arrays, and Move objects are only created for the entries
+    that are looked up.
+
+    >>> from move import Move, MoveList
+    >>> moves = MoveList()
+    >>> moves.add(7, 7, Move.MOVE_ACROSS, 'FOO', 12, 0b111)
+    >>> moves.append(Move.from_str('(F)Ed H8'))
+    >>> moves.add(7, 6, Move.MOVE_ACROSS, 'oF', 4, 0b01)
+    >>> len(moves), list(moves.scores)
+    (3, [12, 0, 4])
+    >>> str(moves[0]), str(moves[-1]), moves.word(1)
+    ('FOO 8H', 'o(F) 8G', 'FEd')
+    >>> [str(move) for move in moves.top(2)]
+    ['FOO 8H', 'o(F) 8G']
+    >>> moves.order()
+    [0, 2, 1]
+    >>> [str(move) for move in moves.filter(kind=Move.MOVE_DOWN)]
+    ['(F)Ed H8']
+    >>> [str(move) for move in moves.filter(min_score=1, min_tiles=2)]
+    ['FOO 8H']
+    >>> moves.index(Move.from_str('o(F) 8G'))
+    2
+    >>> Move.from_str('OF 8G') in moves
+    False
+
+    With NumPy, top, filter and select work on whole columns at once, and
+    give the same results as without it:
+
+    >>> import random
+    >>> r = random.Random(1)
+    >>> many = MoveList()
+    >>> for i in range(500): many.add(r.randrange(15), r.randrange(15), r.choice([Move.MOVE_ACROSS, Move.MOVE_DOWN]), 'AB'[:r.randrange(1, 3)], r.randrange(20), r.randrange(4))
+    >>> top, filtered = [str(m) + str(m.score) for m in many.top(30)], [str(m) for m in many.filter(kind=Move.MOVE_DOWN, min_score=5, min_tiles=2)]
+    >>> top == [str(many[i]) + str(many.scores[i]) for i in many.order()[:30]]
+    True
+    >>> import move
+    >>> saved, move.numpy = move.numpy, None
+    >>> top == [str(m) + str(m.score) for m in many.top(30)], filtered == [str(m) for m in many.filter(kind=Move.MOVE_DOWN, min_score=5, min_tiles=2)]
+    (True, True)
+    >>> move.numpy = saved
+    """
+
+    def __init__(self):
+        self.rows = array.array('h')
+        self.cols = array.array('h')
+        self.kinds = array.array('b')
+        self.scores = array.array('i')
+        self.tmasks = array.array('L')
+
+        # Word i is letters[offsets[i]:offsets[i + 1]]
+        self.offsets = array.array('i', [0])
+        self.letters = array.array('c')
+
+    def add(self, row, col, kind, word, score, tmask):
+        """Add a move. tmask is an integer with bit i set if the i-th letter
+        of word is a newly placed tile."""
+        self.rows.append(row)
+        self.cols.append(col)
+        self.kinds.append(kind)
+        self.scores.append(score)
+        self.tmasks.append(tmask)
+        self.letters.fromstring(word)
+        self.offsets.append(len(self.letters))
+
+    def append(self, move):
+        """Add a Move object."""
+        tmask = sum(1 << i for i, placed in enumerate(move.tmask) if placed)
+        self.add(move.row, move.col, move.kind, move.word, move.score, tmask)
+
+    def extend(self, moves):
+        """Add every move of another MoveList, or an iterable of Moves."""
+        if isinstance(moves, MoveList):
+            # Whole columns at a time
+            base = len(self.letters)
+            self.rows.extend(moves.rows)
+            self.cols.extend(moves.cols)
+            self.kinds.extend(moves.kinds)
+            self.scores.extend(moves.scores)
+            self.tmasks.extend(moves.tmasks)
+            self.letters.extend(moves.letters)
+            self.offsets.extend(array.array('i', [base + offset for offset in moves.offsets[1:]]))
+        else:
+            for move in moves:
+                self.append(move)
+
+    def word(self, i):
+        """Word of the i-th move."""
+        return self.letters[self.offsets[i]:self.offsets[i + 1]].tostring()
+
+    def tiles(self, i):
+        """Number of tiles placed by the i-th move."""
+        return bin(self.tmasks[i]).count('1')
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __getitem__(self, i):
+        """Move object for the i-th move."""
+        if i < 0:
+            i += len(self)
+        word = self.word(i)
+        tmask = self.tmasks[i]
+        return Move(
+            row   = self.rows[i],
+            col   = self.cols[i],
+            kind  = self.kinds[i],
+            word  = word,
+            score = self.scores[i],
+            tmask = [bool(tmask & (1 << j)) for j in range(len(word))])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def order(self):
+        """Indices of the moves from highest to lowest score. Moves with the
+        same score stay in the order they were added."""
+        if numpy is not None and len(self):
+            scores = numpy.frombuffer(self.scores, dtype=numpy.intc)
+            return numpy.argsort(-scores, kind='mergesort').tolist()
+        return sorted(range(len(self)), key=lambda i: -self.scores[i])
+
+    def top(self, k):
+        """List of the k highest scoring Moves, highest first. Moves with the
+        same score stay in the order they were added, as in order()."""
+        if numpy is not None and len(self):
+            scores = self._column(self.scores)
+            if k < len(self):
+                # Only the moves scoring at least the k-th highest score
+                # need sorting
+                threshold = numpy.partition(scores, len(self) - k)[len(self) - k]
+                candidates = numpy.flatnonzero(scores >= threshold)
+            else:
+                candidates = numpy.arange(len(self))
+            indices = candidates[numpy.argsort(-scores[candidates], kind='mergesort')[:k]].tolist()
+        else:
+            indices = [-i for score, i in heapq.nlargest(k, itertools.izip(self.scores, itertools.count(0, -1)))]
+        return [self[i] for i in indices]
+
+    def best(self):
+        """Highest scoring Move, or None if there are no moves."""
+        top = self.top(1)
+        return top[0] if top else None
+
+    def select(self, indices):
+        """New MoveList with the moves at these indices."""
+        moves = MoveList()
+        if numpy is not None and len(indices):
+            # Gather each column at once
+            indices = numpy.asarray(indices, dtype=numpy.intp)
+            for name in "rows", "cols", "kinds", "scores", "tmasks":
+                getattr(moves, name).fromstring(self._column(getattr(self, name))[indices].tostring())
+
+            offsets = self._column(self.offsets)
+            starts = offsets[indices]
+            lengths = offsets[indices + 1] - starts
+            ends = numpy.cumsum(lengths)
+
+            # Where each letter of the new buffer comes from in this one
+            picks = numpy.arange(ends[-1]) + numpy.repeat(starts - (ends - lengths), lengths)
+            moves.letters.fromstring(self._column(self.letters)[picks].tostring())
+            moves.offsets.fromstring(ends.astype(numpy.intc).tostring())
+            return moves
+
+        for i in indices:
+            moves.add(self.rows[i], self.cols[i], self.kinds[i], self.word(i), self.scores[i], self.tmasks[i])
+        return moves
+
+    def filter(self, kind=None, min_score=None, min_tiles=None):
+        """New MoveList with the moves of a kind, scoring at least min_score,
+        and placing at least min_tiles tiles."""
+        if numpy is not None and len(self):
+            keep = numpy.ones(len(self), dtype=bool)
+            if kind is not None:
+                keep &= self._column(self.kinds) == kind
+            if min_score is not None:
+                keep &= self._column(self.scores) >= min_score
+            if min_tiles is not None:
+                # Count the bits of each tmask, a byte at a time
+                tmasks = self._column(self.tmasks).view(numpy.uint8).reshape(len(self), -1)
+                keep &= numpy.unpackbits(tmasks, axis=1).sum(axis=1) >= min_tiles
+            return self.select(numpy.flatnonzero(keep))
+
+        keep = [True] * len(self)
+        if kind is not None:
+            keep = [k and value == kind for k, value in itertools.izip(keep, self.kinds)]
+        if min_score is not None:
+            keep = [k and score >= min_score for k, score in itertools.izip(keep, self.scores)]
+        if min_tiles is not None:
+            keep = [k and bin(tmask).count('1') >= min_tiles for k, tmask in itertools.izip(keep, self.tmasks)]
+        return self.select(list(itertools.compress(itertools.count(), keep)))
+
+    @staticmethod
+    def _column(values):
+        """NumPy array sharing the memory of one of the columns."""
+        return numpy.frombuffer(values, dtype=values.typecode)
+
+    def index(self, move):
+        """Index of the first move equal to a Move. Raises ValueError if
+        there is none, like list.index."""
+        if move.kind in (Move.MOVE_ACROSS, Move.MOVE_DOWN):
+            tmask = sum(1 << i for i, placed in enumerate(move.tmask) if placed)
+            for i in range(len(self)):
+                if (self.rows[i] == move.row and self.cols[i] == move.col and self.kinds[i] == move.kind
+                        and self.tmasks[i] == tmask and self.word(i) == move.word):
+                    return i
+        raise ValueError(str(move) + " is not in list")
+
+    def __contains__(self, move):
+        try:
+            self.index(move)
+            return True
+        except ValueError:
+            return False
+
 class InvalidMoveError(ValueError):
     """Raised when a player attempts to play an invalid move.
 
@@ -0,0 +1,124 @@
+import multiprocessing
+
+from move import Move
+from position import Position
+from profiler import Profiler
+from variant import Variant, load_variant
+
+class MovePool:
+    """Pool of worker processes that share out the move generation for a
+    single board. Each row (for across moves) and column (for down moves) is
+    searched independently, so lines are handed out to workers and the
+    results are merged back in the same order Board.valid_moves would
+    produce them.
+
+    This pays off for large variants and racks with blanks, where each line
+    takes a long time to search; for small boards the cost of sending boards
+    and moves between processes can outweigh the gain. Boards are sent
+    encoded as Positions, which is much cheaper than pickling them, and
+    are decoded against the pool's variant, which is given to the workers
+    when they start. So a pool only searches boards of that variant, which
+    needn't be one in a file.
+
+    >>> import board, lexicon
+    >>> from parallel import MovePool
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> b = board.Board(variant='test')
+    >>> b.play(Move.from_str('ABBA 8G'))
+    >>> pool = MovePool(t, workers=2, variant='test')
+    >>> p = Profiler()
+    >>> moves = b.valid_moves('AAB?', t, pool=pool, profiler=p)
+    >>> pool.close()
+    >>> [str(move) for move in moves] == [str(move) for move in b.valid_moves('AAB?', t)]
+    True
+    >>> len(moves), p.current["moves"], p.current["nodes"] > 0
+    (192, 192, True)
+
+    Counters and timings from the workers are added to the profiler given
+    to valid_moves; timings are summed over the workers.
+
+    >>> import copy
+    >>> custom = copy.copy(b.variant)
+    >>> custom.__dict__["name"] = "in memory"
+    >>> c = board.Board(variant=custom)
+    >>> c.play(Move.from_str('ABBA 8G'))
+    >>> pool = MovePool(t, workers=2, variant=custom)
+    >>> [str(move) for move in c.valid_moves('AAB?', t, pool=pool)] == [str(move) for move in c.valid_moves('AAB?', t)]
+    True
+    >>> b.valid_moves('AAB?', t, pool=pool)
+    Traceback (most recent call last):
+    ValueError: pool is for variant in memory, not test
+    >>> pool.close()
+    """
+
+    def __init__(self, lexicon, workers, variant='scrabble'):
+        """Start workers processes searching lexicon, for boards of variant
+        (a name, see load_variant, or a Variant object)."""
+
+        if not isinstance(variant, Variant):
+            variant = load_variant(variant)
+        self.variant = variant
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(lexicon, variant))
+
+    def valid_moves(self, board, rack, checks, scores, collapse_blanks=False, profiler=None):
+        """Find valid moves on board, given its cross-checks and cross-scores
+        from Board.all_cross_checks. Normally called by Board.valid_moves."""
+
+        if board.variant is not self.variant:
+            raise ValueError("pool is for variant " + self.variant.name + ", not " + board.variant.name)
+
+        # (orientation, row) for every line, in the order moves are returned
+        lines = [(orientation, row) for orientation in (0, 1) for row in range(board.dim)]
+
+        # Hand out lines round-robin, so the busy lines near the middle of the
+        # board are spread across tasks
+        ntasks = min(len(lines), 4 * self.workers)
+        position = Position(board, [], [], []).encode(history=False)
+        tasks = []
+        for i in range(ntasks):
+            task = [(orientation, row, checks[orientation][row], scores[orientation][row]) for orientation, row in lines[i::ntasks]]
+            tasks.append((position, list(rack), task, collapse_blanks, profiler is not None))
+
+        results = {}
+        for result, counts in self.pool.map(_search_lines, tasks, chunksize=1):
+            results.update(result)
+            if profiler:
+                for name, n in counts.iteritems():
+                    profiler.count(name, n)
+
+        moves = []
+        for line in lines:
+            for row, col, kind, word, score, tmask in results[line]:
+                moves.append(Move(row=row, col=col, kind=kind, word=word, score=score, tmask=tmask))
+        return moves
+
+    def close(self):
+        """Stop the worker processes."""
+        self.pool.close()
+        self.pool.join()
+
+# Set in each worker process by _init_worker
+_worker_lexicon = None
+_worker_variant = None
+
+def _init_worker(lexicon, variant):
+    global _worker_lexicon, _worker_variant
+    _worker_lexicon = lexicon
+    _worker_variant = variant
+
+def _search_lines(args):
+    """Search some lines of a board. Returns a dict of (orientation, row) ->
+    list of moves, as tuples since those are cheaper to send back, and the
+    profiler counters for the search (empty unless profiling)."""
+
+    position, rack, task, collapse_blanks, profiling = args
+    board = Position.decode(position, _worker_variant).board
+    lines = board.lines()
+    profiler = Profiler() if profiling else None
+
+    results = {}
+    for orientation, row, rowcross, rowscore in task:
+        moves = board.line_moves(lines[orientation], row, rack, _worker_lexicon, rowcross, rowscore, profiler, collapse_blanks=collapse_blanks)
+        results[(orientation, row)] = [(m.row, m.col, m.kind, m.word, m.score, m.tmask) for m in moves]
+    return results, profiler.current if profiler else {}
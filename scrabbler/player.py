@@ -1,15 +1,42 @@
 import subprocess
 import random
+import time
 
 import lexicon
 from board import Board
 from move import Move
 
 class Player:
-    def __init__(self, lexicon, board=None):
+    # Whether best_move only needs the highest scoring way of playing each
+    # word in each position (see Board.valid_moves)
+    collapse_blanks = False
+
+    # Whether best_move picks the highest scoring move, so that the best
+    # moves kept in an opening book are all it needs
+    ranks_by_score = False
+
+    def __init__(self, lexicon, board=None, profiler=None, pool=None, budget=None, book=None, cache=None):
         self.board = board if board else Board()
         self.rack = []
         self.lexicon = lexicon
+        self.profiler = profiler
+        self.pool = pool
+
+        # Seconds allowed for finding each move. If set, the most promising
+        # moves are searched first and the best move found when time runs
+        # out is played (passing if nothing was found).
+        self.budget = budget
+
+        # OpeningBook to look up first moves in, instead of searching; only
+        # used if ranks_by_score
+        self.book = book
+
+        # LineCache to share search results with other turns and players
+        self.cache = cache
+
+        # (rack, moves) found by ponder for the board before the opponent's
+        # move, or None
+        self.pondered = None
 
     def can_trade(self):
         # We can trade if there are more than self.board.rack_size tiles left in the bag
@@ -18,15 +45,79 @@ class Player:
         else:
             return False
 
+    def can_ponder(self):
+        """Whether our rack for the next move is known already: it is full,
+        or there are no tiles left for us to draw. Never true with a view of
+        the referee's board, which our own move isn't on yet when move
+        returns, so there is nothing to ponder on."""
+        if self.board.readonly:
+            return False
+        if len(self.rack) >= self.board.rack_size:
+            return True
+        unseen = len(self.board.alltiles) - sum([1 for row in self.board.squares for square in row if square.letter]) - len(self.rack)
+        return unseen <= self.board.rack_size
+
+    def ponder(self, stop=None):
+        """Find our moves on the current board while the opponent thinks.
+        When the opponent's move arrives, move only searches where it changed
+        the board (see Board.disturbed_squares) and reuses the rest. Only
+        useful if can_ponder(); otherwise move searches from scratch.
+
+        If stop (a threading.Event) is set before the search is done, it is
+        abandoned, and move searches from scratch too."""
+        self.pondered = None
+        moves = self.board.valid_moves(self.rack, self.lexicon, collapse_blanks=self.collapse_blanks, cache=self.cache, stop=stop)
+        if stop is None or not stop.is_set():
+            self.pondered = (sorted(self.rack), moves)
+
+    def unponder(self, opponent_move):
+        """Valid moves after opponent_move was played, from what ponder
+        found, or None if they can't be worked out from it."""
+
+        rack, moves = self.pondered
+        if rack != sorted(self.rack):
+            return None
+        if not opponent_move:
+            return list(moves)
+
+        # Drop moves placing tiles on the opponent's tiles or where they
+        # changed things, and search there again
+        disturbed = self.board.disturbed_squares(opponent_move)
+        squares = self.board.squares
+        survivors = []
+        for move in moves:
+            drow, dcol = (0, 1) if move.kind == Move.MOVE_ACROSS else (1, 0)
+            for i, placed in enumerate(move.tmask):
+                row, col = move.row + i * drow, move.col + i * dcol
+                if placed and (squares[row][col].letter or (row, col) in disturbed):
+                    break
+            else:
+                survivors.append(move)
+
+        if disturbed:
+            survivors += self.board.valid_moves(self.rack, self.lexicon, profiler=self.profiler, squares=sorted(disturbed), collapse_blanks=self.collapse_blanks)
+        return survivors
+
     def move(self, tiles, opponent_move):
-        if opponent_move:
+        # A view of the referee's board has the opponent's move on it already
+        if opponent_move and not self.board.readonly:
             self.board.play(opponent_move)
 
         if tiles:
             self.rack += tiles
 
-        # Start with valid words
-        moves = self.board.valid_moves(self.rack, self.lexicon)
+        deadline = time.time() + self.budget if self.budget is not None else None
+
+        # Start with valid words; on an empty board these only depend on
+        # the rack, so the best of them may be in the opening book
+        moves = None
+        if self.book is not None and self.ranks_by_score and self.board.empty and self.book.variant is self.board.variant:
+            moves = self.book.lookup(self.rack)
+        if moves is None and self.pondered is not None:
+            moves = self.unponder(opponent_move)
+        self.pondered = None
+        if moves is None:
+            moves = self.board.valid_moves(self.rack, self.lexicon, profiler=self.profiler, pool=self.pool, deadline=deadline, collapse_blanks=self.collapse_blanks, cache=self.cache)
 
         # Add a pass
         moves.append(Move(row=None, col=None, kind=Move.MOVE_TRADE, word=''))
@@ -49,12 +140,17 @@ class Player:
             else:
                 self.rack.remove('?')
 
-        # Play move onto the board
-        self.board.play(move)
+        # Play move onto the board, unless it is the referee's, which gets
+        # it once the referee accepts it
+        if not self.board.readonly:
+            self.board.play(move)
 
         return move
 
 class MaxScorePlayer(Player):
+    collapse_blanks = True
+    ranks_by_score = True
+
     def best_move(self, moves):
         return max(moves, key = lambda x: x.score)
 
@@ -0,0 +1,434 @@
+import struct
+
+from board import Board
+from move import Move
+from referee import RefereeSink
+from variant import load_variant
+
+class Position:
+    """A moment in a game: the board, each player's rack and score, the bag
+    and the moves played so far, with a compact binary encoding for sending
+    positions between processes and storing them.
+
+    Letters are stored as one byte each, using the variant's Alphabet codes
+    (0 for an empty square, and for the hidden letters of a masked trade),
+    so the board is dim * dim bytes and is encoded and decoded in bulk.
+
+    >>> from position import Position
+    >>> b = Board(variant='test')
+    >>> moves = [Move.from_str('ABBA 8G'), Move.from_str('A(B)A H7'), Move.from_str('CA? --')]
+    >>> for move in moves[:2]: b.play(move)
+    >>> p = Position(b, [list('CEF'), list('DD?')], [12, 5], list('EEFFF'), moves)
+    >>> data = p.encode()
+    >>> len(data)
+    332
+    >>> q = Position.decode(data)
+    >>> str(q.board) == str(b), q.racks, q.scores, q.bag
+    (True, [['C', 'E', 'F'], ['D', 'D', '?']], [12, 5], ['E', 'E', 'F', 'F', 'F'])
+    >>> [str(move) for move in q.history], q.turn, q.board.empty
+    (['ABBA 8G', 'A(B)A H7', 'CA? --'], 1, False)
+    >>> q = Position.decode(p.encode(history=False))
+    >>> q.ply, q.history, q.turn
+    (3, [], 1)
+    >>> Position.decode('SCRPOS\\x09' + data[7:])
+    Traceback (most recent call last):
+    ValueError: unsupported position version: 9
+    >>> Position.decode(data[:-3])
+    Traceback (most recent call last):
+    ValueError: truncated move
+    >>> Position.decode(data[:20])
+    Traceback (most recent call last):
+    ValueError: truncated position header
+    >>> Position.decode(data + 'X')
+    Traceback (most recent call last):
+    ValueError: trailing data after position
+
+    Positions are decoded against the variant named in them, or against a
+    Variant given to decode, which must have that name; this is how
+    variants that aren't in a file are decoded:
+
+    >>> Position.decode(data, b.variant).board.variant is b.variant
+    True
+    >>> from variant import Variant
+    >>> Position.decode(data, Variant('other', {"dim": 3, "bingo_bonus": 0, "rack_size": 1, "letter_distribution": {}, "letter_values": {}, "bonus": []}))
+    Traceback (most recent call last):
+    ValueError: position is for variant test, not other
+
+    Variant names are stored in 32 bytes, and longer ones can't be encoded:
+
+    >>> Position(Board(variant=Variant('x' * 33, {"dim": 3, "bingo_bonus": 0, "rack_size": 1, "letter_distribution": {}, "letter_values": {}, "bonus": []})), [], [], []).encode()
+    Traceback (most recent call last):
+    ValueError: variant name is too long to encode: xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    """
+
+    MAGIC = 'SCRPOS'
+    VERSION = 1
+
+    # Magic, version, variant name, ply, number of moves included, bag size
+    # and number of players; the board follows, then each player, the bag
+    # and the moves
+    HEADER = struct.Struct('<6sB32sHHHB')
+
+    # Score and rack size of a player; the rack follows
+    PLAYER = struct.Struct('<iB')
+
+    # Row, column, kind, score, number of letters and tmask (bit i set if
+    # the i-th letter was placed) of a move; the letters follow. Trades have
+    # row and column 255.
+    MOVE = struct.Struct('<BBBhBI')
+
+    def __init__(self, board, racks, scores, bag, history=(), ply=None):
+        self.board = board
+        self.racks = racks
+        self.scores = scores
+        self.bag = bag
+        self.history = list(history)
+
+        # Number of moves played, which may be more than len(history) if
+        # the position was encoded without them
+        self.ply = ply if ply is not None else len(self.history)
+
+    @property
+    def turn(self):
+        """Index of the player to move."""
+        return self.ply % len(self.racks)
+
+    def play(self, move, drawn):
+        """Play the next move, by the player to move, who then draws the
+        tiles drawn (a list of letters) from the bag, like Referee.run. The
+        final adjustments for the tiles left on racks are not made."""
+
+        seat = self.turn
+        rack = self.racks[seat]
+        for letter in move.tiles:
+            rack.remove(letter if letter.isupper() else '?')
+        for letter in drawn:
+            self.bag.remove(letter)
+        rack += drawn
+        if move.kind == Move.MOVE_TRADE:
+            self.bag += list(move.word)
+
+        self.board.play(move)
+        self.scores[seat] += move.score
+        self.history.append(move)
+        self.ply += 1
+
+    def encode(self, history=True):
+        """Encode this position as a string. If history is False, the moves
+        played are left out (the ply is still kept)."""
+
+        alphabet = self.board.variant.alphabet
+        codes = alphabet.codes
+        moves = self.history if history else []
+
+        if len(self.board.variant.name) > 32:
+            raise ValueError("variant name is too long to encode: " + self.board.variant.name)
+
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, self.board.variant.name, self.ply, len(moves), len(self.bag), len(self.racks))]
+        parts.append(bytearray(codes[square.letter] if square.letter else 0 for row in self.board.squares for square in row))
+        for rack, score in zip(self.racks, self.scores):
+            parts.append(self.PLAYER.pack(score, len(rack)))
+            parts.append(alphabet.encode(rack))
+        parts.append(alphabet.encode(self.bag))
+        for move in moves:
+            parts.append(_encode_move(alphabet, move))
+        return ''.join(str(part) for part in parts)
+
+    @staticmethod
+    def decode(data, variant=None):
+        """Decode a Position from a string made by encode. Raises ValueError
+        if it isn't one. The board is of variant (a Variant) if given, and
+        otherwise of the variant loaded by the name in data."""
+
+        position, offset = Position._decode(data, 0, variant)
+        if offset != len(data):
+            raise ValueError("trailing data after position")
+        return position
+
+    @staticmethod
+    def _decode(data, offset, variant=None):
+        """Decode a Position starting at offset in data. Returns the position
+        and the offset just past it."""
+
+        magic, version, name, ply, nmoves, nbag, nplayers = _unpack(Position.HEADER, data, offset, "position header")
+        if magic != Position.MAGIC:
+            raise ValueError("not a position")
+        if version != Position.VERSION:
+            raise ValueError("unsupported position version: " + str(version))
+        offset += Position.HEADER.size
+
+        name = name.rstrip('\0')
+        if variant is None:
+            variant = load_variant(name)
+        elif variant.name != name:
+            raise ValueError("position is for variant " + name + ", not " + variant.name)
+        board = Board(variant=variant)
+        alphabet = board.variant.alphabet
+        names = alphabet.names
+        buf = bytearray(data)
+
+        # Only occupied squares need touching
+        dim = board.dim
+        for i, code in enumerate(_take(buf, offset, dim * dim, "board")):
+            if code:
+                if not names[code]:
+                    raise ValueError("bad letter code: " + str(code))
+                board.squares[i // dim][i % dim].letter = names[code]
+                board.empty = False
+        offset += dim * dim
+
+        racks, scores = [], []
+        for i in range(nplayers):
+            score, size = _unpack(Position.PLAYER, data, offset, "player")
+            offset += Position.PLAYER.size
+            racks.append(_letters(alphabet, _take(buf, offset, size, "rack")))
+            scores.append(score)
+            offset += size
+
+        bag = _letters(alphabet, _take(buf, offset, nbag, "bag"))
+        offset += nbag
+
+        history = []
+        for i in range(nmoves):
+            move, offset = _decode_move(alphabet, data, buf, offset)
+            history.append(move)
+
+        return Position(board, racks, scores, bag, history, ply), offset
+
+class GameTape:
+    """Recording of a game that can jump to the position after any move
+    without replaying the whole game. Each move is stored with the tiles
+    drawn after it, and every interval moves the position is stored too (a
+    checkpoint), so at most interval - 1 moves are replayed.
+
+    >>> import lexicon
+    >>> from position import GameTape, TapeRecorder
+    >>> from referee import Referee
+    >>> from player import MaxScorePlayer
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB', 'BAD', 'DA', 'AD'])
+    >>> players = [MaxScorePlayer(t) for i in range(2)]
+    >>> recorder = TapeRecorder(interval=4)
+    >>> ref = Referee(players[0], players[1], t, board=Board(variant='test'), random_draw=False, sinks=[recorder], share_board=True)
+    >>> game = ref.run()
+    >>> tape = recorder.tape
+    >>> len(tape), len(tape.checkpoints), len(game["moves"])
+    (20, 6, 20)
+    >>> p = tape.position(6)
+    >>> p.ply, [str(move) for move in p.history] == [move["move"] for move in game["moves"][:6]]
+    (6, True)
+    >>> tape = GameTape.decode(tape.encode())
+    >>> final = tape.position(len(tape))
+    >>> str(final.board) == str(ref.board), final.bag == ref.bag
+    (True, True)
+    >>> final.racks == [player["rack"] for player in ref.players]
+    True
+    >>> tape.position(21)
+    Traceback (most recent call last):
+    IndexError: no move 21 in this game
+    >>> GameTape.decode(tape.encode()[:-3])
+    Traceback (most recent call last):
+    ValueError: truncated move
+    """
+
+    MAGIC = 'SCRTAPE'
+    VERSION = 1
+
+    # Magic, version, checkpoint interval, number of moves and number of
+    # checkpoints. Each checkpoint's size and position follow, then the
+    # moves, each followed by the number of tiles drawn and the tiles.
+    HEADER = struct.Struct('<7sBHHH')
+
+    # Size of a checkpoint
+    SIZE = struct.Struct('<I')
+
+    def __init__(self, start, interval=16):
+        """Start recording a game from start, a Position before the first
+        move, with checkpoints every interval moves."""
+
+        self.interval = interval
+        self.variant = start.board.variant
+
+        # (move, tiles drawn) for each move
+        self.moves = []
+
+        # Encoded position after every interval moves, without history
+        self.checkpoints = [start.encode(history=False)]
+
+        # Position after the last move
+        self.current = Position.decode(self.checkpoints[0], self.variant)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add(self, move, drawn):
+        """Record the next move and the tiles drawn after it."""
+
+        move = Move(move.row, move.col, move.kind, move.word, list(move.tmask), move.score)
+        self.current.play(move, list(drawn))
+        self.moves.append((move, list(drawn)))
+        if len(self.moves) % self.interval == 0:
+            self.checkpoints.append(self.current.encode(history=False))
+
+    def position(self, ply):
+        """Position after the first ply moves, as a new Position."""
+
+        if not 0 <= ply <= len(self.moves):
+            raise IndexError("no move " + str(ply) + " in this game")
+
+        i = ply // self.interval
+        position = Position.decode(self.checkpoints[i], self.variant)
+        position.history = [move for move, drawn in self.moves[:i * self.interval]]
+        for move, drawn in self.moves[i * self.interval:ply]:
+            position.play(move, list(drawn))
+        return position
+
+    def encode(self):
+        """Encode this tape as a string."""
+
+        alphabet = self.variant.alphabet
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, self.interval, len(self.moves), len(self.checkpoints))]
+        for checkpoint in self.checkpoints:
+            parts.append(self.SIZE.pack(len(checkpoint)))
+            parts.append(checkpoint)
+        for move, drawn in self.moves:
+            parts.append(_encode_move(alphabet, move))
+            parts.append(chr(len(drawn)))
+            parts.append(alphabet.encode(drawn))
+        return ''.join(str(part) for part in parts)
+
+    @staticmethod
+    def decode(data, variant=None):
+        """Decode a GameTape from a string made by encode. Raises ValueError
+        if it isn't one. See Position.decode for variant."""
+
+        magic, version, interval, nmoves, ncheckpoints = _unpack(GameTape.HEADER, data, 0, "game tape header")
+        if magic != GameTape.MAGIC:
+            raise ValueError("not a game tape")
+        if version != GameTape.VERSION:
+            raise ValueError("unsupported game tape version: " + str(version))
+        if not interval or ncheckpoints != nmoves // interval + 1:
+            raise ValueError("bad number of checkpoints: " + str(ncheckpoints))
+        offset = GameTape.HEADER.size
+
+        checkpoints = []
+        for i in range(ncheckpoints):
+            size, = _unpack(GameTape.SIZE, data, offset, "checkpoint")
+            checkpoints.append(str(_take(data, offset + 4, size, "checkpoint")))
+            offset += 4 + size
+
+        tape = GameTape(Position.decode(checkpoints[0], variant), interval)
+        tape.checkpoints = checkpoints
+        alphabet = tape.variant.alphabet
+        buf = bytearray(data)
+        for i in range(nmoves):
+            move, offset = _decode_move(alphabet, data, buf, offset)
+            ndrawn = _take(buf, offset, 1, "tiles drawn")[0]
+            drawn = _letters(alphabet, _take(buf, offset + 1, ndrawn, "tiles drawn"))
+            offset += 1 + ndrawn
+            tape.moves.append((move, drawn))
+        if offset != len(data):
+            raise ValueError("trailing data after game tape")
+
+        tape.current = tape.position(nmoves)
+        return tape
+
+class TapeRecorder(RefereeSink):
+    """Records each game a Referee runs as a GameTape, in self.tape.
+    Moves are recorded as played, before trades are masked."""
+
+    def __init__(self, interval=16):
+        self.interval = interval
+        self.tape = None
+
+    def game_start(self, referee):
+        self.referee = referee
+        self.start = Position(referee.board.copy(), [[] for player in referee.players],
+                [player["score"] for player in referee.players], list(referee.bag))
+        self.tape = None
+        self.pending = None
+
+    def draw(self, player, tiles):
+        if self.tape is None:
+            # Starting racks
+            seat = 0 if player is self.referee.players[0] else 1
+            self.start.racks[seat] += tiles
+            for letter in tiles:
+                self.start.bag.remove(letter)
+        elif self.pending is not None:
+            self.tape.add(self.pending, tiles)
+            self.pending = None
+
+    def move_validated(self, player, move, elapsed):
+        if self.tape is None:
+            self.tape = GameTape(self.start, self.interval)
+        self.pending = move
+
+    def game_end(self, referee, game):
+        if self.tape is None:
+            self.tape = GameTape(self.start, self.interval)
+
+def _encode_move(alphabet, move):
+    """Encode a Move like Position.MOVE, followed by its letters."""
+
+    if move.kind == Move.MOVE_TRADE:
+        row = col = 255
+    else:
+        row, col = move.row, move.col
+    tmask = 0
+    for i, placed in enumerate(move.tmask):
+        if placed:
+            tmask |= 1 << i
+
+    if move.word[:1] == '*':
+        letters = bytearray(len(move.word))
+    else:
+        letters = alphabet.encode(move.word)
+    return Position.MOVE.pack(row, col, move.kind, move.score, len(letters), tmask) + str(letters)
+
+def _decode_move(alphabet, data, buf, offset):
+    """Decode a Move encoded by _encode_move at offset in data (buf is data
+    as a bytearray). Returns the move and the offset just past it."""
+
+    row, col, kind, score, length, tmask = _unpack(Position.MOVE, data, offset, "move")
+    offset += Position.MOVE.size
+    letters = _take(buf, offset, length, "move")
+    offset += length
+
+    if kind not in (Move.MOVE_ACROSS, Move.MOVE_DOWN, Move.MOVE_TRADE):
+        raise ValueError("bad move kind: " + str(kind))
+    if kind == Move.MOVE_TRADE:
+        row = col = None
+    if length and not letters[0]:
+        word = '*' * length
+    else:
+        word = ''.join(_letters(alphabet, letters))
+    return Move(row, col, kind, word, [bool(tmask & (1 << i)) for i in range(length)], score), offset
+
+def _unpack(fmt, data, offset, what):
+    """fmt.unpack_from(data, offset), raising ValueError if data is too short
+    to hold it; what names it in the error."""
+
+    if offset + fmt.size > len(data):
+        raise ValueError("truncated " + what)
+    try:
+        return fmt.unpack_from(data, offset)
+    except struct.error as e:
+        raise ValueError(what + ": " + str(e))
+
+def _take(buf, offset, size, what):
+    """The size bytes of buf at offset, raising ValueError if buf is too
+    short; what names them in the error."""
+
+    if offset + size > len(buf):
+        raise ValueError("truncated " + what)
+    return buf[offset:offset + size]
+
+def _letters(alphabet, codes):
+    """List of the letters with codes, raising ValueError for a code that
+    isn't one."""
+
+    names = alphabet.names
+    letters = [names[code] for code in codes]
+    if not all(letters):
+        raise ValueError("bad letter code in: " + ' '.join(str(code) for code in codes))
+    return letters
@@ -0,0 +1,65 @@
+import timeit
+
+class Profiler:
+    """Opt-in counters and timings for move generation and refereeing.
+
+    Pass a Profiler to Board.valid_moves, Player or Referee to collect
+    statistics. Everything recorded between two calls to end_move is
+    aggregated into one per-move record, and all records are also summed
+    into per-game totals. Counters are plain counts; timers are
+    nanoseconds, stored under "<phase>_ns".
+
+    Code that accepts a profiler does nothing extra when it is None.
+
+    >>> from profiler import Profiler
+    >>> p = Profiler()
+    >>> p.count("nodes", 10)
+    >>> p.count("nodes")
+    >>> p.add_time("search", 1500)
+    >>> p.end_move(move="FOO 8G")
+    >>> p.prefix = "referee."
+    >>> p.count("nodes", 2)
+    >>> p.end_move(move="BAR 9G")
+    >>> p.to_dict() == {
+    ...     "moves": [{"move": "FOO 8G", "nodes": 11, "search_ns": 1500}, {"move": "BAR 9G", "referee.nodes": 2}],
+    ...     "game": {"nodes": 11, "search_ns": 1500, "referee.nodes": 2}}
+    True
+    """
+
+    def __init__(self):
+        # Name prefix for everything recorded, used to tell apart the same
+        # phase run by different callers (players versus the referee)
+        self.prefix = ""
+
+        self.current = {}
+        self.moves = []
+        self.totals = {}
+
+    @staticmethod
+    def clock():
+        """Current time in nanoseconds, for use with add_time."""
+        return int(timeit.default_timer() * 10**9)
+
+    def count(self, name, n=1):
+        """Add n to a counter for the current move."""
+        name = self.prefix + name
+        self.current[name] = self.current.get(name, 0) + n
+
+    def add_time(self, phase, ns):
+        """Add ns nanoseconds to a phase timer for the current move."""
+        self.count(phase + "_ns", ns)
+
+    def end_move(self, **info):
+        """Close the current move's record, adding info to it, and start a new one."""
+
+        for name, value in self.current.items():
+            self.totals[name] = self.totals.get(name, 0) + value
+
+        record = dict(self.current)
+        record.update(info)
+        self.moves.append(record)
+        self.current = {}
+
+    def to_dict(self):
+        """JSON-friendly representation of everything recorded so far."""
+        return {"moves": self.moves, "game": self.totals}
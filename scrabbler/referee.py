@@ -5,12 +5,27 @@ import time
 import lexicon
 from board import Board
 from move import Move, InvalidMoveError
-from player import TrainingPlayer, ExternalPlayer, ExternalPlayerError
+from player import Player, TrainingPlayer, ExternalPlayer, ExternalPlayerError
 
 class Referee:
-    """Manage a game between two Players."""
+    """Manage a game between two Players.
 
-    def __init__(self, player1, player2, lexicon=None, board=None, random_draw=True, player1id=None, player2id=None):
+    If a Profiler is provided, per-move statistics are collected in it and
+    included in the game representation returned by run(), under "profile".
+    Statistics from the referee's own move validation are prefixed with
+    "referee.", and those from in-process players' move generation are
+    prefixed with "player.".
+
+    Progress is reported to sinks (see RefereeSink) as the game goes on. By
+    default that is a LoggingSink. If record_moves is True, every move is
+    also kept and included in the game representation, under "moves".
+
+    If share_board is True, in-process players are given a read-only view of
+    the referee's board (see Board.view) in place of their own, so each move
+    is played and worked out from once instead of once per board.
+    """
+
+    def __init__(self, player1, player2, lexicon=None, board=None, random_draw=True, player1id=None, player2id=None, profiler=None, sinks=None, record_moves=True, share_board=False):
         if player1id is None:
             player1id = 'p1'
         if player2id is None:
@@ -21,9 +36,25 @@ class Referee:
         self.lexicon = lexicon
         self.board = board if board else Board()
         self.bag = self.board.alltiles
-        self.moves = []
         self.random_draw = random_draw
 
+        self.sinks = list(sinks) if sinks is not None else [LoggingSink()]
+        self.recorder = MoveRecorder() if record_moves else None
+        if self.recorder:
+            self.sinks.append(self.recorder)
+
+        if share_board:
+            for player in player1, player2:
+                if isinstance(player, Player):
+                    player.board = self.board.view()
+
+        self.profiler = profiler
+        if profiler:
+            # Profile in-process players too, unless they have their own profiler
+            for player in player1, player2:
+                if isinstance(player, Player) and not player.profiler:
+                    player.profiler = profiler
+
     def draw(self, player):
         """Draw new tiles for some player."""
         ntiles = min(self.board.rack_size - len(player["rack"]), len(self.bag))
@@ -39,7 +70,13 @@ class Referee:
         player["lastdrawn"] = letters
         player["rack"] += letters
 
+        for sink in self.sinks:
+            sink.draw(player, letters)
+
     def run(self):
+        for sink in self.sinks:
+            sink.game_start(self)
+
         # Draw starting racks
         for player in self.players:
             self.draw(player)
@@ -56,23 +93,38 @@ class Referee:
                 if otherplayer["lastmove"] and otherplayer["lastmove"].kind == Move.MOVE_TRADE:
                     otherplayer["lastmove"].mask_word()
 
-                logging.debug("> {0:25s} {1:s}:{2:s}".format(
-                    player["id"],
-                    ''.join(player["lastdrawn"]),
-                    str(otherplayer["lastmove"])))
+                for sink in self.sinks:
+                    sink.move_requested(player, player["lastdrawn"], otherplayer["lastmove"])
 
                 # Receive move from player, and time how long it takes
+                if self.profiler:
+                    self.profiler.prefix = "player."
+
                 t_start = time.time()
                 move = player["obj"].move(player["lastdrawn"], otherplayer["lastmove"])
                 t_elapsed = time.time() - t_start
 
+                for sink in self.sinks:
+                    sink.move_proposed(player, move, t_elapsed)
+
+                if self.profiler:
+                    self.profiler.prefix = "referee."
+                    t_validate = self.profiler.clock()
+
                 # Check move for validity
                 if move.kind == Move.MOVE_TRADE:
                     # exchanges are only allowed if the bag has rack_size (normally 7) or more tiles
                     if move.word and len(self.bag) < self.board.rack_size:
                         raise InvalidMoveError("attempt to exchange with less than " + str(self.board.rack_size) + " tiles in the bag")
                 else:
-                    valid_moves = self.board.valid_moves(player["rack"], self.lexicon)
+                    # Only moves along the same line and through the same
+                    # first square can match, so search just those
+                    if move.kind == Move.MOVE_ACROSS:
+                        rows, cols = [move.row], []
+                    else:
+                        rows, cols = [], [move.col]
+                    valid_moves = self.board.valid_moves(player["rack"], self.lexicon, profiler=self.profiler, columnar=True,
+                            squares=[(move.row, move.col)], rows=rows, cols=cols)
                     if move in valid_moves:
                         # replace move with the one from valid_moves
                         # so we get an accurate score
@@ -80,22 +132,18 @@ class Referee:
                     else:
                         raise InvalidMoveError("invalid move: " + str(move))
 
+                if self.profiler:
+                    self.profiler.prefix = ""
+                    self.profiler.add_time("player", int(t_elapsed * 10**9))
+                    self.profiler.add_time("validate", self.profiler.clock() - t_validate)
+                    self.profiler.end_move(player=player["id"], move=str(move))
+
                 # Record move for this player
                 player["score"] += move.score
                 player["lastmove"] = move
-                self.moves.append({
-                    "player": player["id"],
-                    "rack": ''.join(player["rack"]),
-                    "move": str(move),
-                    "score": move.score,
-                    "time": int(t_elapsed * 10**6) })
-
-                logging.info("< {0:25s} {1:25s} {2:10s} {3:4d} {4:8d}".format(
-                    player["id"],
-                    str(move) + " " + str(move.score),
-                    ''.join(player["rack"]),
-                    player["score"],
-                    int(t_elapsed * 10**6)))
+
+                for sink in self.sinks:
+                    sink.move_validated(player, move, t_elapsed)
 
                 # Remove used tiles from rack
                 for letter in move.tiles:
@@ -138,18 +186,16 @@ class Referee:
 
             except (InvalidMoveError, ExternalPlayerError) as e:
                 player["exception"] = str(e)
-                logging.info("[EXCEPTION] " + player["id"] + ": " + str(e))
+                if self.profiler and self.profiler.current:
+                    self.profiler.prefix = ""
+                    self.profiler.end_move(player=player["id"], exception=str(e))
                 break
 
             # swap players
             player, otherplayer = otherplayer, player
 
-        # Show the board
-        logging.info("Final board:\n" + str(self.board))
-
         # Return representation of this game
         game = {
-            "moves": self.moves,
             "players": [
                 {"id": self.players[0]["id"], "rack": ''.join(self.players[0]["rack"]), "score": self.players[0]["score"]},
                 {"id": self.players[1]["id"], "rack": ''.join(self.players[1]["rack"]), "score": self.players[1]["score"]}, ]}
@@ -158,4 +204,143 @@ class Referee:
             if self.players[i]["exception"]:
                 game["players"][i]["exception"] = self.players[i]["exception"]
 
+        if self.recorder:
+            game["moves"] = self.recorder.moves
+
+        if self.profiler:
+            game["profile"] = self.profiler.to_dict()
+
+        for sink in self.sinks:
+            sink.game_end(self, game)
+
         return game
+
+    @property
+    def moves(self):
+        """Every move so far, as recorded by the MoveRecorder (see
+        MoveRecorder.moves); the same list as "moves" in the game returned
+        by run(). Not available with record_moves=False."""
+        if self.recorder is None:
+            raise AttributeError("moves are not recorded (record_moves=False)")
+        return self.recorder.moves
+
+class RefereeSink:
+    """Receives events from a Referee as a game is played. Events carry the
+    referee's own objects: player is the referee's dict for a player (with
+    "id", "rack", "score" and so on), and moves are Move objects. Sinks must
+    not modify them.
+
+    This class ignores every event; subclass it and override the ones you
+    need."""
+
+    def game_start(self, referee):
+        """A game is about to start."""
+        pass
+
+    def draw(self, player, tiles):
+        """A player drew tiles (a list of letters) from the bag."""
+        pass
+
+    def move_requested(self, player, tiles, opponent_move):
+        """A player is asked for a move, and is given the tiles it drew (a
+        list of letters) and the opponent's last move (None if there is
+        none)."""
+        pass
+
+    def move_proposed(self, player, move, elapsed):
+        """A player proposed a move, after thinking for elapsed seconds. It
+        has not been checked yet."""
+        pass
+
+    def move_validated(self, player, move, elapsed):
+        """A player's move was accepted. move.score is its score and
+        player["score"] includes it, but the tiles played are still in
+        player["rack"]."""
+        pass
+
+    def game_end(self, referee, game):
+        """A game is over; game is the representation returned by Referee.run."""
+        pass
+
+class LoggingSink(RefereeSink):
+    """Logs game progress with the logging module. Messages are only
+    formatted if the logger would output them.
+
+    >>> import board, lexicon, sys
+    >>> from referee import Referee, LoggingSink
+    >>> from player import MaxScorePlayer
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> players = [MaxScorePlayer(t, board=board.Board(variant='test')) for i in range(2)]
+    >>> logger = logging.getLogger('scrabbler.test')
+    >>> handler, level, propagate = logging.StreamHandler(sys.stdout), logger.level, logger.propagate
+    >>> logger.addHandler(handler); logger.setLevel(logging.DEBUG); logger.propagate = False
+    >>> ref = Referee(players[0], players[1], t, board=board.Board(variant='test'), random_draw=False, sinks=[LoggingSink(logger)])
+    >>> game = ref.run() # doctest: +ELLIPSIS
+    > p1                        ??AAAAA:None
+    < p1                        AA 8H 4                   ??AAAAA       4 ...
+    > p2                        AAAAAAA:AA 8H
+    ...
+    >>> ref.moves is game["moves"]
+    True
+    >>> logger.removeHandler(handler); logger.setLevel(level); logger.propagate = propagate
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger if logger is not None else logging.getLogger()
+
+    def move_requested(self, player, tiles, opponent_move):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("> {0:25s} {1:s}:{2:s}".format(
+                player["id"],
+                ''.join(tiles),
+                str(opponent_move)))
+
+    def move_validated(self, player, move, elapsed):
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("< {0:25s} {1:25s} {2:10s} {3:4d} {4:8d}".format(
+                player["id"],
+                str(move) + " " + str(move.score),
+                ''.join(player["rack"]),
+                player["score"],
+                int(elapsed * 10**6)))
+
+    def game_end(self, referee, game):
+        if self.logger.isEnabledFor(logging.INFO):
+            for player in game["players"]:
+                if "exception" in player:
+                    self.logger.info("[EXCEPTION] " + player["id"] + ": " + player["exception"])
+
+            # Show the board
+            self.logger.info("Final board:\n" + str(referee.board))
+
+class MoveRecorder(RefereeSink):
+    """Keeps a record of every move: a list of dicts with the player's id,
+    rack, the move and its score, and the time taken in microseconds.
+
+    >>> import board, lexicon
+    >>> from referee import Referee, MoveRecorder
+    >>> from player import MaxScorePlayer
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> players = [MaxScorePlayer(t, board=board.Board(variant='test')) for i in range(2)]
+    >>> recorder = MoveRecorder()
+    >>> ref = Referee(players[0], players[1], t, board=board.Board(variant='test'), random_draw=False, sinks=[recorder], record_moves=False)
+    >>> game = ref.run()
+    >>> "moves" in game
+    False
+    >>> [(move["player"], move["rack"], move["move"], move["score"]) for move in recorder.moves[:2]]
+    [('p1', '??AAAAA', 'AA 8H', 4), ('p2', 'AAAAAAA', 'AA 7H', 8)]
+    >>> ref.moves
+    Traceback (most recent call last):
+    AttributeError: moves are not recorded (record_moves=False)
+    """
+
+    def __init__(self):
+        self.moves = []
+
+    def move_validated(self, player, move, elapsed):
+        self.moves.append({
+            "player": player["id"],
+            "rack": ''.join(player["rack"]),
+            "move": str(move),
+            "score": move.score,
+            "time": int(elapsed * 10**6) })
@@ -0,0 +1,235 @@
+import collections
+import json
+import logging
+import socket
+import SocketServer
+import threading
+
+from board import Board
+from move import Move, InvalidMoveError
+
+class AnalysisServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Long-running server answering move queries over a Unix socket, so that
+    tools don't have to load a lexicon for every question.
+
+    Each request is a line of JSON like:
+
+        {"variant": "scrabble", "moves": ["FOO 8G", ...], "rack": "AEST?", "options": {"limit": 10}}
+
+    where "moves" is the move history of the position. The response is a line
+    of JSON with the valid moves, highest scoring first:
+
+        {"moves": [{"move": "F(OO)TS G8", "score": 16}, ...]}
+
+    or {"error": "..."} if the request could not be answered. Options are
+    "limit" (return at most this many moves) and "squares", "rows" and "cols",
+    which restrict the search like Board.valid_moves. Several requests may be
+    sent on one connection.
+
+    Results are cached by position and rack, and identical requests that
+    arrive while one is being answered wait for that answer instead of
+    searching again.
+
+    >>> import lexicon, os, tempfile, threading
+    >>> from server import AnalysisServer, query
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB'])
+    >>> path = os.path.join(tempfile.mkdtemp(), 'scrabbler.sock')
+    >>> server = AnalysisServer(path, t)
+    >>> thread = threading.Thread(target=server.serve_forever)
+    >>> thread.start()
+    >>> response = query(path, {"variant": "test", "moves": ["ABBA 8G"], "rack": "DA", "options": {"limit": 3}})
+    >>> [(move["move"], move["score"]) for move in response["moves"]]
+    [(u'DA(B) I6', 7), (u'DA(B) H6', 6), (u'(B)A I8', 5)]
+    >>> query(path, {"variant": "test", "moves": ["ABBA 8G"], "rack": "AD", "options": {"limit": 3}}) == response
+    True
+    >>> server.hits, server.misses
+    (1, 1)
+    >>> query(path, {"variant": "test", "moves": ["ABBA 33"], "rack": "AD"})
+    {u'error': u'invalid position'}
+    >>> query(path, {"variant": "test", "moves": ["ABBA 8N"], "rack": "AD"})
+    {u'error': u'move runs off the board: ABBA 8N'}
+    >>> query(path, {"variant": "../variants/test", "rack": "AD"})
+    {u'error': u'invalid variant name: ../variants/test'}
+    >>> query(path, [])
+    {u'error': u'request must be an object'}
+    >>> query(path, {"rack": "AD", "options": 3})
+    {u'error': u'options must be an object'}
+    >>> server.shutdown()
+    >>> thread.join()
+    >>> server.server_close()
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, lexicon, cache_size=1024):
+        SocketServer.UnixStreamServer.__init__(self, path, AnalysisHandler)
+        self.path = path
+        self.lexicon = lexicon
+        self.cache_size = cache_size
+
+        # Guards everything below
+        self.lock = threading.Lock()
+
+        # LRU caches of results, by (variant, position, rack, options), and of
+        # boards, by (variant, move history)
+        self.results = collections.OrderedDict()
+        self.boards = collections.OrderedDict()
+
+        # Events for requests being answered right now, by the same key as results
+        self.pending = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def answer(self, request):
+        """Answer a request (already decoded from JSON). Raises ValueError if
+        it isn't a valid request."""
+
+        if not isinstance(request, dict):
+            raise ValueError("request must be an object")
+        if not isinstance(request.get("options", {}), dict):
+            raise ValueError("options must be an object")
+        if not isinstance(request.get("moves", []), list):
+            raise ValueError("moves must be a list")
+
+        variant = str(request.get("variant", "scrabble"))
+        history = tuple(str(move) for move in request.get("moves", []))
+        rack = sorted(str(request.get("rack", "")))
+        options = request.get("options", {})
+
+        board = self.board(variant, history)
+        position = tuple(square.letter for row in board.squares for square in row)
+        key = (variant, position, ''.join(rack), json.dumps(options, sort_keys=True))
+
+        with self.lock:
+            if key in self.results:
+                self.hits += 1
+                result = self.results.pop(key)
+                self.results[key] = result
+                return result
+
+            if key in self.pending:
+                # Someone else is working on it
+                event = self.pending[key]
+                searching = False
+            else:
+                self.misses += 1
+                event = self.pending[key] = threading.Event()
+                searching = True
+
+        if not searching:
+            event.wait()
+            with self.lock:
+                if key in self.results:
+                    return self.results[key]
+            # The search failed; try it ourselves so the error is reported
+            return self.answer(request)
+
+        try:
+            result = self.search(board, rack, options)
+            with self.lock:
+                self.results[key] = result
+                while len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+        finally:
+            with self.lock:
+                del self.pending[key]
+            event.set()
+
+        return result
+
+    def search(self, board, rack, options):
+        """Find moves for a request. Returns the response to send."""
+
+        squares = options.get("squares")
+        if squares is not None:
+            squares = [tuple(square) for square in squares]
+
+        moves = board.valid_moves(rack, self.lexicon, squares=squares, rows=options.get("rows"), cols=options.get("cols"))
+        moves.sort(key = lambda x: (-x.score, str(x)))
+        if options.get("limit") is not None:
+            moves = moves[:options["limit"]]
+
+        return {"moves": [{"move": str(move), "score": move.score} for move in moves]}
+
+    def board(self, variant, history):
+        """Return the board after playing history on an empty board of a
+        variant. Boards are cached and must not be modified."""
+
+        with self.lock:
+            # Start from the longest history we already have a board for
+            for i in range(len(history), -1, -1):
+                board = self.boards.get((variant, history[:i]))
+                if board is not None:
+                    break
+
+        if board is None:
+            board = Board(variant=variant)
+            self.cache_board(variant, (), board)
+
+        for j in range(i, len(history)):
+            move = Move.from_str(history[j])
+            if not _on_board(board, move):
+                raise InvalidMoveError("move runs off the board: " + history[j])
+            board = board.copy()
+            board.play(move)
+            self.cache_board(variant, history[:j + 1], board)
+
+        return board
+
+    def cache_board(self, variant, history, board):
+        with self.lock:
+            self.boards[(variant, history)] = board
+            while len(self.boards) > self.cache_size:
+                self.boards.popitem(last=False)
+
+class AnalysisHandler(SocketServer.StreamRequestHandler):
+    """Handles one connection to an AnalysisServer."""
+
+    def handle(self):
+        while 1:
+            line = self.rfile.readline()
+            if not line:
+                break
+
+            try:
+                response = self.server.answer(json.loads(line))
+            except (ValueError, KeyError, TypeError, IOError, InvalidMoveError) as e:
+                logging.info("[EXCEPTION] " + str(e))
+                response = {"error": str(e)}
+            except Exception as e:
+                # A bug, not a bad request, but the client still gets an
+                # answer and the connection stays up
+                logging.exception("[EXCEPTION] " + str(e))
+                response = {"error": "internal error: " + str(e)}
+
+            self.wfile.write(json.dumps(response) + "\n")
+            self.wfile.flush()
+
+def _on_board(board, move):
+    """Whether every square of a move is on the board."""
+
+    if move.kind == Move.MOVE_TRADE:
+        return True
+    drow, dcol = (0, 1) if move.kind == Move.MOVE_ACROSS else (1, 0)
+    last_row, last_col = move.row + drow * (len(move.word) - 1), move.col + dcol * (len(move.word) - 1)
+    return 0 <= move.row and 0 <= move.col and last_row < board.dim and last_col < board.dim
+
+def query(path, request):
+    """Send one request to the AnalysisServer listening on path, and return
+    its response."""
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        f = sock.makefile('r+')
+        f.write(json.dumps(request) + "\n")
+        f.flush()
+        line = f.readline()
+        f.close()
+    finally:
+        sock.close()
+
+    if not line:
+        raise IOError("no response from " + path)
+    return json.loads(line)
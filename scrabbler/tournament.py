@@ -0,0 +1,681 @@
+import collections
+import json
+import logging
+import math
+import Queue
+import random
+import socket
+import SocketServer
+import threading
+import time
+
+import player
+from board import Board
+from referee import Referee
+
+class Coordinator(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Hands out games to Workers on any number of hosts, over TCP, and
+    collects their results.
+
+    Each game is a dict like:
+
+        {"id": "nightly-17", "seed": 17, "variant": "scrabble",
+         "players": [{"id": "max", "class": "MaxScorePlayer"}, {"id": "bot", "cmd": "./bot"}]}
+
+    (see play_game). Games are handed out batch_size at a time, and workers
+    send back each result as soon as the game is over. A batch is leased to
+    the worker that took it: if the worker disconnects, or sends nothing for
+    lease seconds, the games in it that have no result yet go back in the
+    queue for someone else. Results are kept by seed, and only the first
+    result for each seed counts, so every game is recorded exactly once.
+    Only a connection that was handed a game may send its result.
+
+    A worker that can't play a game (say it has no such variant) sends back
+    an error instead, and the game goes back in the queue. Once a game has
+    failed max_failures times, its result is the last error, like:
+
+        {"game": {"id": "nightly-17"}, "error": "IOError: ..."}
+
+    Requests and responses are lines of JSON, like AnalysisServer:
+
+        {"op": "get"}                        -> {"batch": 3, "games": [...]},
+                                                {"wait": 1.0} or {"done": true}
+        {"op": "result", "batch": 3, "seed": 17, "game": {...}}
+                                             -> {"ok": true}
+        {"op": "result", "batch": 3, "seed": 17, "error": "..."}
+                                             -> {"ok": true}
+
+    >>> import lexicon, multiprocessing
+    >>> from tournament import Coordinator, Worker, schedule, play_game
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB', 'BAD', 'DA', 'AD'])
+    >>> players = [{"id": "max", "class": "MaxScorePlayer"}, {"id": "long", "class": "MaxLengthPlayer"}]
+    >>> coordinator = Coordinator(('127.0.0.1', 0), batch_size=2)
+    >>> thread = threading.Thread(target=coordinator.serve_forever)
+    >>> thread.start()
+    >>> coordinator.add(schedule(players, 6, variant='test', name='test'))
+    >>> coordinator.finish()
+
+    A connection may only send results for the games handed to it, and a
+    game it fails to play goes back in the queue:
+
+    >>> sock = socket.create_connection(coordinator.server_address)
+    >>> f = sock.makefile('r+')
+    >>> def send(request):
+    ...     f.write(json.dumps(request) + "\\n"); f.flush()
+    ...     return json.loads(f.readline())
+    >>> [game["seed"] for game in send({"op": "get"})["games"]]
+    [0, 1]
+    >>> send({"op": "result", "batch": 1, "seed": 2, "game": {}})
+    {u'error': u'seed 2 is not in batch 1 of this connection'}
+    >>> send({"op": "result", "batch": 1, "seed": 0, "error": 3})
+    {u'error': u'error must be a string'}
+    >>> send({"op": "result", "batch": 1, "seed": 0, "error": "no luck"}), coordinator.failures, list(coordinator.pending)
+    ({u'ok': True}, {0: 1}, [2, 3, 4, 5, 0])
+    >>> send({"op": "result", "batch": 1, "seed": 1, "game": {"game": {"id": "test-1"}, "players": []}})
+    {u'ok': True}
+
+    Local worker processes stand in for other hosts:
+
+    >>> workers = [multiprocessing.Process(target=Worker(coordinator.server_address, t).run) for i in range(2)]
+    >>> for worker in workers: worker.start()
+    >>> results = dict(coordinator.results())
+    >>> for worker in workers: worker.join()
+    >>> 1 in coordinator.handed
+    False
+    >>> f.close(); sock.close()
+    >>> sorted(results), str(results[3]["game"]["id"])
+    ([0, 1, 2, 3, 4, 5], 'test-3')
+    >>> [str(player["id"]) for player in results[3]["players"]]
+    ['long', 'max']
+
+    Games play out the same wherever they are played:
+
+    >>> game = json.loads(json.dumps(play_game(schedule(players, 6, variant='test', name='test')[3], t)))
+    >>> for move in game["moves"] + results[3]["moves"]: del move["time"]
+    >>> results[3] == game
+    True
+    >>> coordinator.shutdown()
+    >>> thread.join()
+    >>> coordinator.server_close()
+
+    Games that can't be played are given up on, and the workers carry on:
+
+    >>> coordinator = Coordinator(('127.0.0.1', 0), batch_size=1, max_failures=2)
+    >>> thread = threading.Thread(target=coordinator.serve_forever)
+    >>> thread.start()
+    >>> coordinator.add(schedule(players, 1, variant='nosuch', name='nosuch'))
+    >>> coordinator.add(schedule([{"id": "x", "class": "Board"}] * 2, 1, variant='test', name='board', seed=1))
+    >>> coordinator.add(schedule(players, 1, variant='test', name='test', seed=2))
+    >>> coordinator.finish()
+    >>> workers = [multiprocessing.Process(target=Worker(coordinator.server_address, t).run) for i in range(2)]
+    >>> for worker in workers: worker.start()
+    >>> results = dict(coordinator.results())
+    >>> for worker in workers: worker.join()
+    >>> sorted(results), coordinator.failures
+    ([0, 1, 2], {0: 2, 1: 2})
+    >>> str(results[0]["game"]["id"]), results[0]["error"].startswith('IOError'), 'nosuch' in results[0]["error"]
+    ('nosuch-0', True, True)
+    >>> str(results[1]["error"])
+    'ValueError: unknown player class: Board'
+    >>> "error" in results[2], len(results[2]["players"])
+    (False, 2)
+    >>> coordinator.shutdown()
+    >>> thread.join()
+    >>> coordinator.server_close()
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, batch_size=4, lease=600, max_failures=3):
+        SocketServer.TCPServer.__init__(self, address, CoordinatorHandler)
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_failures = max_failures
+
+        # Guards everything below
+        self.lock = threading.Lock()
+
+        # Games by seed, and the seeds waiting to be handed out
+        self.games = {}
+        self.pending = collections.deque()
+
+        # Leased batches, by number: (connection, deadline, seeds without
+        # results)
+        self.leases = {}
+        self.nbatches = 0
+
+        # Batches handed out to connections that are still there, by
+        # number: (connection, seeds). Unlike leases, kept after the lease
+        # runs out, so that late results still count, until every game in
+        # the batch has a result.
+        self.handed = {}
+
+        # Seeds with a result, and the number of times each game failed
+        self.recorded = set()
+        self.failures = {}
+
+        # Whether more games may be added
+        self.finished = False
+
+        # (seed, game) for results, as they arrive, for results(); None
+        # once every game has one
+        self.arrived = Queue.Queue()
+        self.signalled = False
+
+    def add(self, games):
+        """Queue games (dicts, see above) to be played. Games whose seed was
+        already added are ignored."""
+
+        with self.lock:
+            for game in games:
+                if game["seed"] not in self.games:
+                    self.games[game["seed"]] = game
+                    self.pending.append(game["seed"])
+
+    def cancel(self):
+        """Drop the games that haven't been handed out yet. Leased games are
+        still played and recorded."""
+
+        with self.lock:
+            for seed in self.pending:
+                del self.games[seed]
+            self.pending.clear()
+            self.check_done()
+
+    def finish(self):
+        """No more games will be added; workers are told to stop once every
+        game has a result."""
+
+        with self.lock:
+            self.finished = True
+            self.check_done()
+
+    def results(self):
+        """Generate (seed, game) for each game's result as it arrives, until
+        finish() was called and every game has one."""
+
+        while 1:
+            # Waiting with a timeout keeps KeyboardInterrupt working
+            try:
+                result = self.arrived.get(timeout=3600)
+            except Queue.Empty:
+                continue
+            if result is None:
+                return
+            yield result
+
+    def check_done(self):
+        """Signal results() if everything is done. Called with the lock held."""
+        if self.done() and not self.signalled:
+            self.arrived.put(None)
+            self.signalled = True
+
+    def done(self):
+        return self.finished and not self.pending and not self.leases and len(self.recorded) >= len(self.games)
+
+    def get(self, connection):
+        """Lease the next batch of games to a connection."""
+
+        with self.lock:
+            # Take back leases that ran out
+            now = time.time()
+            for batch, (owner, deadline, seeds) in self.leases.items():
+                if deadline < now:
+                    logging.info("Lease on batch " + str(batch) + " ran out")
+                    self.release(batch)
+
+            if not self.pending:
+                if self.done():
+                    return {"done": True}
+                return {"wait": 1.0}
+
+            seeds = []
+            while self.pending and len(seeds) < self.batch_size:
+                seeds.append(self.pending.popleft())
+
+            self.nbatches += 1
+            self.leases[self.nbatches] = (connection, now + self.lease, set(seeds))
+            self.handed[self.nbatches] = (connection, frozenset(seeds))
+            return {"batch": self.nbatches, "games": [self.games[seed] for seed in seeds]}
+
+    def result(self, connection, batch, seed, game=None, error=None):
+        """Record the result of a game, unless it has one already, or an
+        error saying why it couldn't be played. Raises ValueError unless the
+        game was handed out to connection in batch."""
+
+        # Checked before anything changes, so a bad result can't leave a
+        # game neither leased nor queued
+        if (game is None) == (error is None):
+            raise ValueError("a result needs either a game or an error")
+        if game is not None and not isinstance(game, dict):
+            raise ValueError("game must be an object")
+        if error is not None and not isinstance(error, basestring):
+            raise ValueError("error must be a string")
+
+        with self.lock:
+            # Someone else's result may have come first; that needs no lease
+            if seed in self.recorded:
+                return {"ok": True}
+
+            if batch not in self.handed or self.handed[batch][0] is not connection or seed not in self.handed[batch][1]:
+                raise ValueError("seed " + str(seed) + " is not in batch " + str(batch) + " of this connection")
+
+            if batch in self.leases:
+                owner, deadline, seeds = self.leases[batch]
+                self.leases[batch] = (owner, time.time() + self.lease, seeds)
+
+            # The game may have been handed out again after this batch's
+            # lease ran out, and needn't be played any more
+            for leased, (owner, deadline, seeds) in self.leases.items():
+                seeds.discard(seed)
+                if not seeds:
+                    del self.leases[leased]
+
+            if error is not None:
+                if seed not in self.games:
+                    return {"ok": True}
+                self.failures[seed] = self.failures.get(seed, 0) + 1
+                logging.info("Game " + str(seed) + " failed: " + error)
+                if self.failures[seed] < self.max_failures:
+                    if seed not in self.pending:
+                        self.pending.append(seed)
+                    return {"ok": True}
+                game = {"game": {"id": self.games[seed]["id"]}, "error": error}
+
+            self.recorded.add(seed)
+            self.arrived.put((seed, game))
+
+            # Batches whose games all have results need no more checking
+            for handed, (owner, seeds) in self.handed.items():
+                if seed in seeds and all(other in self.recorded or other not in self.games for other in seeds):
+                    del self.handed[handed]
+
+            self.check_done()
+            return {"ok": True}
+
+    def disconnected(self, connection):
+        """A worker went away; take back its leases."""
+
+        with self.lock:
+            for batch, (owner, seeds) in self.handed.items():
+                if owner is connection:
+                    del self.handed[batch]
+            for batch, (owner, deadline, seeds) in self.leases.items():
+                if owner is connection:
+                    logging.info("Worker left with batch " + str(batch))
+                    self.release(batch)
+
+    def release(self, batch):
+        """Requeue the games of a leased batch that have no result yet, first
+        in line. Called with the lock held."""
+
+        owner, deadline, seeds = self.leases.pop(batch)
+        for seed in sorted(seeds, reverse=True):
+            if seed not in self.recorded and seed in self.games:
+                self.pending.appendleft(seed)
+
+class CoordinatorHandler(SocketServer.StreamRequestHandler):
+    """Handles one Worker's connection to a Coordinator."""
+
+    def handle(self):
+        try:
+            while 1:
+                line = self.rfile.readline()
+                if not line:
+                    break
+
+                try:
+                    request = json.loads(line)
+                    if request["op"] == "get":
+                        response = self.server.get(self)
+                    elif request["op"] == "result":
+                        response = self.server.result(self, request["batch"], request["seed"], request.get("game"), request.get("error"))
+                    else:
+                        raise ValueError("unknown op: " + str(request["op"]))
+                except (ValueError, KeyError, TypeError) as e:
+                    logging.info("[EXCEPTION] " + str(e))
+                    response = {"error": str(e)}
+
+                self.wfile.write(json.dumps(response) + "\n")
+                self.wfile.flush()
+        except socket.error as e:
+            logging.info("[EXCEPTION] " + str(e))
+        finally:
+            self.server.disconnected(self)
+
+class Worker:
+    """Plays games handed out by a Coordinator at address (host, port), and
+    sends back the results. Workers may be started before the coordinator:
+    they keep trying to connect for retry seconds."""
+
+    def __init__(self, address, lexicon, retry=60):
+        self.address = tuple(address)
+        self.lexicon = lexicon
+        self.retry = retry
+
+    def connect(self):
+        deadline = time.time() + self.retry
+        while 1:
+            try:
+                return socket.create_connection(self.address)
+            except socket.error:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(1)
+
+    def run(self):
+        """Play games until the coordinator says we are done."""
+
+        sock = self.connect()
+        f = sock.makefile('r+')
+        try:
+            while 1:
+                response = self.request(f, {"op": "get"})
+                if response.get("done"):
+                    break
+                if "wait" in response:
+                    time.sleep(response["wait"])
+                    continue
+
+                for game in response["games"]:
+                    result = {"op": "result", "batch": response["batch"], "seed": game["seed"]}
+                    try:
+                        result["game"] = play_game(game, self.lexicon)
+                    except Exception as e:
+                        # Whatever went wrong (no such variant, a player that
+                        # can't be made or stops talking) went wrong with this
+                        # game; the coordinator decides whether to retry it
+                        logging.info("[EXCEPTION] " + str(e))
+                        result["error"] = e.__class__.__name__ + ": " + str(e)
+                    self.request(f, result)
+        finally:
+            f.close()
+            sock.close()
+
+    def request(self, f, request):
+        f.write(json.dumps(request) + "\n")
+        f.flush()
+        line = f.readline()
+        if not line:
+            raise IOError("coordinator went away")
+        response = json.loads(line)
+        if "error" in response:
+            raise IOError("coordinator error: " + response["error"])
+        return response
+
+def schedule(players, games, variant='scrabble', name='tournament', seed=0, paired=False):
+    """List of games (for Coordinator.add) between two players (dicts, see
+    play_game), with seeds from seed on. Players take turns to go first.
+
+    If paired is True, each pair of games is dealt the same tiles: the
+    second game of a pair has the first one's seed as its "deal", so the
+    players swap seats with the same luck of the draw.
+
+    >>> from tournament import schedule
+    >>> [(game["seed"], game.get("deal"), game["players"][0]) for game in schedule(['a', 'b'], 4, seed=10, paired=True)]
+    [(10, 10, 'a'), (11, 10, 'b'), (12, 12, 'a'), (13, 12, 'b')]
+    """
+
+    games = [{"id": name + "-" + str(seed + i), "seed": seed + i, "variant": variant,
+              "players": players if i % 2 == 0 else players[::-1]}
+             for i in range(games)]
+    if paired:
+        for i, game in enumerate(games):
+            game["deal"] = seed + i - i % 2
+    return games
+
+def play_game(game, lexicon):
+    """Play a game (a dict, see Coordinator) and return its representation,
+    as returned by Referee.run, with the game's id.
+
+    Each player is a dict with an "id" and either "class", the name of a
+    Player subclass in scrabbler.player, or "cmd", a command to run as an
+    ExternalPlayer. Tiles are drawn with the random module seeded with the
+    game's "deal", or its seed if it has none, so the same game always plays
+    out the same way."""
+
+    random.seed(game.get("deal", game["seed"]))
+    players = [_make_player(spec, lexicon) for spec in game["players"]]
+    ref = Referee(players[0], players[1], lexicon, board=Board(variant=game["variant"]),
+            player1id=game["players"][0]["id"], player2id=game["players"][1]["id"], sinks=[], share_board=True)
+
+    result = ref.run()
+    result["game"] = {"id": game["id"]}
+    return result
+
+def _make_player(spec, lexicon):
+    if "cmd" in spec:
+        return player.ExternalPlayer(['/bin/sh', '-c', spec["cmd"]])
+
+    cls = getattr(player, spec["class"], None)
+    if cls is None or not isinstance(cls, type(player.Player)) or not issubclass(cls, player.Player):
+        raise ValueError("unknown player class: " + spec["class"])
+    return cls(lexicon)
+
+class SPRT:
+    """Sequential probability ratio test of whether observations have mean
+    mean0 (H0) or mean1 (H1), with error rates alpha (accepting H1 when H0
+    is true) and beta (the other way around). Observations are added one at
+    a time, and result() says as soon as either hypothesis is accepted.
+
+    This is the generalized SPRT, which takes the observations to be
+    normally distributed with their sample variance. The variance includes
+    one made-up observation at each of mean0 and mean1, so that it is never
+    zero, even when every game so far had the same outcome. Nothing is
+    decided before minimum observations, since a variance from fewer is too
+    rough; in simulations the error rates then stay within a few points of
+    alpha and beta.
+
+    >>> from tournament import SPRT
+    >>> sprt = SPRT(0.5, 0.6, minimum=4)
+    >>> [round(bound, 3) for bound in sprt.bounds()]
+    [-2.944, 2.944]
+    >>> for x in [1, 1, 0.5, 1]: sprt.add(x)
+    >>> round(sprt.llr(), 3), sprt.result()
+    (2.34, None)
+    >>> sprt.add(1)
+    >>> sprt.llr() > 2.95, sprt.result()
+    (True, 1)
+    >>> sprt = SPRT(0, 10)
+    >>> for x in [-15, 20, -30, 5, -40, -10, 0]: sprt.add(x)
+    >>> sprt.llr() < -2.95, sprt.result()
+    (True, None)
+    >>> sprt.add(-25)
+    >>> sprt.result()
+    0
+    """
+
+    def __init__(self, mean0, mean1, alpha=0.05, beta=0.05, minimum=8):
+        self.mean0 = mean0
+        self.mean1 = mean1
+        self.alpha = alpha
+        self.beta = beta
+        self.minimum = minimum
+
+        self.n = 0
+        self.total = 0.0
+        self.squares = 0.0
+
+    def bounds(self):
+        """(lower, upper) bounds on the log likelihood ratio: H0 is accepted
+        below the lower one and H1 above the upper one."""
+        return math.log(self.beta / (1 - self.alpha)), math.log((1 - self.beta) / self.alpha)
+
+    def add(self, x):
+        """Add an observation."""
+        self.n += 1
+        self.total += x
+        self.squares += x * x
+
+    def llr(self):
+        """Log likelihood ratio of H1 to H0 given the observations so far."""
+
+        if not self.n:
+            return 0.0
+
+        mean = self.total / self.n
+        n = self.n + 2
+        total = self.total + self.mean0 + self.mean1
+        squares = self.squares + self.mean0 ** 2 + self.mean1 ** 2
+        variance = (squares - total * total / n) / n
+
+        return self.n * (self.mean1 - self.mean0) * (2 * mean - self.mean0 - self.mean1) / (2 * variance)
+
+    def result(self):
+        """1 if H1 is accepted, 0 if H0 is, or None if more observations
+        are needed."""
+
+        if self.n < self.minimum:
+            return None
+
+        lower, upper = self.bounds()
+        llr = self.llr()
+        if llr >= upper:
+            return 1
+        if llr <= lower:
+            return 0
+        return None
+
+def match(coordinator, players, sprt, statistic='wins', variant='scrabble', name='match', seed=0, max_pairs=1000, inflight=8, callback=None):
+    """Play players[0] against players[1] (dicts, see play_game) through a
+    Coordinator, in pairs of games with swapped seats and the same tiles
+    (see schedule), until sprt (an SPRT) is decided or max_pairs pairs have
+    been played. Up to inflight pairs are handed out at a time, and more
+    are only added while the test is undecided, so clear-cut matches stop
+    after a few pairs. The coordinator is finished when the match is.
+
+    Each pair gives sprt one observation for players[0]: with statistic
+    "wins", its share of the two games (a tie counts half), and with
+    "spread", its mean score minus the opponent's. A pair with a game that
+    couldn't be played (see Coordinator) is left out, but still counts
+    towards max_pairs. callback, if given, is called with the seed and result
+    of each game as it arrives.
+
+    Returns a dict with the decision (sprt.result()), the number of pairs
+    and games counted, players[0]'s wins, losses and ties and mean score
+    spread over those games, the final log likelihood ratio, and the number
+    of pairs left out.
+
+    >>> import lexicon, multiprocessing
+    >>> from tournament import Coordinator, Worker, SPRT, match
+    >>> t = lexicon.Lexicon.from_iterable(['AA', 'AB', 'ABBA', 'BA', 'BAA', 'CAB', 'DAB', 'BAD', 'DA', 'AD', 'FED', 'FEED', 'FACE', 'FACED', 'DEAF', 'BEEF'])
+    >>> coordinator = Coordinator(('127.0.0.1', 0), batch_size=1)
+    >>> thread = threading.Thread(target=coordinator.serve_forever)
+    >>> thread.start()
+    >>> workers = [multiprocessing.Process(target=Worker(coordinator.server_address, t).run) for i in range(2)]
+    >>> for worker in workers: worker.start()
+    >>> players = [{"id": "max", "class": "MaxScorePlayer"}, {"id": "random", "class": "RandomPlayer"}]
+    >>> summary = match(coordinator, players, SPRT(0.5, 0.6), variant='test', max_pairs=100, inflight=2)
+    >>> for worker in workers: worker.join()
+    >>> summary["decision"], summary["pairs"] < 30, summary["games"] == 2 * summary["pairs"]
+    (1, True, True)
+    >>> summary["wins"] > summary["losses"], summary["spread"] > 0
+    (True, True)
+    >>> coordinator.shutdown()
+    >>> thread.join()
+    >>> coordinator.server_close()
+
+    A player may play itself, and then the games of each pair cancel out:
+
+    >>> coordinator = Coordinator(('127.0.0.1', 0), batch_size=1)
+    >>> thread = threading.Thread(target=coordinator.serve_forever)
+    >>> thread.start()
+    >>> worker = multiprocessing.Process(target=Worker(coordinator.server_address, t).run)
+    >>> worker.start()
+    >>> same = [{"id": "MaxScorePlayer", "class": "MaxScorePlayer"}] * 2
+    >>> summary = match(coordinator, same, SPRT(0, 10), statistic='spread', variant='test', max_pairs=3)
+    >>> worker.join()
+    >>> summary["pairs"], summary["wins"] == summary["losses"], summary["spread"]
+    (3, True, 0.0)
+    >>> coordinator.shutdown()
+    >>> thread.join()
+    >>> coordinator.server_close()
+
+    Pairs that can't be played are left out:
+
+    >>> coordinator = Coordinator(('127.0.0.1', 0), batch_size=1, max_failures=1)
+    >>> thread = threading.Thread(target=coordinator.serve_forever)
+    >>> thread.start()
+    >>> worker = multiprocessing.Process(target=Worker(coordinator.server_address, t).run)
+    >>> worker.start()
+    >>> summary = match(coordinator, players, SPRT(0.5, 0.6), variant='nosuch', max_pairs=3, inflight=2)
+    >>> worker.join()
+    >>> summary["decision"], summary["pairs"], summary["failed"]
+    (None, 0, 3)
+    >>> coordinator.shutdown()
+    >>> thread.join()
+    >>> coordinator.server_close()
+    """
+
+    summary = {"decision": None, "pairs": 0, "games": 0, "wins": 0, "losses": 0, "ties": 0, "spread": 0.0, "llr": 0.0, "failed": 0}
+    total_spread = 0
+
+    # (seed, game) for the games of each pair that have finished, by pair
+    # number
+    halves = {}
+
+    def add_pair(i):
+        coordinator.add(schedule(players, 2, variant=variant, name=name, seed=seed + 2 * i, paired=True))
+
+    scheduled = min(inflight, max_pairs)
+    for i in range(scheduled):
+        add_pair(i)
+    if scheduled >= max_pairs:
+        coordinator.finish()
+
+    decided = False
+    for game_seed, game in coordinator.results():
+        if callback is not None:
+            callback(game_seed, game)
+        if decided:
+            # Games handed out before the decision; they don't count
+            continue
+
+        pair = (game_seed - seed) // 2
+        halves.setdefault(pair, []).append((game_seed, game))
+        if len(halves[pair]) < 2:
+            continue
+
+        games = halves.pop(pair)
+        if any("error" in game for game_seed, game in games):
+            # The other game means nothing without its partner
+            summary["failed"] += 1
+        else:
+            spreads = []
+            for game_seed, game in games:
+                # players[0] goes first in the first game of the pair and
+                # second in the other; ids needn't differ
+                seat = (game_seed - seed) % 2
+                scores = [player["score"] for player in game["players"]]
+                spreads.append(scores[seat] - scores[1 - seat])
+            wins = sum(1 for spread in spreads if spread > 0)
+            losses = sum(1 for spread in spreads if spread < 0)
+
+            summary["pairs"] += 1
+            summary["games"] += 2
+            summary["wins"] += wins
+            summary["losses"] += losses
+            summary["ties"] += 2 - wins - losses
+            total_spread += sum(spreads)
+
+            if statistic == 'wins':
+                sprt.add((wins + (2 - wins - losses) * 0.5) / 2.0)
+            else:
+                sprt.add(sum(spreads) / 2.0)
+
+            summary["decision"] = sprt.result()
+        if summary["decision"] is not None or summary["pairs"] >= max_pairs:
+            decided = True
+            coordinator.cancel()
+            coordinator.finish()
+        elif scheduled < max_pairs:
+            add_pair(scheduled)
+            scheduled += 1
+            if scheduled >= max_pairs:
+                coordinator.finish()
+
+    summary["llr"] = sprt.llr()
+    if summary["games"]:
+        summary["spread"] = float(total_spread) / summary["games"]
+    return summary
@@ -0,0 +1,184 @@
+import json
+import os
+
+class Variant:
+    """Board layout, letter values and tile distribution of a game variant,
+    compiled from one of the JSON files in the variants/ directory.
+
+    Variants are loaded once per process by load_variant, and the same
+    object is shared by every Board using that variant, so it can't be
+    modified, and neither can its tables.
+
+    >>> from variant import load_variant
+    >>> v = load_variant('scrabble')
+    >>> v is load_variant('scrabble')
+    True
+    >>> v.name, v.dim, v.rack_size, v.bingo_bonus
+    ('scrabble', 15, 7, 50)
+    >>> v.letter_values['Q'], v.letter_distribution['?']
+    (10, 2)
+    >>> v.letters[:5]
+    ('A', 'B', 'C', 'D', 'E')
+    >>> v.bonus[0][:4]
+    ((3, 1), (0, 0), (0, 0), (2, 2))
+    >>> len(v.tiles)
+    100
+    >>> v.alphabet.values[v.alphabet.codes['Q']], v.alphabet.values[v.alphabet.codes['q']]
+    (10, 0)
+    >>> v.dim = 21
+    Traceback (most recent call last):
+    AttributeError: Variant objects are read-only
+    >>> v.letter_values['A'] = 99
+    Traceback (most recent call last):
+    TypeError: Variant objects are read-only
+    >>> v.alphabet.values[1] = 99
+    Traceback (most recent call last):
+    TypeError: 'tuple' object does not support item assignment
+    """
+
+    def __init__(self, name, vdat):
+        d = self.__dict__
+
+        d["name"] = name
+        d["dim"] = vdat["dim"]
+        d["bingo_bonus"] = vdat["bingo_bonus"]
+        d["rack_size"] = vdat["rack_size"]
+
+        d["letter_distribution"] = FrozenDict((str(letter), count) for letter, count in vdat["letter_distribution"].items())
+        d["letter_values"] = FrozenDict((str(letter), value) for letter, value in vdat["letter_values"].items())
+
+        # Sorted letters that can be placed on the board (not including blanks)
+        d["letters"] = tuple(sorted(self.letter_values.keys()))
+
+        # Every tile in the game, sorted
+        tiles = []
+        for c in sorted(self.letter_distribution.keys()):
+            tiles += [c] * self.letter_distribution[c]
+        d["tiles"] = tuple(tiles)
+
+        # Small integer codes for letters, used by move generation
+        d["alphabet"] = Alphabet(self.letter_values)
+
+        # (bonus_multiplier, bonus_type) for each square
+        bonus = [[(0, 0)] * self.dim for row in range(self.dim)]
+        for b in vdat["bonus"]:
+            bonus[b["row"]][b["col"]] = (b["multiplier"], b["type"])
+        d["bonus"] = tuple(tuple(row) for row in bonus)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Variant objects are read-only")
+
+class FrozenDict(dict):
+    """dict that can't be changed once made, for the tables of a Variant."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Variant objects are read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+class Alphabet:
+    """Numbers the letters of a variant with small integers, so that move
+    generation can work on lists of ints instead of strings. Letters are
+    single upper case characters: tiles like the Spanish CH would need
+    moves, boards and the lexicon to handle them too, so they raise
+    ValueError.
+
+    Letters are numbered from 1 in sorted order; 0 is not a letter. A blank
+    standing for a letter has that letter's code plus BLANK, and a blank
+    that doesn't stand for anything yet (a '?' in a rack) is BLANK itself.
+    values gives the value of each code, which is 0 for blanks.
+
+    >>> from variant import Alphabet
+    >>> a = Alphabet({'A': 1, 'C': 3, 'H': 4})
+    >>> a.letters, a.codes['C'], a.codes['c'], a.codes['?']
+    (('A', 'C', 'H'), 2, 130, 128)
+    >>> a.split('CHAcH?'), list(a.encode('CHAcH?'))
+    (['C', 'H', 'A', 'c', 'H', '?'], [2, 3, 1, 130, 3, 128])
+    >>> a.decode(a.encode('CHAcH?')), [a.values[code] for code in a.encode('CHAcH')]
+    ('CHAcH?', [3, 4, 1, 0, 4])
+    >>> a.split('CHAX')
+    Traceback (most recent call last):
+    ValueError: not in alphabet: CHAX
+    >>> Alphabet({'A': 1, 'C': 3, 'CH': 5, 'H': 4})
+    Traceback (most recent call last):
+    ValueError: letters of more than one character are not supported: CH
+    """
+
+    BLANK = 0x80
+
+    def __init__(self, letter_values):
+        self.letters = tuple(sorted(letter_values.keys()))
+        if len(self.letters) >= self.BLANK:
+            raise ValueError("too many letters")
+        multi = [letter for letter in self.letters if len(letter) != 1]
+        if multi:
+            raise ValueError("letters of more than one character are not supported: " + ' '.join(multi))
+
+        # Code of each letter (upper case), blank (lower case) and '?', and
+        # the other way around; shared by every board of a variant, so they
+        # can't be changed
+        codes = {'?': self.BLANK}
+        names = [''] * (2 * self.BLANK)
+        names[self.BLANK] = '?'
+        values = [0] * (2 * self.BLANK)
+        for code, letter in enumerate(self.letters, 1):
+            codes[letter] = code
+            codes[letter.lower()] = code | self.BLANK
+            names[code] = letter
+            names[code | self.BLANK] = letter.lower()
+            values[code] = letter_values[letter]
+        self.codes = FrozenDict(codes)
+        self.names = tuple(names)
+        self.values = tuple(values)
+
+    def split(self, word):
+        """Split a string into letters (and blanks). Raises ValueError if it
+        contains anything else."""
+
+        if any(c not in self.codes for c in word):
+            raise ValueError("not in alphabet: " + word)
+        return list(word)
+
+    def encode(self, word):
+        """Codes of the letters of a string, or of a list of letters, as a
+        bytearray."""
+        if isinstance(word, basestring):
+            word = self.split(word)
+        return bytearray(self.codes[letter] for letter in word)
+
+    def decode(self, codes):
+        """String spelled by a sequence of codes."""
+        names = self.names
+        return ''.join([names[code] for code in codes])
+
+# Variants loaded so far, by name
+_variants = {}
+
+def load_variant(name):
+    """Return the Variant with this name, loading it on first use. Variants
+    are looked up in the variants/ directory next to the scrabbler package,
+    then in variants/ under the current directory. Raises ValueError for a
+    name that isn't a plain file name, so that only files in those
+    directories can be loaded.
+
+    >>> from variant import load_variant
+    >>> load_variant('../variants/test')
+    Traceback (most recent call last):
+    ValueError: invalid variant name: ../variants/test
+    """
+
+    if name not in _variants:
+        if not name or os.path.basename(name) != name or name in (os.curdir, os.pardir) or (os.altsep and os.altsep in name):
+            raise ValueError("invalid variant name: " + name)
+
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "variants", name)
+        if not os.path.exists(path):
+            path = os.path.join("variants", name)
+
+        with open(path) as f:
+            _variants[name] = Variant(name, json.loads(f.read()))
+
+    return _variants[name]
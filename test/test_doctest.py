@@ -3,28 +3,72 @@
 import unittest
 import doctest
 
+import scrabbler.anagram
+import scrabbler.batch
 import scrabbler.board
+import scrabbler.book
+import scrabbler.dataset
+import scrabbler.gamestore
 import scrabbler.lexicon
 import scrabbler.move
+import scrabbler.parallel
 import scrabbler.player
+import scrabbler.position
+import scrabbler.profiler
 import scrabbler.referee
+import scrabbler.server
+import scrabbler.tournament
+import scrabbler.variant
 
 class TestDoctest(unittest.TestCase):
+    def test_anagram(self):
+        fail, total = doctest.testmod(scrabbler.anagram)
+        self.assertEquals(fail, 0)
+    def test_batch(self):
+        fail, total = doctest.testmod(scrabbler.batch)
+        self.assertEquals(fail, 0)
     def test_board(self):
         fail, total = doctest.testmod(scrabbler.board)
         self.assertEquals(fail, 0)
+    def test_book(self):
+        fail, total = doctest.testmod(scrabbler.book)
+        self.assertEquals(fail, 0)
+    def test_dataset(self):
+        fail, total = doctest.testmod(scrabbler.dataset)
+        self.assertEquals(fail, 0)
+    def test_gamestore(self):
+        fail, total = doctest.testmod(scrabbler.gamestore)
+        self.assertEquals(fail, 0)
     def test_lexicon(self):
         fail, total = doctest.testmod(scrabbler.lexicon)
         self.assertEquals(fail, 0)
     def test_move(self):
         fail, total = doctest.testmod(scrabbler.move)
         self.assertEquals(fail, 0)
+    def test_parallel(self):
+        fail, total = doctest.testmod(scrabbler.parallel)
+        self.assertEquals(fail, 0)
     def test_player(self):
         fail, total = doctest.testmod(scrabbler.player)
         self.assertEquals(fail, 0)
+    def test_position(self):
+        fail, total = doctest.testmod(scrabbler.position)
+        self.assertEquals(fail, 0)
+    def test_profiler(self):
+        fail, total = doctest.testmod(scrabbler.profiler)
+        self.assertEquals(fail, 0)
     def test_referee(self):
         fail, total = doctest.testmod(scrabbler.referee)
         self.assertEquals(fail, 0)
+    def test_server(self):
+        fail, total = doctest.testmod(scrabbler.server)
+        self.assertEquals(fail, 0)
+    def test_tournament(self):
+        fail, total = doctest.testmod(scrabbler.tournament)
+        self.assertEquals(fail, 0)
+    def test_variant(self):
+        fail, total = doctest.testmod(scrabbler.variant)
+        self.assertEquals(fail, 0)
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,11 @@ import scrabbler.board
 import scrabbler.lexicon
 import scrabbler.move
 import scrabbler.player
+import scrabbler.profiler
 import scrabbler.referee
+import operator
+import random
+import threading
 import unittest
 
 # Play a simple game using a referee and two players.
@@ -24,6 +28,128 @@ class TestGame(unittest.TestCase):
             del move["time"]
         self.assertEqual(game, {'players': [{'score': 110, 'id': 'p1', 'rack': 'EEEEEE'}, {'score': 156, 'id': 'p2', 'rack': 'EEE'}], 'moves': [{'player': 'p1', 'move': 'cAcA 8H', 'rack': '??AAAAA', 'score': 4}, {'player': 'p2', 'move': 'AA 7K', 'rack': 'AAAAAAA', 'score': 4}, {'player': 'p1', 'move': 'AA 6L', 'rack': 'AAAAAAA', 'score': 4}, {'player': 'p2', 'move': 'AA 5M', 'rack': 'AAAAAAA', 'score': 4}, {'player': 'p1', 'move': 'ABBA 4L', 'rack': 'AAAAABB', 'score': 27}, {'player': 'p2', 'move': 'BAB(A) O1', 'rack': 'AAAAABB', 'score': 24}, {'player': 'p1', 'move': 'CAC(A) 2L', 'rack': 'AAACCCC', 'score': 16}, {'player': 'p2', 'move': 'D(A)D I7', 'rack': 'AAAADDD', 'score': 9}, {'player': 'p1', 'move': 'CA(c)A H6', 'rack': 'AACCDDD', 'score': 11}, {'player': 'p2', 'move': 'DAD G9', 'rack': 'AAAADDD', 'score': 14}, {'player': 'p1', 'move': 'CE(D)E 11E', 'rack': 'CDDDEEE', 'score': 14}, {'player': 'p2', 'move': 'DEE 12H', 'rack': 'AAADEEE', 'score': 11}, {'player': 'p1', 'move': 'DEED 11J', 'rack': 'DDDEEEE', 'score': 15}, {'player': 'p2', 'move': '(D)EE M11', 'rack': 'AAAEEEE', 'score': 8}, {'player': 'p1', 'move': 'DEE 13I', 'rack': 'DEEEEEE', 'score': 15}, {'player': 'p2', 'move': 'A(E) F10', 'rack': 'AAAEEEE', 'score': 8}, {'player': 'p1', 'move': '(C)EE E11', 'rack': 'EEEEEEE', 'score': 5}, {'player': 'p2', 'move': 'AA D12', 'rack': 'AAEEEEE', 'score': 9}, {'player': 'p1', 'move': '--', 'rack': 'EEEEEEE', 'score': 0}, {'player': 'p2', 'move': 'F(E)E 12L', 'rack': 'EEEEEFF', 'score': 18}, {'player': 'p1', 'move': '--', 'rack': 'EEEEEEE', 'score': 0}, {'player': 'p2', 'move': '(E)FF N12', 'rack': 'EEEEFFF', 'score': 23}, {'player': 'p1', 'move': '(F)E 14N', 'rack': 'EEEEEEE', 'score': 5}, {'player': 'p2', 'move': 'F(E)E O13', 'rack': 'EEEEF', 'score': 27}, {'player': 'p1', 'move': '--', 'rack': 'EEEEEE', 'score': 0}, {'player': 'p2', 'move': '--', 'rack': 'EEE', 'score': 0}, {'player': 'p1', 'move': '--', 'rack': 'EEEEEE', 'score': 0}, {'player': 'p2', 'move': '--', 'rack': 'EEE', 'score': 0}, {'player': 'p1', 'move': '--', 'rack': 'EEEEEE', 'score': 0}, {'player': 'p2', 'move': '--', 'rack': 'EEE', 'score': 0}]})
 
+    def test_profile(self):
+        p1 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'))
+        p2 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'))
+        profiler = scrabbler.profiler.Profiler()
+        ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False, profiler=profiler)
+
+        game = ref.run()
+        self.assertEqual([(m["player"], m["move"]) for m in game["profile"]["moves"]], [(m["player"], m["move"]) for m in game["moves"]])
+        self.assertTrue(0 < game["profile"]["moves"][0]["referee.moves"] <= game["profile"]["moves"][0]["player.moves"])
+        self.assertEqual(game["profile"]["game"]["player.moves"], sum(m.get("player.moves", 0) for m in game["profile"]["moves"]))
+        for key in ["player_ns", "validate_ns", "player.nodes", "player.search_ns", "referee.cross_checks_ns"]:
+            self.assertTrue(key in game["profile"]["game"])
+
+    def test_budget(self):
+        # With a generous budget, players find moves as usual
+        p1 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'), budget=60)
+        p2 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'), budget=60)
+        ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False)
+
+        game = ref.run()
+        self.assertTrue(all("exception" not in player for player in game["players"]))
+        self.assertEqual(game["moves"][0]["move"], 'cAcA 8H')
+
+        # With no time at all, players still return legal moves
+        p1 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'), budget=0)
+        p2 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'), budget=0)
+        ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False)
+
+        game = ref.run()
+        self.assertTrue(all("exception" not in player for player in game["players"]))
+        self.assertTrue(all(m["move"].endswith("--") for m in game["moves"]))
+
+    def test_ponder(self):
+        # Pondering whenever the next rack is known gives the same game
+        games = []
+        for player in TestPlayer, PonderingPlayer:
+            p1 = player(self.t, board=scrabbler.board.Board(variant='test'))
+            p2 = player(self.t, board=scrabbler.board.Board(variant='test'))
+            ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False)
+
+            game = ref.run()
+            for move in game["moves"]:
+                del move["time"]
+            games.append(game)
+
+        self.assertEqual(games[0], games[1])
+        self.assertTrue(p1.pondered_moves > 0 and p2.pondered_moves > 0)
+
+        # Pondering that is told to stop leaves nothing half done behind
+        stop = threading.Event()
+        stop.set()
+        p1 = PonderingPlayer(self.t, board=scrabbler.board.Board(variant='test'), stop=stop)
+        p2 = PonderingPlayer(self.t, board=scrabbler.board.Board(variant='test'), stop=stop)
+        ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False)
+
+        game = ref.run()
+        for move in game["moves"]:
+            del move["time"]
+        self.assertEqual(game, games[0])
+        self.assertEqual((p1.pondered_moves, p2.pondered_moves), (0, 0))
+
+    def test_share_board(self):
+        # Players searching the referee's board play the same game
+        games = []
+        for share_board in False, True:
+            p1 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'))
+            p2 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'))
+            ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False, share_board=share_board)
+
+            game = ref.run()
+            for move in game["moves"]:
+                del move["time"]
+            games.append(game)
+
+        self.assertEqual(games[0], games[1])
+        self.assertTrue(p1.board.readonly and p2.board.readonly)
+        self.assertRaises(TypeError, p1.board.play, scrabbler.move.Move.from_str("ABBA A1"))
+
+        # Nor can they change the referee's board, or its scoring, any other way
+        view = p1.board
+        self.assertRaises(TypeError, setattr, view.squares[0][0], "letter", "A")
+        self.assertRaises(TypeError, setattr, view, "bingo_bonus", 100)
+        self.assertRaises(TypeError, view.letter_values.__setitem__, "A", 99)
+        self.assertRaises(TypeError, view.letter_values.update, {"A": 99})
+        self.assertRaises(TypeError, view.letter_distribution.__setitem__, "A", 99)
+        self.assertRaises(TypeError, operator.setitem, view.variant.alphabet.values, 1, 99)
+        self.assertEqual(view.letter_value("A"), 1)
+        self.assertEqual(scrabbler.board.Board(variant='test').letter_value("A"), 1)
+
+        # Players that ponder don't, since their own move isn't on the
+        # board yet when they would
+        p1 = PonderingPlayer(self.t, board=scrabbler.board.Board(variant='test'))
+        p2 = PonderingPlayer(self.t, board=scrabbler.board.Board(variant='test'))
+        ref = scrabbler.referee.Referee(p1, p2, self.t, board=scrabbler.board.Board(variant='test'), random_draw=False, share_board=True)
+
+        game = ref.run()
+        for move in game["moves"]:
+            del move["time"]
+        self.assertEqual(game, games[0])
+        self.assertEqual((p1.pondered_moves, p2.pondered_moves), (0, 0))
+
+    def test_collapse_blanks(self):
+        # Collapsing blanks finds the best score for every word in every
+        # position. Here ALA needs a blank for one of its A's, and the best
+        # place for it changes once ALAE reaches the double word square.
+        t = scrabbler.lexicon.Lexicon.from_iterable(['AA', 'AAL', 'AE', 'AEAE', 'AL', 'ALA', 'ALAE', 'ALE', 'ALEE', 'ALL', 'EA', 'EALE', 'EE', 'EEL', 'ELL', 'ELLA', 'LA', 'LAE', 'LALL', 'LEA', 'LEE'])
+        b = scrabbler.board.Board()
+        b.play(scrabbler.move.Move.from_str("LEE E3"))
+        for rack in ['LA??', 'ALE??', 'AE?', 'A??']:
+            self.assertEqual(best_scores(b.valid_moves(rack, t, collapse_blanks=True)), best_scores(b.valid_moves(rack, t)))
+
+        # And on random positions
+        r = random.Random(1)
+        for game in range(3):
+            b = scrabbler.board.Board()
+            for turn in range(8):
+                rack = [r.choice('ALE') for i in range(r.randint(1, 4))] + ['?'] * r.randint(1, 2)
+                self.assertEqual(best_scores(b.valid_moves(rack, t, collapse_blanks=True)), best_scores(b.valid_moves(rack, t)))
+                moves = b.valid_moves([r.choice('ALE') for i in range(7)], t)
+                if moves:
+                    b.play(r.choice(moves))
+
     def test_exception_badmove(self):
         p1 = TestPlayer(self.t, board=scrabbler.board.Board(variant='test'))
         p2 = BadMovePlayer(self.t, board=scrabbler.board.Board(variant='test'))
@@ -44,6 +170,14 @@ class TestGame(unittest.TestCase):
             del move["time"]
         self.assertEqual(game, {'moves': [{'move': 'cAcA 8H', 'player': 'p1', 'rack': '??AAAAA', 'score': 4}, {'move': 'ZZZZZZZ --', 'player': 'p2', 'rack': 'AAAAAAA', 'score': 0}], 'players': [{'id': 'p1', 'rack': 'AAAAAAA', 'score': 4}, {'exception': 'letter Z not in rack', 'id': 'p2', 'rack': 'AAAAAAA', 'score': 0}]})
 
+# Best score of each word in each position, however blanks are used
+def best_scores(moves):
+    best = {}
+    for move in moves:
+        key = (move.row, move.col, move.kind, move.word.upper())
+        best[key] = max(best.get(key, 0), move.score)
+    return best
+
 class TestPlayer(scrabbler.player.Player):
     def best_move(self, moves):
         if moves:
@@ -58,6 +192,22 @@ class TestPlayer(scrabbler.player.Player):
                 # pass
                 return scrabbler.move.Move(row=None, col=None, kind=scrabbler.move.Move.MOVE_TRADE, word='')
 
+# Ponders after each move, as bin/scrabbler-player --ponder does
+class PonderingPlayer(TestPlayer):
+    pondered_moves = 0
+
+    def __init__(self, lexicon, stop=None, **kwargs):
+        TestPlayer.__init__(self, lexicon, **kwargs)
+        self.stop = stop
+
+    def move(self, tiles, opponent_move):
+        if self.pondered is not None:
+            self.pondered_moves += 1
+        move = TestPlayer.move(self, tiles, opponent_move)
+        if self.can_ponder():
+            self.ponder(self.stop)
+        return move
+
 # Always trades 7 Z's
 class BadTradePlayer(scrabbler.player.Player):
     def move(self, tiles, opponent_move):